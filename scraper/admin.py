@@ -1,21 +1,19 @@
 from django.contrib import admin
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
-from .models import (Article, Keyword, Tag, Category)
-from .tasks import scrape_techcrunch_task
+from .models import (Article, Keyword, CategoryFeed, ExportJob, FailedURL, ScrapeRun)
+from . import fulltext
+from .exporting import check_export_format, create_export_jobs
+from .tasks import export_articles_task, retry_failed_urls_task, scrape_techcrunch_task
 from django.contrib.admin.views.decorators import staff_member_required
-from .forms import ScrapeTechCrunchForm
+from .forms import ExportActionForm, ScrapeTechCrunchForm
 from django.shortcuts import render, redirect
-import json
-import csv
-import os
 from django.http import HttpResponseRedirect
 from django.urls import reverse, path
 from django.utils.decorators import method_decorator
 from django.contrib import messages
-from django.conf import settings
-from datetime import datetime
-import zipfile
+from django.db.models import Max
+from django.core.exceptions import ImproperlyConfigured
 import logging
 
 
@@ -24,9 +22,31 @@ logger = logging.getLogger(__name__)
 # Register your models here
 
 
+class ScrapeRunInline(admin.TabularInline):
+    model = ScrapeRun
+    fields = ('started_at', 'duration', 'articles_saved', 'articles_failed', 'stage_summary', 'errors')
+    readonly_fields = fields
+    ordering = ('-started_at',)
+    extra = 0
+    can_delete = False
+    show_change_link = True
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Keyword)
 class KeywordAdmin(admin.ModelAdmin):
     change_list_template = "admin/scrape_keywords_change_list.html"
+    list_display = ('keyword', 'created_at', 'last_run')
+    inlines = [ScrapeRunInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(last_run_at=Max('scrape_runs__started_at'))
+
+    @admin.display(description='Last scrape', ordering='last_run_at')
+    def last_run(self, obj):
+        return obj.last_run_at
 
     def get_urls(self):
         urls = super().get_urls()
@@ -64,164 +84,74 @@ class KeywordAdmin(admin.ModelAdmin):
         return False  # This will disable the 'Add keyword' button
 
 
+@admin.register(CategoryFeed)
+class CategoryFeedAdmin(admin.ModelAdmin):
+    list_display = ('name', 'wp_category_id', 'enabled', 'last_post_date', 'last_run_at')
+    list_editable = ('enabled',)
+    readonly_fields = ('last_post_id', 'last_post_date', 'etag', 'last_run_at')
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'group_by', 'export_format', 'status', 'rows_done', 'total_rows', 'bytes_written', 'created_at')
+    list_filter = ('status', 'group_by')
+    readonly_fields = [field.name for field in ExportJob._meta.fields]
+
+
+def retry_failed_urls(modeladmin, request, queryset):
+    retry_failed_urls_task.delay(list(queryset.values_list('pk', flat=True)))
+    messages.success(request, f"Retrying {queryset.count()} failed articles in the background.")
+
+
+retry_failed_urls.short_description = "Retry selected articles"
+
+
+@admin.register(FailedURL)
+class FailedURLAdmin(admin.ModelAdmin):
+    list_display = ('url', 'keyword', 'failures', 'error', 'last_failed_at')
+    list_select_related = ('keyword',)
+    search_fields = ('url', 'error')
+    ordering = ('-last_failed_at',)
+    actions = [retry_failed_urls]
+
+
+@admin.register(ScrapeRun)
+class ScrapeRunAdmin(admin.ModelAdmin):
+    list_display = ('started_at', 'source', 'keyword', 'duration', 'articles_saved', 'articles_failed',
+                    'browser_fallbacks', 'stage_summary')
+    list_filter = ('source',)
+    list_select_related = ('keyword',)
+    ordering = ('-started_at',)
+    readonly_fields = [field.name for field in ScrapeRun._meta.fields]
+
+
 class ArticleResource(resources.ModelResource):
     class Meta:
         model = Article
 
 
-def export_articles_by_category(modeladmin, request, queryset):
+def start_exports(request, queryset, group_by):
+    # Each category or keyword becomes its own job so the worker can build the files in parallel
+    export_format = request.POST.get('export_format') or 'zip'
+    try:
+        check_export_format(export_format)
+    except ImproperlyConfigured as e:
+        messages.error(request, str(e))
+        return None
+    batch, jobs = create_export_jobs(queryset, group_by, export_format)
+    for job in jobs:
+        export_articles_task.delay(job.pk)
+    messages.success(request, f"Started {len(jobs)} export jobs by {group_by}. "
+                              f"The next page shows their progress and download links.")
+    return HttpResponseRedirect(f"{reverse('your_download_page')}?batch={batch}")
 
-    download_urls = []  # Initialize an empty list to store download URLs
-    base_dir = settings.MEDIA_ROOT  # Use the media root from settings
-    os.makedirs(base_dir, exist_ok=True)  # Ensure the base directory exists
-
-    for category in Category.objects.all():
-        category_articles = queryset.filter(category=category)
-        if not category_articles:
-            continue
-
-        category_name = category.name
-        date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-        base_filename = f"{category_name}_{date_str}"
-        zip_filename = f"{base_filename}.zip"
-        zip_file_path = os.path.join(base_dir, zip_filename)
-
-        csv_file_path = os.path.join(base_dir, f"{base_filename}.csv")
-        json_file_path = os.path.join(base_dir, f"{base_filename}.json")
-
-        # Export to CSV
-        with open(csv_file_path, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(
-                ['Title', 'Publication Date', 'Content', 'Image URL', 'Created At', 'Author', 'Category', 'Tags'])
-            for article in category_articles:
-                tags = Tag.objects.filter(articletag__article=article).values_list('name', flat=True)
-                tags_string = "; ".join(tags)
-                writer.writerow([
-                    article.title,
-                    article.publication_date,
-                    article.content,
-                    article.image_url,
-                    article.created_at,
-                    article.author.name,
-                    article.category.name,
-                    tags_string
-                ])
-
-        # Export to JSON
-        with open(json_file_path, 'w', encoding='utf-8') as jsonfile:
-            data = [
-                {
-                    'title': article.title,
-                    'publication_date': article.publication_date,
-                    'content': article.content,
-                    'image_url': article.image_url,
-                    'created_at': article.created_at,
-                    'author_name': article.author.name,
-                    'category_name': article.category.name,
-                    'tags': list(Tag.objects.filter(articletag__article=article).values_list('name', flat=True))
-                }
-                for article in category_articles
-            ]
-            json.dump(data, jsonfile, default=str, indent=4)
-
-        # Zip CSV and JSON files
-        with zipfile.ZipFile(zip_file_path, 'w') as zipf:
-            zipf.write(csv_file_path, arcname=os.path.basename(csv_file_path))
-            zipf.write(json_file_path, arcname=os.path.basename(json_file_path))
-
-        # Remove the CSV and JSON files after adding them to the ZIP
-        os.remove(csv_file_path)
-        os.remove(json_file_path)
-
-        download_url = request.build_absolute_uri(f'/media/{zip_filename}')
-        download_urls.append((zip_filename, download_url))
-
-    # Save to session or pass directly to the template
-    request.session['download_urls_by_category'] = download_urls
-    messages.success(request, "Articles exported by category successfully. Check the next page for download links.")
-    return HttpResponseRedirect(reverse('your_download_page'))
+
+def export_articles_by_category(modeladmin, request, queryset):
+    return start_exports(request, queryset, 'category')
 
 
 def export_articles_by_keyword(modeladmin, request, queryset):
-    download_urls = []  # Initialize an empty list to store download URLs
-
-    # Create a base directory if it doesn't exist
-    base_dir = settings.MEDIA_ROOT
-    os.makedirs(base_dir, exist_ok=True)
-
-    for keyword in Keyword.objects.all():
-        keyword_articles = queryset.filter(keyword=keyword)
-        print(f"Keyword: {keyword.keyword}, Article Count: {keyword_articles.count()}")
-        if not keyword_articles:
-            continue
-
-        search_term = keyword.keyword
-        date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-        base_filename = f"{search_term}_{date_str}"
-        zip_filename = f"{base_filename}.zip"
-        zip_file_path = os.path.join(base_dir, zip_filename)
-
-        csv_file_path = os.path.join(base_dir, f"{base_filename}.csv")
-        json_file_path = os.path.join(base_dir, f"{base_filename}.json")
-
-        # Export to CSV
-        with open(csv_file_path, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(
-                ['Title', 'Publication Date', 'Content', 'Image URL', 'Created At', 'Author', 'Category', 'Tags'])
-            for article in keyword_articles:
-                if article.keyword:
-                    print(f"Exporting Article: {article.title}, Keyword: {article.keyword.keyword},"
-                          f" Category: {article.category.name}")
-
-                    # Fetch tags for the article
-                    tags = Tag.objects.filter(articletag__article=article).values_list('name', flat=True)
-                    tags_string = "; ".join(tags)  # Convert to string separated by semicolons
-                    writer.writerow([
-                        article.title,
-                        article.publication_date,
-                        article.content,
-                        article.image_url,
-                        article.created_at,
-                        article.author.name,
-                        article.category.name,
-                        tags_string  # Add tags string here
-                    ])
-                else:
-                    print(f"Article: {article.title} does not have an associated keyword.")
-        # Export to JSON
-        with open(json_file_path, 'w', encoding='utf-8') as jsonfile:
-            data = [
-                {
-                    'title': article.title,
-                    'publication_date': article.publication_date,
-                    'content': article.content,
-                    'image_url': article.image_url,
-                    'created_at': article.created_at,
-                    'author_name': article.author.name,
-                    'category_name': article.category.name,
-                    'tags': list(Tag.objects.filter(articletag__article=article).values_list('name', flat=True))
-                } for article in keyword_articles if article.keyword
-            ]
-            json.dump(data, jsonfile, default=str, indent=4)
-
-        # Zip CSV and JSON files
-        with zipfile.ZipFile(zip_file_path, 'w') as zipf:
-            zipf.write(csv_file_path, arcname=os.path.basename(csv_file_path))
-            zipf.write(json_file_path, arcname=os.path.basename(json_file_path))
-
-        # Remove the CSV and JSON files after adding them to the ZIP
-        os.remove(csv_file_path)
-        os.remove(json_file_path)
-
-        download_url = request.build_absolute_uri(f'/media/{zip_filename}')
-        download_urls.append((zip_filename, download_url))
-
-    # Add the download URLs to the session or pass to template context
-    request.session['download_urls_by_keyword'] = download_urls
-    messages.success(request, "Articles exported by keyword successfully. Check the next page for download links.")
-    return HttpResponseRedirect(reverse('your_download_page'))
+    return start_exports(request, queryset, 'keyword')
 
 
 export_articles_by_category.short_description = "Export articles by category"
@@ -233,6 +163,18 @@ export_articles_by_keyword.short_description = "Export articles by keyword"
 class ArticleAdmin(ImportExportModelAdmin):
     resource_class = ArticleResource
     actions = [export_articles_by_category, export_articles_by_keyword]
+    action_form = ExportActionForm
+    search_fields = ('title', 'content')  # Only used where there is no full-text index
+    list_display = ('title', 'author', 'category', 'publication_date')
+    list_filter = ('category',)
+    list_select_related = ('author', 'category')
+    date_hierarchy = 'publication_date'
+    ordering = ('-publication_date',)
+
+    def get_search_results(self, request, queryset, search_term):
+        if search_term and fulltext.is_supported():
+            return queryset.filter(fulltext.matching(search_term)), False
+        return super().get_search_results(request, queryset, search_term)
 
     def changelist_view(self, request, extra_context=None):
         # Call the superclass method to get the TemplateResponse
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ScraperConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'scraper'
+
+    def ready(self):
+        # Keeps the full-text index in step with edits made outside ArticleWriter
+        from . import fulltext
+        fulltext.connect_signals()
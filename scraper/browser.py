@@ -0,0 +1,210 @@
+from django.conf import settings
+from .metadata import extract_metadata
+from .metrics import PAGE_LOAD_SECONDS
+from .parsing import make_document
+from .retry import backoff
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from webdriver_manager.chrome import ChromeDriverManager
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from contextlib import contextmanager
+import atexit
+import socket
+import threading
+import time
+import psutil
+
+_driver_path = None
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PoolExhaustedError(TimeoutException):
+    """Raised when no WebDriver session is free within the lease timeout."""
+
+
+def resolve_driver_path():
+    # Resolved once per worker (see scraper.tasks) so tasks don't repeat webdriver_manager's version check
+    global _driver_path
+    if _driver_path is None:
+        _driver_path = settings.SCRAPER_CHROMEDRIVER_PATH or ChromeDriverManager().install()
+    return _driver_path
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def build_driver(debugging_port=None):
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")  # Run Chrome in headless mode.
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--disable-extensions")  # Disable extensions
+    chrome_options.add_argument("--disable-popup-blocking")  # Disable pop-ups
+    chrome_options.add_argument("--profile-directory=Default")
+    chrome_options.add_argument("--ignore-certificate-errors")
+    chrome_options.add_argument("--disable-plugins-discovery")
+    chrome_options.add_argument("--incognito")  # Use Chrome in Incognito mode
+    chrome_options.add_argument("--disable-dev-shm-usage")  # Disable /dev/shm usage
+    # Every browser gets its own debugging port so concurrent tasks don't clash
+    chrome_options.add_argument(f"--remote-debugging-port={debugging_port or free_port()}")
+    chrome_options.add_argument("--log-level=3")  # Minimize logging
+    # chrome_options.add_argument("--disable-software-rasterizer")  # Disable software rasterizer
+    # chrome_options.add_argument("--disable-background-networking")  # Disable background networking
+    chrome_options.add_argument("--disable-features=VizDisplayCompositor")  # Disable Viz Display Compositor
+    # The capabilities dict was never passed to Chrome, so set the strategy on the options instead
+    chrome_options.page_load_strategy = "eager"
+    return webdriver.Chrome(service=Service(resolve_driver_path()), options=chrome_options)
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+    def is_healthy(self):
+        try:
+            return self.driver.execute_script('return 1') == 1
+        except WebDriverException:
+            return False
+
+    def rss_mb(self):
+        # Chromedriver plus every Chrome process it spawned
+        try:
+            process = psutil.Process(self.driver.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+        except (AttributeError, psutil.Error):
+            return 0
+        total = 0
+        for child in processes:
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / (1024 * 1024)
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except WebDriverException:
+            pass
+
+
+class WebDriverPool:
+    """
+    Warm Chrome sessions shared by everything running in one worker process.
+
+    Sessions are health checked when leased and recycled after `max_pages` page loads or once
+    the browser grows past `max_rss_mb`.
+    """
+
+    def __init__(self, size=None, max_pages=None, max_rss_mb=None, factory=build_driver):
+        self.size = size or settings.SCRAPER_WEBDRIVER_POOL_SIZE
+        self.max_pages = max_pages or settings.SCRAPER_WEBDRIVER_MAX_PAGES
+        self.max_rss_mb = max_rss_mb or settings.SCRAPER_WEBDRIVER_MAX_RSS_MB
+        self.factory = factory
+        self._idle = []
+        self._created = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        pooled = self._acquire(timeout or settings.SCRAPER_WEBDRIVER_LEASE_TIMEOUT)
+        succeeded = False
+        try:
+            yield pooled.driver
+            succeeded = True
+        finally:
+            pooled.pages += 1
+            # A session that raised may be wedged on a half-loaded page, so it is not handed out again
+            if succeeded:
+                self._release(pooled)
+            else:
+                self._discard(pooled)
+
+    def warm(self):
+        with self._condition:
+            while self._created < self.size:
+                self._idle.append(PooledDriver(self.factory()))
+                self._created += 1
+
+    def close(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for pooled in idle:
+            pooled.quit()
+
+    def _acquire(self, timeout):
+        with self._condition:
+            while True:
+                while self._idle:
+                    pooled = self._idle.pop()
+                    if pooled.is_healthy():
+                        return pooled
+                    pooled.quit()
+                    self._created -= 1
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                if not self._condition.wait(timeout):
+                    raise PoolExhaustedError("No WebDriver became available in the pool")
+        try:
+            return PooledDriver(self.factory())
+        except Exception:
+            self._discard(None)
+            raise
+
+    def _release(self, pooled):
+        if pooled.pages >= self.max_pages or pooled.rss_mb() >= self.max_rss_mb:
+            self._discard(pooled)
+            return
+        with self._condition:
+            self._idle.append(pooled)
+            self._condition.notify()
+
+    def _discard(self, pooled):
+        if pooled is not None:
+            pooled.quit()
+        with self._condition:
+            self._created -= 1
+            self._condition.notify()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WebDriverPool()
+            atexit.register(_pool.close)
+        return _pool
+
+
+def scrape_metadata(driver, url, attempts=None):
+    # Renders the article in Chrome and reads author, category and tags from the live DOM
+    attempts = attempts or settings.SCRAPER_WEBDRIVER_PAGE_ATTEMPTS
+    for attempt in range(attempts):
+        started = time.perf_counter()
+        try:
+            driver.get(url)
+            WebDriverWait(driver, 15).until(EC.presence_of_element_located(
+                (By.CSS_SELECTOR, 'header.article__header > div.article__title-wrapper')))
+            PAGE_LOAD_SECONDS.labels('ok').observe(time.perf_counter() - started)
+            break
+        except TimeoutException:
+            PAGE_LOAD_SECONDS.labels('timeout').observe(time.perf_counter() - started)
+            print(f"The element did not load within 15 seconds (attempt {attempt + 1} of {attempts}).")
+            # Reading page_source of a page that never loaded would store an article without metadata
+            if attempt + 1 == attempts:
+                raise
+            time.sleep(backoff(settings.SCRAPER_RETRY_POLICIES['timeout'], attempt))
+
+    # Parse the rendered DOM once, with the same extractors used for the static HTML
+    return extract_metadata(make_document(driver.page_source))
@@ -0,0 +1,249 @@
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import pickle
+import time
+import zipfile
+from datetime import datetime
+from functools import partial
+from itertools import count
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, QuerySet
+from django.utils import timezone
+
+from .metrics import EXPORT_BYTES, EXPORT_ROWS, EXPORT_SECONDS
+from .models import Article, ExportJob
+
+CSV_HEADER = ['Title', 'Publication Date', 'Content', 'Image URL', 'Created At', 'Author', 'Category', 'Tags']
+
+# How an export selection is split into files: the field holding each article's group name
+EXPORT_GROUPS = {
+    'category': 'category__name',
+    'keyword': 'keyword__keyword',
+}
+
+
+def export_queryset(queryset):
+    # Author, category and keyword come back in the article query, tags in one prefetch per chunk
+    return queryset.select_related('author', 'category', 'keyword').prefetch_related('tags')
+
+
+def article_row(article):
+    return {
+        'title': article.title,
+        'publication_date': article.publication_date,
+        'content': article.content,
+        'image_url': article.image_url,
+        'created_at': article.created_at,
+        'author_name': article.author.name,
+        'category_name': article.category.name,
+        'tags': [tag.name for tag in article.tags.all()],
+    }
+
+
+def csv_row(row):
+    return [row['title'], row['publication_date'], row['content'], row['image_url'], row['created_at'],
+            row['author_name'], row['category_name'], "; ".join(row['tags'])]
+
+
+def export_filename(name):
+    date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"{name.replace(os.sep, '_')}_{date_str}"
+
+
+# Writers take `rows`, a callable returning a fresh iterator of article rows, so a format can read
+# the selection more than once instead of staging it
+
+def write_zip(rows, file_path, base_filename):
+    # A CSV and an NDJSON entry, both deflated. Only one entry can be open for writing at a time, so
+    # each is streamed from its own pass over the rows and nothing is staged in memory or on disk.
+    with zipfile.ZipFile(file_path, 'w', compression=zipfile.ZIP_DEFLATED) as zipf:
+        with zipf.open(f"{base_filename}.csv", 'w', force_zip64=True) as entry:
+            with io.TextIOWrapper(entry, encoding='utf-8', newline='') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(CSV_HEADER)
+                for row in rows():
+                    writer.writerow(csv_row(row))
+        write_ndjson(rows(), zipf.open(f"{base_filename}.ndjson", 'w', force_zip64=True))
+
+
+def write_ndjson(rows, stream):
+    with io.TextIOWrapper(stream, encoding='utf-8', newline='\n') as jsonfile:
+        for row in rows:
+            jsonfile.write(json.dumps(row, default=str) + '\n')
+
+
+def write_ndjson_gzip(rows, file_path, base_filename):
+    write_ndjson(rows(), gzip.open(file_path, 'wb', compresslevel=6))
+
+
+def write_ndjson_zstd(rows, file_path, base_filename):
+    import zstandard
+    with open(file_path, 'wb') as f:
+        write_ndjson(rows(), zstandard.ZstdCompressor(level=3).stream_writer(f))
+
+
+def parquet_schema():
+    import pyarrow as pa
+    timestamp = pa.timestamp('us', tz='UTC')
+    return pa.schema([
+        ('title', pa.string()),
+        ('publication_date', timestamp),
+        ('content', pa.string()),
+        ('image_url', pa.string()),
+        ('created_at', timestamp),
+        ('author_name', pa.string()),
+        ('category_name', pa.string()),
+        ('tags', pa.list_(pa.string())),
+    ])
+
+
+def write_parquet(rows, file_path, base_filename):
+    # One row group per SCRAPER_EXPORT_CHUNK_SIZE rows, so only a chunk is held in memory
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = parquet_schema()
+    with pq.ParquetWriter(file_path, schema, compression='zstd') as writer:
+        chunk = []
+        for row in rows():
+            chunk.append(row)
+            if len(chunk) >= settings.SCRAPER_EXPORT_CHUNK_SIZE:
+                writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+                chunk = []
+        if chunk:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+
+
+# Export format: (file extension, writer, optional module it needs)
+EXPORT_FORMATS = {
+    'zip': ('.zip', write_zip, None),
+    'ndjson.gz': ('.ndjson.gz', write_ndjson_gzip, None),
+    'ndjson.zst': ('.ndjson.zst', write_ndjson_zstd, 'zstandard'),
+    'parquet': ('.parquet', write_parquet, 'pyarrow'),
+}
+
+
+def check_export_format(export_format):
+    if export_format not in EXPORT_FORMATS:
+        raise ImproperlyConfigured(f"Unknown export format '{export_format}'. Choose from: {', '.join(EXPORT_FORMATS)}")
+    requirement = EXPORT_FORMATS[export_format][2]
+    if requirement:
+        try:
+            importlib.import_module(requirement)
+        except ImportError as e:
+            raise ImproperlyConfigured(f"Export format '{export_format}' is not installed: {e}")
+
+
+def write_export(articles, name, export_format='zip', chunk_size=None):
+    """
+    Writes `articles` into MEDIA_ROOT/<name>_<date><extension> and returns the filename.
+
+    `articles` is a QuerySet, read with `.iterator()` on every pass, or a callable returning a fresh
+    iterable of articles. The format's writer streams the rows to disk; the zip makes two passes.
+    """
+    check_export_format(export_format)
+    chunk_size = chunk_size or settings.SCRAPER_EXPORT_CHUNK_SIZE
+    if isinstance(articles, QuerySet):
+        articles = partial(articles.iterator, chunk_size=chunk_size)
+    extension, writer, _ = EXPORT_FORMATS[export_format]
+    base_dir = settings.MEDIA_ROOT
+    os.makedirs(base_dir, exist_ok=True)
+    base_filename = export_filename(name)
+    filename = f"{base_filename}{extension}"
+    file_path = os.path.join(base_dir, filename)
+    # Build under a temporary name so a half-written file is never served
+    partial_path = f"{file_path}.part"
+    try:
+        writer(lambda: (article_row(article) for article in articles()), partial_path, base_filename)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    os.replace(partial_path, file_path)
+    return filename
+
+
+def write_grouped_exports(queryset, group_by, export_format='zip', chunk_size=None):
+    """
+    Exports `queryset` as one file per category or keyword and returns the filenames.
+
+    Each group is read in chunks of `chunk_size`, two queries (articles and their tags) per chunk
+    and pass, so memory stays flat however many articles a group has.
+    """
+    group_field = EXPORT_GROUPS[group_by]
+    queryset = export_queryset(queryset).filter(**{f"{group_by}__isnull": False})
+    names = queryset.order_by(group_field).values_list(group_field, flat=True).distinct()
+    return [write_export(queryset.filter(**{group_field: name}).order_by('id'), name, export_format, chunk_size)
+            for name in names]
+
+
+def create_export_jobs(queryset, group_by, export_format='zip'):
+    """
+    Splits the admin selection into one pending ExportJob per category or keyword.
+
+    Only the group sizes are read here, in one query. Each job stores the selection itself, so the
+    worker runs the query rather than the web request loading every article id. Returns the batch
+    id and the jobs for dispatching to export_articles_task.
+    """
+    group_field = EXPORT_GROUPS[group_by]
+    groups = (queryset.filter(**{f"{group_by}__isnull": False}).order_by(group_field).values_list(group_field)
+              .annotate(rows=Count('id')))
+    selection = pickle.dumps(queryset.query)
+    batch = uuid.uuid4()
+    jobs = [ExportJob.objects.create(batch=batch, group_by=group_by, export_format=export_format, name=name,
+                                     selection=selection, total_rows=rows)
+            for name, rows in groups]
+    return batch, jobs
+
+
+def job_articles(job):
+    # The job's group of the stored admin selection
+    queryset = Article.objects.all()
+    queryset.query = pickle.loads(job.selection)
+    return export_queryset(queryset.filter(**{EXPORT_GROUPS[job.group_by]: job.name})).order_by('id')
+
+
+def run_export_job(job, chunk_size=None):
+    chunk_size = chunk_size or settings.SCRAPER_EXPORT_CHUNK_SIZE
+    job.status = 'running'
+    job.started_at = timezone.now()
+    started = time.perf_counter()
+    job.save(update_fields=['status', 'started_at'])
+
+    def tracked(articles):
+        rows_done = 0
+        for article in articles:
+            yield article
+            rows_done += 1
+            if rows_done % chunk_size == 0:
+                ExportJob.objects.filter(pk=job.pk).update(rows_done=rows_done)
+        job.rows_done = rows_done
+
+    reads = count()
+
+    def articles():
+        # Progress follows the first pass; the zip reads the articles again for its NDJSON entry
+        articles = job_articles(job).iterator(chunk_size=chunk_size)
+        return tracked(articles) if next(reads) == 0 else articles
+
+    try:
+        job.filename = write_export(articles, job.name, job.export_format)
+        job.bytes_written = os.path.getsize(os.path.join(settings.MEDIA_ROOT, job.filename))
+        job.status = 'done'
+        EXPORT_ROWS.labels(job.export_format).inc(job.rows_done)
+        EXPORT_BYTES.labels(job.export_format).inc(job.bytes_written)
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        raise
+    finally:
+        job.finished_at = timezone.now()
+        job.save()
+        EXPORT_SECONDS.labels(job.export_format, job.status).observe(time.perf_counter() - started)
+    return job
@@ -0,0 +1,194 @@
+import asyncio
+import time
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from django.conf import settings
+from requests.structures import CaseInsensitiveDict
+
+from .http_cache import HttpCache
+from .metrics import FETCH_RETRIES, FETCH_SECONDS, FETCH_SHED
+from .ratelimit import get_rate_limiter, retry_after
+from .retry import CircuitOpenError, backoff, error_class, get_circuit_breakers
+
+
+class FetchResult(NamedTuple):
+    url: str
+    status: Optional[int]
+    content: bytes
+    headers: CaseInsensitiveDict
+    elapsed: float
+    error: Optional[Exception] = None
+    from_cache: bool = False
+
+    @property
+    def ok(self):
+        return self.error is None and self.status is not None and self.status < 400
+
+
+class Fetcher:
+    """
+    Concurrent HTTP fetch engine.
+
+    Requests run on a private asyncio loop over a pooled aiohttp session, while the public
+    methods stay synchronous so management commands and Celery tasks can keep using the ORM
+    between batches.
+    """
+
+    def __init__(self, concurrency=None, per_host=None, timeout=None, cache=None, limiter=None, breakers=None):
+        self.concurrency = concurrency or settings.SCRAPER_FETCH_CONCURRENCY
+        self.per_host = per_host or settings.SCRAPER_FETCH_PER_HOST
+        self.timeout = timeout or settings.SCRAPER_FETCH_TIMEOUT
+        self.limiter = limiter or get_rate_limiter()
+        self.breakers = breakers or get_circuit_breakers()
+        # Requests retried after a 429, retried after a timeout, reset or 5xx, and refused by an open circuit
+        self.throttled_count = 0
+        self.retry_count = 0
+        self.shed_count = 0
+        # Pass cache=False to bypass the on-disk HTTP cache even when it is enabled in settings
+        if cache is None and settings.SCRAPER_HTTP_CACHE_ENABLED:
+            cache = HttpCache()
+        self.cache = cache or None
+        self._loop = asyncio.new_event_loop()
+        self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def fetch(self, url, headers=None):
+        return self.fetch_many([url], headers=headers)[0]
+
+    def fetch_many(self, urls, headers=None):
+        # Results come back in the same order as the input URLs
+        return self._loop.run_until_complete(self._fetch_all(list(urls), headers))
+
+    def iter_fetch(self, urls, chunk_size=None):
+        # Fetch in chunks so callers can persist one batch while memory stays bounded
+        urls = list(urls)
+        chunk_size = chunk_size or self.concurrency * 4
+        for start in range(0, len(urls), chunk_size):
+            yield from self.fetch_many(urls[start:start + chunk_size])
+
+    def summary(self):
+        summary = (f"Retried {self.retry_count} requests after errors and {self.throttled_count} after being "
+                   f"throttled, shed {self.shed_count}")
+        open_hosts = self.breakers.open_hosts()
+        if open_hosts:
+            summary += f" (circuit open for {', '.join(open_hosts)})"
+        return summary
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        if self.cache is not None:
+            self.cache.close()
+        if self._session is not None:
+            self._loop.run_until_complete(self._session.close())
+            self._session = None
+        self._loop.close()
+
+    async def _get_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'User-Agent': settings.SCRAPER_USER_AGENT},
+            )
+        return self._session
+
+    async def _fetch_all(self, urls, headers=None):
+        session = await self._get_session()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self._fetch(session, semaphore, url, headers) for url in urls))
+
+    async def _call_limiter(self, method, *args):
+        # Redis round trips run on a thread, so a slow or unreachable Redis never stalls the fetches in flight
+        if self.limiter.blocking:
+            return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+        return method(*args)
+
+    async def _wait_for_token(self, host):
+        wait = await self._call_limiter(self.limiter.acquire, host)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = await self._call_limiter(self.limiter.acquire, host)
+
+    async def _send(self, session, semaphore, url, headers):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async with session.get(url, headers=headers) as response:
+                    content = await response.read()
+                    result = FetchResult(url, response.status, content, CaseInsensitiveDict(response.headers),
+                                         time.perf_counter() - started)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                result = FetchResult(url, None, b'', CaseInsensitiveDict(), time.perf_counter() - started, e)
+        FETCH_SECONDS.labels(urlsplit(url).hostname, result.status or 'error').observe(result.elapsed)
+        return result
+
+    def _is_throttled(self, result):
+        return result.status == 429 or (result.status == 503 and 'Retry-After' in result.headers)
+
+    async def _fetch(self, session, semaphore, url, headers=None):
+        # Requests that carry their own validators (e.g. a stored feed ETag) bypass the cache
+        cacheable = self.cache is not None and not headers
+        entry = self.cache.lookup(url) if cacheable else None
+        if entry is not None and entry.is_fresh(self.cache.ttl):
+            self.cache.stats['hits'] += 1
+            return FetchResult(url, entry.status, entry.read(), CaseInsensitiveDict(entry.headers), 0.0,
+                               from_cache=True)
+        if entry is not None:
+            headers = entry.validators()
+
+        parts = urlsplit(url)
+        breaker = self.breakers[parts.netloc]
+        throttled = retries = 0
+        permitted = False  # Kept across throttle retries, so a half-open probe doesn't shed itself
+        while True:
+            if not permitted and not breaker.allow():
+                self.shed_count += 1
+                FETCH_SHED.labels(parts.hostname).inc()
+                return FetchResult(url, None, b'', CaseInsensitiveDict(), 0.0,
+                                   CircuitOpenError(f"Circuit open for {parts.netloc}"))
+            permitted = True
+            await self._wait_for_token(parts.hostname)
+            result = await self._send(session, semaphore, url, headers)
+            if self._is_throttled(result) and throttled < settings.SCRAPER_RATE_LIMIT_MAX_RETRIES:
+                # Every worker holds off the host for as long as it asked, then this request is tried again
+                delay = retry_after(result.headers.get('Retry-After'),
+                                    settings.SCRAPER_RATE_LIMIT_BACKOFF * 2 ** throttled)
+                await self._call_limiter(self.limiter.pause, parts.hostname, delay)
+                throttled += 1
+                self.throttled_count += 1
+                FETCH_RETRIES.labels(parts.hostname, 'throttled').inc()
+                continue
+            failure = error_class(result)
+            if failure is None:
+                breaker.record_success()
+                break
+            breaker.record_failure()
+            permitted = False
+            policy = settings.SCRAPER_RETRY_POLICIES[failure]
+            if retries >= policy['attempts']:
+                break
+            await asyncio.sleep(backoff(policy, retries))
+            retries += 1
+            self.retry_count += 1
+            FETCH_RETRIES.labels(parts.hostname, failure).inc()
+        if result.error is not None:
+            return result
+
+        if entry is not None and result.status == 304:
+            self.cache.stats['revalidated'] += 1
+            self.cache.touch(url)
+            return result._replace(status=entry.status, content=entry.read(), from_cache=True)
+        if cacheable:
+            self.cache.stats['misses'] += 1
+            if result.status == 200:
+                self.cache.store(url, result.status, result.headers, result.content)
+        return result
@@ -1,5 +1,10 @@
 from django import forms
+from django.contrib.admin.helpers import ActionForm
+from .models import ExportJob
 
 
 class ScrapeTechCrunchForm(forms.Form):
-    search_term = forms.CharField(label='Enter the search term for scraping', max_length=100)
\ No newline at end of file
+    search_term = forms.CharField(label='Enter the search term for scraping', max_length=100)
+
+class ExportActionForm(ActionForm):
+    export_format = forms.ChoiceField(choices=ExportJob.FORMAT_CHOICES, required=False, initial='zip')
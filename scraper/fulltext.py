@@ -0,0 +1,224 @@
+"""
+Full-text index over article title, content, tags and author.
+
+SQLite uses an FTS5 table keyed by article id, Postgres a tsvector table with a GIN index. Both are
+side tables maintained with raw SQL so the Article model stays the same on every backend; other
+databases fall back to the admin's icontains search. ArticleWriter indexes the articles it writes
+in bulk; edits made anywhere else (the admin, imports, the shell) are picked up by the signal
+handlers at the bottom.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.db.models.expressions import RawSQL
+
+from .models import Article, ArticleTag, Author, Tag
+
+SQLITE_TABLE = 'scraper_article_fts'
+POSTGRES_TABLE = 'scraper_article_search'
+# Column weights: title counts the most, then tags and author, then the body
+SQLITE_RANK = f"bm25({SQLITE_TABLE}, 10.0, 1.0, 5.0, 5.0)"
+
+DOCUMENT_JOINS = """
+    FROM scraper_article a
+    JOIN scraper_author au ON au.id = a.author_id
+    LEFT JOIN scraper_articletag at ON at.article_id = a.id
+    LEFT JOIN scraper_tag t ON t.id = at.tag_id
+"""
+
+
+def vendor(using='default'):
+    return connections[using].vendor
+
+
+def is_supported(using='default'):
+    return vendor(using) in ('sqlite', 'postgresql')
+
+
+def create_index(using='default'):
+    with connections[using].cursor() as cursor:
+        if vendor(using) == 'sqlite':
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} "
+                           f"USING fts5(title, content, tags, author, tokenize='porter unicode61')")
+        elif vendor(using) == 'postgresql':
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ("
+                           f"article_id bigint PRIMARY KEY REFERENCES scraper_article(id) ON DELETE CASCADE "
+                           f"DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document ON {POSTGRES_TABLE} "
+                           f"USING gin (document)")
+
+
+def drop_index(using='default'):
+    if not is_supported(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {SQLITE_TABLE if vendor(using) == 'sqlite' else POSTGRES_TABLE}")
+
+
+def index_articles(article_ids, using='default'):
+    # (Re)indexes the given articles from their current rows, tags and author
+    if not is_supported(using):
+        return
+    article_ids = list(article_ids)
+    batch_size = settings.SCRAPER_FULLTEXT_BATCH_SIZE
+    with connections[using].cursor() as cursor:
+        for start in range(0, len(article_ids), batch_size):
+            batch = article_ids[start:start + batch_size]
+            if vendor(using) == 'sqlite':
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f"DELETE FROM {SQLITE_TABLE} WHERE rowid IN ({placeholders})", batch)
+                cursor.execute(
+                    f"INSERT INTO {SQLITE_TABLE} (rowid, title, content, tags, author) "
+                    f"SELECT a.id, a.title, a.content, COALESCE(GROUP_CONCAT(t.name, ' '), ''), au.name "
+                    f"{DOCUMENT_JOINS} WHERE a.id IN ({placeholders}) GROUP BY a.id, a.title, a.content, au.name",
+                    batch)
+            else:
+                config = settings.SCRAPER_FULLTEXT_CONFIG
+                cursor.execute(
+                    f"INSERT INTO {POSTGRES_TABLE} (article_id, document) "
+                    f"SELECT a.id, setweight(to_tsvector(%s::regconfig, a.title), 'A') "
+                    f"|| setweight(to_tsvector(%s::regconfig, COALESCE(string_agg(t.name, ' '), '')), 'B') "
+                    f"|| setweight(to_tsvector(%s::regconfig, au.name), 'B') "
+                    f"|| setweight(to_tsvector(%s::regconfig, a.content), 'D') "
+                    f"{DOCUMENT_JOINS} WHERE a.id = ANY(%s) GROUP BY a.id, au.name "
+                    f"ON CONFLICT (article_id) DO UPDATE SET document = EXCLUDED.document",
+                    [config, config, config, config, batch])
+
+
+def remove_articles(article_ids, using='default'):
+    # Postgres drops the rows itself through the foreign key's ON DELETE CASCADE
+    article_ids = list(article_ids)
+    if vendor(using) != 'sqlite' or not article_ids:
+        return
+    with connections[using].cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(article_ids))
+        cursor.execute(f"DELETE FROM {SQLITE_TABLE} WHERE rowid IN ({placeholders})", article_ids)
+
+
+def rebuild(using='default'):
+    """Clears the index and indexes every article again. Returns the number of articles indexed."""
+    if not is_supported(using):
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SQLITE_TABLE if vendor(using) == 'sqlite' else POSTGRES_TABLE}")
+    article_ids = Article.objects.using(using).order_by('id').values_list('id', flat=True)
+    total = 0
+    batch = []
+    for article_id in article_ids.iterator(chunk_size=settings.SCRAPER_FULLTEXT_BATCH_SIZE):
+        batch.append(article_id)
+        if len(batch) >= settings.SCRAPER_FULLTEXT_BATCH_SIZE:
+            index_articles(batch, using)
+            total += len(batch)
+            batch = []
+    index_articles(batch, using)
+    return total + len(batch)
+
+
+def fts_query(text):
+    # User input as an FTS5 query: every word must match, and FTS5 operators are taken literally
+    return ' '.join(f'"{word}"' for word in re.findall(r'\w+', text))
+
+
+def match_sql(text, using='default'):
+    # The ids of matching articles, as a subquery
+    if vendor(using) == 'sqlite':
+        return f"SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s", [fts_query(text)]
+    return (f"SELECT article_id FROM {POSTGRES_TABLE} WHERE document @@ websearch_to_tsquery(%s::regconfig, %s)",
+            [settings.SCRAPER_FULLTEXT_CONFIG, text])
+
+
+def matching(text, using='default'):
+    """A filter for articles matching `text`, for narrowing querysets such as the admin changelist."""
+    if not fts_query(text):
+        return Q(pk__in=[])
+    sql, params = match_sql(text, using)
+    return Q(pk__in=RawSQL(sql, params))
+
+
+def ranked_ids(text, limit=None, using='default'):
+    limit = limit or settings.SCRAPER_FULLTEXT_LIMIT
+    if not fts_query(text):
+        return []
+    with connections[using].cursor() as cursor:
+        if vendor(using) == 'sqlite':
+            cursor.execute(f"SELECT rowid, -{SQLITE_RANK} AS score FROM {SQLITE_TABLE} "
+                           f"WHERE {SQLITE_TABLE} MATCH %s ORDER BY {SQLITE_RANK} LIMIT %s", [fts_query(text), limit])
+        else:
+            cursor.execute(f"SELECT article_id, ts_rank_cd(document, query) AS score "
+                           f"FROM {POSTGRES_TABLE}, websearch_to_tsquery(%s::regconfig, %s) query "
+                           f"WHERE document @@ query ORDER BY score DESC LIMIT %s",
+                           [settings.SCRAPER_FULLTEXT_CONFIG, text, limit])
+        return cursor.fetchall()
+
+
+def search_articles(text, limit=None, using='default'):
+    """
+    Returns the articles matching `text`, best match first, each with a `search_rank` attribute.
+
+    Falls back to an unranked icontains search on databases without a full-text index.
+    """
+    if not is_supported(using):
+        limit = limit or settings.SCRAPER_FULLTEXT_LIMIT
+        articles = list(Article.objects.using(using).select_related('author', 'category').filter(
+            Q(title__icontains=text) | Q(content__icontains=text)).order_by('-publication_date')[:limit])
+        for article in articles:
+            article.search_rank = None
+        return articles
+    ranks = ranked_ids(text, limit, using)
+    articles = Article.objects.using(using).select_related('author', 'category').in_bulk([pk for pk, _ in ranks])
+    results = []
+    for article_id, score in ranks:
+        if article_id in articles:
+            article = articles[article_id]
+            article.search_rank = score
+            results.append(article)
+    return results
+
+
+def article_saved(sender, instance, using, **kwargs):
+    index_articles([instance.pk], using)
+
+
+def article_deleted(sender, instance, using, **kwargs):
+    remove_articles([instance.pk], using)
+
+
+def article_tag_changed(sender, instance, using, **kwargs):
+    index_articles([instance.article_id], using)
+
+
+def tags_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    # article.tags.add/remove/clear, or the same from the tag's side
+    if action == 'pre_clear' and reverse:
+        # The tag's articles can't be looked up any more once it's cleared
+        instance._fulltext_article_ids = list(instance.article_set.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            article_ids = [instance.pk]
+        elif action == 'post_clear':
+            article_ids = getattr(instance, '_fulltext_article_ids', [])
+        else:
+            article_ids = pk_set
+        index_articles(article_ids, using)
+
+
+def name_changed(sender, instance, created, using, **kwargs):
+    # Author and tag names are part of the document of every article they appear on
+    if created:
+        return
+    field = 'author' if sender is Author else 'tags'
+    index_articles(Article.objects.using(using).filter(**{field: instance}).values_list('id', flat=True), using)
+
+
+def connect_signals():
+    post_save.connect(article_saved, sender=Article, dispatch_uid='fulltext_article_saved')
+    post_delete.connect(article_deleted, sender=Article, dispatch_uid='fulltext_article_deleted')
+    post_save.connect(article_tag_changed, sender=ArticleTag, dispatch_uid='fulltext_article_tag_saved')
+    post_delete.connect(article_tag_changed, sender=ArticleTag, dispatch_uid='fulltext_article_tag_deleted')
+    m2m_changed.connect(tags_changed, sender=Article.tags.through, dispatch_uid='fulltext_tags_changed')
+    post_save.connect(name_changed, sender=Author, dispatch_uid='fulltext_author_saved')
+    post_save.connect(name_changed, sender=Tag, dispatch_uid='fulltext_tag_saved')
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+
+class CacheEntry:
+    def __init__(self, url, status, headers, etag, last_modified, stored_at, path):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at
+        self.path = path
+
+    def is_fresh(self, ttl):
+        return time.time() - self.stored_at < ttl
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def validators(self):
+        # Headers for a conditional request against the stored copy
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """
+    On-disk HTTP response cache shared by every fetcher on the host.
+
+    Bodies are stored as files next to a SQLite index holding their validators. Entries younger
+    than `ttl` are served without a request, older ones are revalidated with If-None-Match /
+    If-Modified-Since, and the least recently used bodies are evicted once the cache outgrows
+    `max_bytes`.
+    """
+
+    def __init__(self, directory=None, ttl=None, max_bytes=None):
+        self.directory = directory or settings.SCRAPER_HTTP_CACHE_DIR
+        self.ttl = ttl if ttl is not None else settings.SCRAPER_HTTP_CACHE_TTL
+        self.max_bytes = max_bytes or settings.SCRAPER_HTTP_CACHE_MAX_BYTES
+        self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'evicted': 0}
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.directory, 'index.sqlite3'), timeout=30,
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, url TEXT NOT NULL, status INTEGER NOT NULL, headers TEXT NOT NULL,
+                etag TEXT, last_modified TEXT, stored_at REAL NOT NULL, accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)')
+
+    def lookup(self, url):
+        key = self._key(url)
+        with self._lock:
+            row = self._db.execute('SELECT url, status, headers, etag, last_modified, stored_at FROM entries '
+                                   'WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        entry = CacheEntry(row[0], row[1], json.loads(row[2]), row[3], row[4], row[5], self._path(key))
+        return entry if os.path.exists(entry.path) else None
+
+    def store(self, url, status, headers, content):
+        if 'no-store' in headers.get('Cache-Control', ''):
+            return
+        key = self._key(url)
+        path = self._path(key)
+        # Write then rename so a concurrent reader never sees a partial body
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, 'wb') as f:
+            f.write(content)
+        os.replace(temporary_path, path)
+        now = time.time()
+        kept_headers = {name: headers[name] for name in ('Content-Type', 'ETag', 'Last-Modified') if name in headers}
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                key, url, status, json.dumps(kept_headers), headers.get('ETag'), headers.get('Last-Modified'),
+                now, now, len(content)))
+        self._evict()
+
+    def touch(self, url):
+        # A 304 confirmed the stored copy, so its TTL starts again
+        with self._lock:
+            self._db.execute('UPDATE entries SET stored_at = ?, accessed_at = ? WHERE key = ?',
+                             (time.time(), time.time(), self._key(url)))
+
+    def clear(self):
+        with self._lock:
+            keys = [row[0] for row in self._db.execute('SELECT key FROM entries')]
+            self._db.execute('DELETE FROM entries')
+        for key in keys:
+            self._remove_file(key)
+
+    def summary(self):
+        return (f"HTTP cache: {self.stats['hits']} hits, {self.stats['misses']} misses, "
+                f"{self.stats['revalidated']} revalidated (304), {self.stats['evicted']} evicted")
+
+    def close(self):
+        self._db.close()
+
+    def _evict(self):
+        with self._lock:
+            total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            # Trim to 90% so every store near the limit doesn't trigger another eviction pass
+            target = self.max_bytes * 0.9
+            evicted = []
+            for key, size in self._db.execute('SELECT key, size FROM entries ORDER BY accessed_at').fetchall():
+                if total <= target:
+                    break
+                evicted.append(key)
+                total -= size
+            self._db.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key in evicted])
+        for key in evicted:
+            self._remove_file(key)
+        self.stats['evicted'] += len(evicted)
+
+    def _remove_file(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
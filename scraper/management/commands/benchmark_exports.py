@@ -0,0 +1,122 @@
+from django.core.management.base import BaseCommand
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from scraper.exporting import EXPORT_FORMATS, check_export_format
+from datetime import timedelta
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import string
+import tempfile
+import time
+import zipfile
+
+
+def synthetic_bodies(content_size, count=1000):
+    # Random text so the compressors see something closer to real prose than one repeated paragraph
+    rng = random.Random(0)
+    vocabulary = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(5000)]
+    bodies = []
+    for _ in range(count):
+        words = []
+        length = 0
+        while length < content_size:
+            words.append(rng.choice(vocabulary))
+            length += len(words[-1]) + 1
+        bodies.append(' '.join(words)[:content_size])
+    return bodies
+
+
+def synthetic_rows(count, bodies):
+    # Shaped like article_row(); generated lazily so the dataset itself never sits in memory
+    published = timezone.now()
+    for n in range(count):
+        yield {
+            'title': f"Article {n}",
+            'publication_date': published - timedelta(minutes=n),
+            'content': bodies[n % len(bodies)],
+            'image_url': f"https://techcrunch.com/wp-content/uploads/{n}.jpg",
+            'created_at': published,
+            'author_name': f"Author {n % 200}",
+            'category_name': f"Category {n % 20}",
+            'tags': [f"Tag {n % 500}", f"Tag {n % 37}", 'Funding'],
+        }
+
+
+def count_ndjson(stream):
+    return sum(1 for line in io.TextIOWrapper(stream, encoding='utf-8') if json.loads(line))
+
+
+def reload_zip(file_path):
+    # Both entries, the way a downstream job would load the zip
+    with zipfile.ZipFile(file_path) as zipf:
+        for name in zipf.namelist():
+            with zipf.open(name) as entry:
+                if name.endswith('.csv'):
+                    rows = sum(1 for _ in csv.reader(io.TextIOWrapper(entry, encoding='utf-8', newline=''))) - 1
+                else:
+                    rows = count_ndjson(entry)
+    return rows
+
+
+def reload_ndjson_gzip(file_path):
+    with gzip.open(file_path, 'rb') as f:
+        return count_ndjson(f)
+
+
+def reload_ndjson_zstd(file_path):
+    import zstandard
+    with open(file_path, 'rb') as f:
+        return count_ndjson(zstandard.ZstdDecompressor().stream_reader(f))
+
+
+def reload_parquet(file_path):
+    import pyarrow.parquet as pq
+    return pq.read_table(file_path).num_rows
+
+
+RELOADERS = {
+    'zip': reload_zip,
+    'ndjson.gz': reload_ndjson_gzip,
+    'ndjson.zst': reload_ndjson_zstd,
+    'parquet': reload_parquet,
+}
+
+
+class Command(BaseCommand):
+    help = 'Writes a synthetic article dataset in every export format and reports write time, size and reload time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Number of synthetic articles')
+        parser.add_argument('--content-size', type=int, default=4000, help='Characters of body text per article')
+        parser.add_argument('--formats', nargs='+', default=list(EXPORT_FORMATS), choices=list(EXPORT_FORMATS))
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Dataset: {options['rows']} articles, {options['content_size']} characters of content each")
+        bodies = synthetic_bodies(options['content_size'])
+        with tempfile.TemporaryDirectory() as directory:
+            for export_format in options['formats']:
+                try:
+                    check_export_format(export_format)
+                except ImproperlyConfigured as e:
+                    self.stdout.write(self.style.WARNING(f"{export_format}: skipped ({e})"))
+                    continue
+                extension, writer, _ = EXPORT_FORMATS[export_format]
+                file_path = os.path.join(directory, f"benchmark{extension}")
+
+                started = time.perf_counter()
+                writer(lambda: synthetic_rows(options['rows'], bodies), file_path, 'benchmark')
+                write_seconds = time.perf_counter() - started
+
+                started = time.perf_counter()
+                rows = RELOADERS[export_format](file_path)
+                reload_seconds = time.perf_counter() - started
+
+                size_mb = os.path.getsize(file_path) / (1024 * 1024)
+                self.stdout.write(f"{export_format}: wrote {rows} rows in {write_seconds:.2f}s "
+                                  f"({options['rows'] / write_seconds:.0f} rows/sec), {size_mb:.1f} MB, "
+                                  f"reloaded in {reload_seconds:.2f}s")
+                os.remove(file_path)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from scraper.fetcher import Fetcher
+from scraper.standin import StandInServer
+import requests
+import time
+
+
+class Command(BaseCommand):
+    help = 'Compares the serial requests loop with the concurrent fetcher against a local stand-in server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=100, help='Number of article pages to fetch')
+        parser.add_argument('--latency', type=float, default=0.1, help='Simulated server latency in seconds')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 5, 10, 20, 50],
+                            help='Concurrency levels to measure')
+        parser.add_argument('--per-host', type=int, default=None, help='Connection cap per host')
+
+    def handle(self, *args, **options):
+        with StandInServer(latency=options['latency']) as server:
+            urls = [f"{server.url}/article/{n}/" for n in range(options['pages'])]
+
+            started = time.perf_counter()
+            for url in urls:
+                requests.get(url)
+            serial_elapsed = time.perf_counter() - started
+            self.stdout.write(f"serial requests.get: {len(urls) / serial_elapsed:.1f} pages/sec")
+
+            for concurrency in options['concurrency']:
+                per_host = options['per_host'] or concurrency
+                with Fetcher(concurrency=concurrency, per_host=per_host, cache=False) as fetcher:
+                    started = time.perf_counter()
+                    results = fetcher.fetch_many(urls)
+                    elapsed = time.perf_counter() - started
+                failed = sum(1 for result in results if not result.ok)
+                self.stdout.write(f"fetcher concurrency={concurrency} per_host={per_host}: "
+                                  f"{len(urls) / elapsed:.1f} pages/sec "
+                                  f"({serial_elapsed / elapsed:.1f}x, {failed} failed)")
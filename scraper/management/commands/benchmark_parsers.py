@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import ImproperlyConfigured
+from scraper.parsing import BACKENDS, parse_article
+from scraper.standin import ARTICLE_TEMPLATE
+import multiprocessing
+import resource
+import time
+import os
+
+# Pages are kept in a module global so forked workers inherit them instead of unpickling a copy
+_corpus = []
+
+
+def _measure(backend, repeat):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for url, html in _corpus:
+            parse_article(html, url, backend=backend)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return elapsed, baseline, peak
+
+
+def synthetic_page(n):
+    # Roughly the size and shape of a real article page: scripts, navigation and a long body
+    page = ARTICLE_TEMPLATE.format(title=f"Article {n}", slug=n)
+    filler = ''.join(f'<li class="menu-item"><a href="/category/{i}/">Category {i}</a></li>' for i in range(300))
+    paragraphs = ''.join(f'<p>Paragraph {i} of article {n}. ' + 'Lorem ipsum dolor sit amet. ' * 20 + '</p>'
+                         for i in range(40))
+    scripts = '<script>window.__data = {};</script>' * 20
+    return page.replace('<body>', f'<body><nav><ul>{filler}</ul></nav>{scripts}').replace(
+        '<p>Second paragraph.</p>', paragraphs)
+
+
+class Command(BaseCommand):
+    help = 'Parses a corpus of saved article pages with each parser backend and reports throughput and memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', type=str, default=None,
+                            help='Directory of saved article .html files (synthetic pages are used when omitted)')
+        parser.add_argument('--pages', type=int, default=200, help='Number of synthetic pages')
+        parser.add_argument('--repeat', type=int, default=3, help='Passes over the corpus per backend')
+        parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+
+    def handle(self, *args, **options):
+        _corpus.clear()
+        if options['corpus']:
+            if not os.path.isdir(options['corpus']):
+                raise CommandError(f"Corpus directory not found: {options['corpus']}")
+            for filename in sorted(os.listdir(options['corpus'])):
+                if filename.endswith('.html'):
+                    with open(os.path.join(options['corpus'], filename), 'rb') as f:
+                        _corpus.append((filename, f.read()))
+        else:
+            _corpus.extend((f"synthetic-{n}", synthetic_page(n).encode('utf-8')) for n in range(options['pages']))
+        if not _corpus:
+            raise CommandError("The corpus is empty")
+        total_mb = sum(len(html) for _, html in _corpus) / (1024 * 1024)
+        self.stdout.write(f"Corpus: {len(_corpus)} pages, {total_mb:.1f} MB")
+
+        # Each backend runs in a fresh forked process so peak RSS isn't inherited from the previous one
+        context = multiprocessing.get_context('fork')
+        for backend in options['backends']:
+            with context.Pool(1) as pool:
+                try:
+                    elapsed, baseline, peak = pool.apply(_measure, (backend, options['repeat']))
+                except ImproperlyConfigured as e:
+                    self.stdout.write(self.style.WARNING(f"{backend}: skipped ({e})"))
+                    continue
+            pages = len(_corpus) * options['repeat']
+            self.stdout.write(f"{backend}: {pages / elapsed:.1f} pages/sec, "
+                              f"peak RSS {peak / 1024:.1f} MB (+{(peak - baseline) / 1024:.1f} MB while parsing)")
@@ -0,0 +1,202 @@
+from contextlib import redirect_stdout
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from scraper.models import Article, CategoryFeed, FailedURL
+from scraper.persistence import clear_name_caches
+from scraper.standin import StandInServer
+from urllib.parse import urlsplit
+import io
+import json
+import math
+import psutil
+import subprocess
+import threading
+import time
+
+SCENARIOS = {
+    'keyword': 'scrape_techcrunch',
+    'keyword_html': 'scrape_techcrunch',
+    'categories': 'scrape_categories_techcrunch',
+    'categories_html': 'scrape_categories_techcrunch',
+}
+
+# Lower is better for everything but throughput when comparing two runs
+METRICS = ['articles_per_sec', 'latency_p50', 'latency_p99', 'queries_per_article', 'peak_rss_mb']
+
+
+class QueryCounter:
+    # Database execute wrapper; counts without keeping the SQL, unlike CaptureQueriesContext
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class PeakRss:
+    # Samples this process' resident memory in the background while the block runs
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while True:
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            if self._done.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._done.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def percentile(values, q):
+    # Nearest-rank percentile
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(math.ceil(q / 100 * len(values)) - 1, 0)]
+
+
+def fmt(value, spec, unit=''):
+    # Percentiles and per-article figures are None when a scenario saved nothing
+    return 'n/a' if value is None else f"{value:{spec}}{unit}"
+
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+class Command(BaseCommand):
+    help = ('Runs the scrape commands end to end against a local TechCrunch stand-in and a throwaway database, '
+            'and reports throughput, per-article latency, queries per article and peak memory')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+        parser.add_argument('--articles', type=int, default=500, help='Articles listed by the search and the feed')
+        parser.add_argument('--latency', type=float, default=0.05, help='Simulated server latency in seconds')
+        parser.add_argument('--jitter', type=float, default=0.05,
+                            help='Random extra latency of up to this many seconds')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of article requests answered with a 503')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Max article requests in flight (defaults to SCRAPER_FETCH_CONCURRENCY)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the injected latency and errors')
+        parser.add_argument('--output', default=None, help='Write the results as JSON to this file')
+        parser.add_argument('--compare', default=None, help='JSON results of an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        report = {
+            'commit': git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'options': {key: options[key] for key in ('articles', 'latency', 'jitter', 'error_rate', 'concurrency',
+                                                      'seed')},
+            'scenarios': {},
+        }
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            for scenario in options['scenarios']:
+                result = report['scenarios'][scenario] = self.run_scenario(scenario, options)
+                self.stdout.write(self.summary(scenario, result))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.compare(json.load(f), report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+    def summary(self, scenario, result):
+        return (f"{scenario}: {result['articles']} articles in {result['seconds']:.2f}s "
+                f"({result['articles_per_sec']:.1f}/sec), latency p50 {fmt(result['latency_p50'], '.3f', 's')} "
+                f"p99 {fmt(result['latency_p99'], '.3f', 's')}, "
+                f"{fmt(result['queries_per_article'], '.1f')} queries per article, "
+                f"peak RSS {result['peak_rss_mb']:.0f} MB, {result['failed']} failed")
+
+    def run_scenario(self, scenario, options):
+        # Every scenario starts from an empty database and cold name caches
+        call_command('flush', interactive=False, verbosity=0)
+        clear_name_caches()
+        articles = options['articles']
+        with StandInServer(latency=options['latency'], jitter=options['jitter'], error_rate=options['error_rate'],
+                           seed=options['seed']) as server, \
+                override_settings(SCRAPER_HTTP_CACHE_ENABLED=False, SCRAPER_SEARCH_URL=f"{server.url}/search",
+                                  SCRAPER_MAGAZINE_FEED_URL=f"{server.url}/wp-json/tc/v1/magazine",
+                                  SCRAPER_WP_POSTS_URL=f"{server.url}/wp-json/wp/v2/posts",
+                                  SCRAPER_SEARCH_MAX_PAGES=articles // settings.SCRAPER_SEARCH_PAGE_SIZE + 2):
+            server.serve_techcrunch(articles)
+            if scenario.startswith('keyword'):
+                args = ['benchmark']
+            else:
+                CategoryFeed.objects.create(name='Benchmark', wp_category_id=1)
+                args = ['--full', '--max-pages', str(articles // settings.SCRAPER_MAGAZINE_PER_PAGE + 1)]
+            if scenario.endswith('_html'):
+                args += ['--ingest', 'html']
+            if options['concurrency']:
+                args += ['--concurrency', str(options['concurrency'])]
+
+            queries = QueryCounter()
+            with connection.execute_wrapper(queries), PeakRss() as rss, redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                call_command(SCENARIOS[scenario], *args, stdout=io.StringIO(), stderr=io.StringIO())
+                seconds = time.perf_counter() - started
+
+        # From the article's first request reaching the server to its row being written, batching included.
+        # Articles built from wp-json posts are never requested and count from the first feed or posts request.
+        api_requested = min(server.first_requested.get(path, math.inf)
+                            for path in ('/wp-json/tc/v1/magazine', '/wp-json/wp/v2/posts'))
+        latencies = [created_at.timestamp() - server.first_requested.get(urlsplit(url).path, api_requested)
+                     for url, created_at in Article.objects.values_list('url', 'created_at')]
+        saved = len(latencies)
+        return {
+            'articles': saved,
+            'failed': FailedURL.objects.count(),
+            'requests': server.request_count,
+            'injected_errors': server.injected_errors,
+            'seconds': seconds,
+            'articles_per_sec': saved / seconds,
+            'latency_p50': percentile(latencies, 50),
+            'latency_p99': percentile(latencies, 99),
+            'queries_per_article': queries.count / saved if saved else None,
+            'peak_rss_mb': rss.peak / (1024 * 1024),
+        }
+
+    def compare(self, baseline, report):
+        self.stdout.write(f"Compared with {baseline.get('commit') or 'the baseline'}:")
+        for scenario, result in report['scenarios'].items():
+            before = baseline.get('scenarios', {}).get(scenario)
+            if not before:
+                continue
+            changes = []
+            for metric in METRICS:
+                # No relative change without a value on both sides, or from a baseline of zero
+                if before.get(metric) and result.get(metric) is not None:
+                    change = (result[metric] - before[metric]) / before[metric] * 100
+                    changes.append(f"{metric} {change:+.1f}%")
+                else:
+                    changes.append(f"{metric} n/a")
+            self.stdout.write(f"  {scenario}: {', '.join(changes)}")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from scraper import fulltext
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index over article title, content, tags and author'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not fulltext.is_supported(using):
+            raise CommandError(f"Full-text search is not supported on {fulltext.vendor(using)}")
+        started = time.perf_counter()
+        fulltext.create_index(using)
+        # Searches keep seeing the old index until the new one is complete
+        with transaction.atomic(using=using):
+            count = fulltext.rebuild(using)
+        self.stdout.write(f"Indexed {count} articles in {time.perf_counter() - started:.1f}s")
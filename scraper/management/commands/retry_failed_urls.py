@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from scraper.fetcher import Fetcher
+from scraper.models import FailedURL
+from scraper.persistence import ArticleWriter
+from scraper.pipeline import retry_failed_urls
+
+
+class Command(BaseCommand):
+    help = 'Scrapes the articles in the FailedURL dead letter again'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keyword', default=None, help='Only retry articles found by this search term')
+        parser.add_argument('--limit', type=int, default=None, help='Retry at most this many, oldest failure first')
+        parser.add_argument('--extraction', choices=['static', 'browser'], default='static',
+                            help='Read author, category and tags from the static HTML (falling back to Chrome '
+                                 'per article) or always render the article in Chrome')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Max article requests in flight (defaults to SCRAPER_FETCH_CONCURRENCY)')
+
+    def handle(self, *args, **options):
+        failed_urls = FailedURL.objects.order_by('last_failed_at')
+        if options['keyword']:
+            failed_urls = failed_urls.filter(keyword__keyword=options['keyword'])
+        if options['limit']:
+            failed_urls = failed_urls[:options['limit']]
+        writer = ArticleWriter()
+        with Fetcher(concurrency=options['concurrency']) as fetcher:
+            recovered, still_failed = retry_failed_urls(fetcher, failed_urls, writer, options['extraction'])
+            self.stdout.write(f"Recovered {recovered} articles, {still_failed} still failing")
+            self.stdout.write(fetcher.summary())
@@ -1,178 +1,172 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from scraper.models import Category, Author, Article, Tag, ArticleTag, Keyword, KeywordSearchResult, \
-    KeywordSearchResultItem
-import requests
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, WebDriverException
-from selenium.common.exceptions import NoSuchElementException
-from datetime import datetime
-import pytz
+from django.utils import timezone
+from scraper.persistence import (ArticleWriter, known_urls, name_cache_summary, record_failed_urls,
+                                 reset_name_cache_stats)
+from scraper.fetcher import Fetcher
+from scraper.metadata import extract_embed_metadata
+from scraper.models import CategoryFeed
+from scraper.parsing import canonical_url, parse_date
+from scraper.pipeline import ingest_posts, scrape_articles
+from scraper.profiling import RunProfile, start_profiler, stop_profiler
+from selenium.common.exceptions import WebDriverException
+from urllib.parse import urlencode
+import json
 
 
 class Command(BaseCommand):
     help = 'Scrapes articles from TechCrunch and stores them in the database'
 
-    def handle(self, *args, **kwargs):
-        base_urls = [
-            'https://techcrunch.com/wp-json/tc/v1/magazine?page={'
-            '}&_embed=true&_envelope=true&categories=577047203&cachePrevention=0',
-            # AI
-            'https://techcrunch.com/wp-json/tc/v1/magazine?page={'
-            '}&_embed=true&_envelope=true&categories=577051039&cachePrevention=0',
-            # APPs
-            'https://techcrunch.com/wp-json/tc/v1/magazine?page={'
-            '}&_embed=true&_envelope=true&categories=577030454&cachePrevention=0',
-            # Biotech & Health
-        ]
-        all_links = []
-        for base_url in base_urls:
-            page = 1
-            while page <= 1:
-                url = base_url.format(page)
-                response = requests.get(url)
-                data = response.json()
-                links = [item['link'] for item in data['body'] if 'link' in item]
-
-                if not links:
-                    break
-                print(links)
-                all_links.extend(links)
-                page += 1
-
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")  # Run Chrome in headless mode.
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--disable-extensions")  # Disable extensions
-        chrome_options.add_argument("--disable-popup-blocking")  # Disable pop-ups
-        chrome_options.add_argument("--profile-directory=Default")
-        chrome_options.add_argument("--ignore-certificate-errors")
-        chrome_options.add_argument("--disable-plugins-discovery")
-        chrome_options.add_argument("--incognito")  # Use Chrome in Incognito mode
-        chrome_options.add_argument("--single-process")  # Run Chrome in single-process mode
-        chrome_options.add_argument("--disable-dev-shm-usage")  # Disable /dev/shm usage
-        chrome_options.add_argument("--remote-debugging-port=9222")  # Enable remote debugging
-        chrome_options.add_argument("--log-level=3")  # Minimize logging
-        # chrome_options.add_argument("--disable-software-rasterizer")  # Disable software rasterizer
-        # chrome_options.add_argument("--disable-background-networking")  # Disable background networking
-        chrome_options.add_argument("--disable-features=VizDisplayCompositor")  # Disable Viz Display Compositor
-        caps = DesiredCapabilities.CHROME
-        # caps["pageLoadStrategy"] = "none"  # Do not wait for the full page to load
-        caps["pageLoadStrategy"] = "eager"
+    def add_arguments(self, parser):
+        parser.add_argument('--extraction', choices=['static', 'browser'], default='static',
+                            help='Read author, category and tags from the feed payload and static HTML (falling '
+                                 'back to Chrome per article) or always render the article in Chrome')
+        parser.add_argument('--ingest', choices=['api', 'html'], default='api',
+                            help='Build articles from the feed payload, downloading only the posts it is incomplete '
+                                 'for, or download every article page (always the case with --extraction browser)')
+        parser.add_argument('--refresh', action='store_true',
+                            help='Re-download and update articles that are already stored')
+        parser.add_argument('--category', type=int, nargs='+', default=None,
+                            help='Only crawl these WordPress category ids (defaults to every enabled CategoryFeed)')
+        parser.add_argument('--full', action='store_true',
+                            help='Ignore the stored high-water marks and walk the feeds up to --max-pages')
+        parser.add_argument('--max-pages', type=int, default=settings.SCRAPER_CATEGORY_MAX_PAGES,
+                            help='Upper bound on feed pages per category')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Max article requests in flight (defaults to SCRAPER_FETCH_CONCURRENCY)')
+        parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], default=None,
+                            help='Also capture a cProfile or pyinstrument profile of the run into SCRAPER_PROFILE_DIR')
 
+    def handle(self, *args, **kwargs):
+        profile = RunProfile()
+        profiler = start_profiler(kwargs['profile'])
+        fetcher = Fetcher(concurrency=kwargs['concurrency'])
+        feeds = CategoryFeed.objects.filter(enabled=True)
+        if kwargs['category']:
+            feeds = feeds.filter(wp_category_id__in=kwargs['category'])
+        browser_fallbacks = 0
+        failed = {}
+        reset_name_cache_stats()
+        writer = ArticleWriter(refresh=kwargs['refresh'], profile=profile)
         try:
-            driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-            for url in all_links:
-                response = requests.get(url)
-                print(url)
-                soup = BeautifulSoup(response.content, 'html.parser')
-                title_element = soup.select_one('h1.wp-block-post-title')
-                if title_element:
-                    title = title_element.text.strip()
-                else:
-                    title = "Title not found"
-                publication_date_element = soup.select_one("div.wp-block-post-date > time")
-                publication_date = publication_date_element['datetime'] if publication_date_element else None
-                # print(f"Publication date: {publication_date}")
-
-                if publication_date:
-                    try:
-                        dt = datetime.fromisoformat(publication_date)
-                        localized_dt = dt if dt.tzinfo else dt.replace(tzinfo=pytz.UTC)
-                    except ValueError as e:
-                        print(f"Error parsing date {publication_date}: {e}")
-                        localized_dt = None
-                else:
-                    localized_dt = None
-                try:
-                    article_content_elements = soup.select('.wp-block-post-content p')
-                    article_content = ' '.join([p.text.strip() for p in article_content_elements])
-                    if not article_content:
-                        print("Article content is empty. Check selector or page structure.")
-                except Exception as e:
-                    print(f"Error extracting content: {e}")
-                    article_content = "Content extraction failed"
-                image_element = soup.select_one('figure.wp-block-post-featured-image > img')
-                if image_element:
-                    article_image_url = image_element['src']
-                else:
-                    article_image_url = "Image URL not found"
-
-                retry_attempts = 1
-                while retry_attempts > 0:
-                    try:
-                        driver.get(url)
-                        WebDriverWait(driver, 15).until(EC.presence_of_element_located(
-                            (By.CSS_SELECTOR, 'header.article__header > div.article__title-wrapper')))
-                        break  # Break out of the retry loop if successful
-                    except TimeoutException:
-                        print("The element did not load within 10 seconds.")
-                        retry_attempts -= 1
-                        if retry_attempts == 0:
-                            continue
-
-                page_source = driver.page_source  # Get the HTML source of the page
-                author_soup = BeautifulSoup(page_source, 'html.parser')  # Parse it with BeautifulSoup
-
-                # Now, use BeautifulSoup to find elements as usual
-                author_element = author_soup.select_one('div.wp-block-tc23-author-card-name > a')
-                if author_element:
-                    author = author_element.text.strip()
-                else:
-                    author = "Author not found"
-
-                try:
-                    category_element = driver.find_element(By.CSS_SELECTOR, 'a.is-taxonomy-category')
-                    category = category_element.text
-                except NoSuchElementException:
-                    try:
-                        category_element = driver.find_element(By.CSS_SELECTOR, 'a.is-taxonomy-category')
-                        category = category_element.text
-                    except NoSuchElementException:
-                        category = "Category not found"
-
-                tags_elements = driver.find_elements(By.CSS_SELECTOR, 'div.taxonomy-post_tag.wp-block-post-terms a')
-                tags = [element.text for element in tags_elements]
-
-                # Save or retrieve the category
-                category_obj, _ = Category.objects.get_or_create(name=category)
-
-                # Save or retrieve the author
-                author_obj, _ = Author.objects.get_or_create(name=author)
-
-                # Save the article
-                # Check if the article already exists to avoid duplicates
-                article_obj, created = Article.objects.get_or_create(
-                    title=title,
-                    defaults={
-                        'author': author_obj,
-                        'category': category_obj,
-                        'publication_date': localized_dt,
-                        'content': article_content,
-                        'image_url': article_image_url
-                    }
-                )
-
-                # If the article is newly created, handle the tags
-                if created:
-                    for tag_name in tags:
-                        tag_obj, _ = Tag.objects.get_or_create(name=tag_name)
-                        ArticleTag.objects.get_or_create(article=article_obj, tag=tag_obj)
-
-                # Print a message indicating success
-                self.stdout.write(self.style.SUCCESS(f'Successfully saved article: {title}'))
-
+            all_links = []
+            all_posts = {}
+            feed_states = []
+            for feed in feeds:
+                with profile.span('feed'):
+                    links, posts, state, finished = self.crawl_feed(fetcher, feed, kwargs['full'],
+                                                                    kwargs['max_pages'])
+                print(f"{feed.name}: {len(links)} new posts")
+                all_links.extend(links)
+                all_posts.update(posts)
+                # A walk cut short keeps the old marks, so the next run picks up the pages it missed
+                feed_states.append((feed, state if finished else {}))
+
+            all_links = list(dict.fromkeys(all_links))
+            if not kwargs['refresh']:
+                with profile.span('db'):
+                    known = known_urls(all_links)
+                all_links = [link for link in all_links if link not in known]
+                print(f"Skipping {len(known)} already stored articles")
+
+            if kwargs['ingest'] == 'api' and kwargs['extraction'] == 'static':
+                failed, browser_fallbacks, from_payload = ingest_posts(
+                    fetcher, [all_posts[link] for link in all_links], writer)
+                print(f"Built {from_payload} articles from the feed payload")
+            else:
+                # Keep the `_embed` metadata so author, category and tags don't need Chrome
+                embedded_metadata = {link: extract_embed_metadata(all_posts[link]) for link in all_links}
+                failed, browser_fallbacks = scrape_articles(fetcher, all_links, writer, kwargs['extraction'],
+                                                            embedded_metadata=embedded_metadata)
+            if failed:
+                self.stdout.write(self.style.ERROR(f"Failed to fetch {len(failed)} articles"))
+                record_failed_urls(failed)
+
+            # High-water marks only move once everything up to them has been saved
+            writer.flush()
+            for feed, state in feed_states:
+                for field, value in state.items():
+                    setattr(feed, field, value)
+                feed.last_run_at = timezone.now()
+                feed.save()
         except WebDriverException as e:
+            profile.error(type(e).__name__)
             self.stdout.write(self.style.ERROR(f"WebDriverException encountered: {e}"))
         except Exception as e:
+            profile.error(type(e).__name__)
             self.stdout.write(self.style.ERROR(f"An error occurred: {e}"))
         finally:
-            driver.quit()
+            fetcher.close()
+            writer.flush()
+            self.stdout.write(f"Saved {writer.saved_count} articles ({writer.created_count} new, "
+                              f"{writer.skipped_count} skipped), browser fallback used for {browser_fallbacks}")
+            self.stdout.write(name_cache_summary())
+            self.stdout.write(fetcher.summary())
+            if fetcher.cache is not None:
+                self.stdout.write(fetcher.cache.summary())
+            profile_path = stop_profiler(profiler, f"categories-{timezone.now():%Y%m%d-%H%M%S}")
+            profile.save('categories', saved=writer.saved_count, created=writer.created_count, failed=len(failed),
+                         browser_fallbacks=browser_fallbacks, profile_path=profile_path)
+            self.stdout.write(profile.report())
+            if profile_path:
+                self.stdout.write(f"Profile written to {profile_path}")
+
+    def crawl_feed(self, fetcher, feed, full, max_pages):
+        # Walks the feed newest first and stops at the first post seen on a previous run
+        links = []
+        posts = {}
+        state = {'etag': feed.etag, 'last_post_id': feed.last_post_id, 'last_post_date': feed.last_post_date}
+        total_pages = max_pages
+        page = 1
+        finished = False
+        while page <= min(max_pages, total_pages):
+            params = urlencode({'page': page, 'per_page': settings.SCRAPER_MAGAZINE_PER_PAGE, '_embed': 'true',
+                                '_envelope': 'true', 'categories': feed.wp_category_id, 'cachePrevention': 0})
+            url = f"{settings.SCRAPER_MAGAZINE_FEED_URL}?{params}"
+            headers = {'If-None-Match': feed.etag} if page == 1 and feed.etag and not full else None
+            print(f"Fetching {feed.name} page {page}: {url}")
+            response = fetcher.fetch(url, headers=headers)
+            if response.status == 304:
+                print(f"{feed.name}: nothing changed since the last run")
+                finished = True
+                break
+            if not response.ok:
+                self.stdout.write(self.style.ERROR(f"Failed to fetch {url}: {response.error or response.status}"))
+                break
+            try:
+                data = json.loads(response.content)
+            except ValueError:
+                self.stdout.write(self.style.ERROR(f"Failed to decode {url}: not a JSON response"))
+                break
+            if page == 1:
+                state['etag'] = response.headers.get('ETag', '')
+                total_pages = int(data.get('headers', {}).get('X-WP-TotalPages', max_pages))
+
+            items = [item for item in data.get('body', []) if 'link' in item]
+            reached_known = False
+            for item in items:
+                post_date = parse_date(item.get('date_gmt'))
+                if not full and self.is_known(feed, item.get('id'), post_date):
+                    reached_known = True
+                    break
+                link = canonical_url(item['link'])
+                links.append(link)
+                # The `_embed` payload usually holds the whole article, see ingest_posts
+                posts[link] = item
+                if post_date and (state['last_post_date'] is None or post_date > state['last_post_date']):
+                    state['last_post_date'] = post_date
+                    state['last_post_id'] = item.get('id')
+            if reached_known or not items:
+                finished = True
+                break
+            page += 1
+        else:
+            # Walked to the last page, or as far as --max-pages allows
+            finished = True
+        return links, posts, state, finished
+
+    @staticmethod
+    def is_known(feed, post_id, post_date):
+        if feed.last_post_id is not None and post_id == feed.last_post_id:
+            return True
+        return feed.last_post_date is not None and post_date is not None and post_date <= feed.last_post_date
@@ -1,20 +1,13 @@
 from django.core.management.base import BaseCommand
-from scraper.models import Category, Author, Article, Tag, ArticleTag,Keyword, KeywordSearchResult, KeywordSearchResultItem
-import requests
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, WebDriverException
-from selenium.common.exceptions import NoSuchElementException
-from urllib.parse import quote_plus
-from datetime import datetime
-import pytz
+from scraper.models import KeywordSearchResult
+from scraper.persistence import (ArticleWriter, known_urls, name_cache_summary, record_failed_urls,
+                                 reset_name_cache_stats, resolve_keyword)
+from scraper.fetcher import Fetcher
+from scraper.pagination import SearchPaginator
+from scraper.pipeline import ingest_urls, scrape_articles
+from scraper.profiling import RunProfile, start_profiler, stop_profiler
+from django.utils import timezone
+from selenium.common.exceptions import WebDriverException
 
 
 class Command(BaseCommand):
@@ -22,6 +15,21 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('search_term', type=str, help='The search term to scrape articles for')
+        parser.add_argument('--extraction', choices=['static', 'browser'], default='static',
+                            help='Read author, category and tags from the static HTML (falling back to Chrome '
+                                 'per article) or always render the article in Chrome')
+        parser.add_argument('--ingest', choices=['api', 'html'], default='api',
+                            help='Resolve the search hits through wp-json in batches, downloading only the articles '
+                                 'without a complete post, or download every article page (always the case with '
+                                 '--extraction browser)')
+        parser.add_argument('--refresh', action='store_true',
+                            help='Re-download and update articles that are already stored')
+        parser.add_argument('--page-size', type=int, default=None,
+                            help='Results per search page (defaults to SCRAPER_SEARCH_PAGE_SIZE)')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Max article requests in flight (defaults to SCRAPER_FETCH_CONCURRENCY)')
+        parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], default=None,
+                            help='Also capture a cProfile or pyinstrument profile of the run into SCRAPER_PROFILE_DIR')
 
     def handle(self, *args, **options):
         search_term = options['search_term']
@@ -29,157 +37,63 @@ class Command(BaseCommand):
         if isinstance(search_term, list):
             search_term = ' '.join(search_term)
         print(f"Processed search_term: {search_term}")
-        encoded_search_term = quote_plus(search_term)  # This will replace spaces with '+'
 
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")   # Run Chrome in headless mode.
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--disable-extensions")  # Disable extensions
-        chrome_options.add_argument("--disable-popup-blocking")  # Disable pop-ups
-        chrome_options.add_argument("--profile-directory=Default")
-        chrome_options.add_argument("--ignore-certificate-errors")
-        chrome_options.add_argument("--disable-plugins-discovery")
-        chrome_options.add_argument("--incognito")  # Use Chrome in Incognito mode
-        chrome_options.add_argument("--single-process")  # Run Chrome in single-process mode
-        chrome_options.add_argument("--disable-dev-shm-usage")  # Disable /dev/shm usage
-        chrome_options.add_argument("--remote-debugging-port=9222")  # Enable remote debugging
-        chrome_options.add_argument("--log-level=3")  # Minimize logging
-        # chrome_options.add_argument("--disable-software-rasterizer")  # Disable software rasterizer
-        # chrome_options.add_argument("--disable-background-networking")  # Disable background networking
-        chrome_options.add_argument("--disable-features=VizDisplayCompositor")  # Disable Viz Display Compositor
-        caps = DesiredCapabilities.CHROME
-        #caps["pageLoadStrategy"] = "none"  # Do not wait for the full page to load
-        caps["pageLoadStrategy"] = "eager"
-
-        driver = None
+        browser_fallbacks = 0
+        failed = {}
+        keyword_search_result = None
+        reset_name_cache_stats()
+        profile = RunProfile()
+        profiler = start_profiler(options['profile'])
+        writer = ArticleWriter(refresh=options['refresh'], profile=profile)
+        fetcher = Fetcher(concurrency=options['concurrency'])
         try:
-            driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-            base_url = ("https://search.techcrunch.com/search;_ylt=AwrEqgcix.VlUJI22lenBWVH;_ylu"
-                        "=Y29sbwNiZjEEcG9zAzEEdnRpZAMEc2VjA3BhZ2luYXRpb24-?p={}&pz=10&fr=techcrunch&bct=0&b=")
-            page_number = 1
-            has_data = True
-            while has_data:
-                full_url = base_url.format(encoded_search_term) + str((page_number - 1) * 10 + 1)
-                print(f"Fetching Page {page_number}: {full_url}")
-                response = requests.get(full_url)
-                soup = BeautifulSoup(response.content, 'html.parser')
-                article_links_elements = soup.select('a.thmb')
-                article_links = [element['href'] for element in article_links_elements]
-                keyword_obj, _ = Keyword.objects.get_or_create(keyword=search_term)
-                keyword_search_result = KeywordSearchResult.objects.create(keyword=keyword_obj)
-                if not article_links_elements:  # If there are no article links, exit the loop
-                    has_data = False
-                    print("No more data to fetch.")
-                    break
-                for url in article_links:
-                    response = requests.get(url)
-                    print(url)
-                    soup = BeautifulSoup(response.content, 'html.parser')
-                    title_element = soup.select_one('h1.wp-block-post-title')
-                    if title_element:
-                        title = title_element.text.strip()
-                    else:
-                        title = "Title not found"
-                    publication_date_element = soup.select_one("div.wp-block-post-date > time")
-                    publication_date = publication_date_element['datetime'] if publication_date_element else None
-                    #print(f"Publication date: {publication_date}")
-
-                    if publication_date:
-                        try:
-                            dt = datetime.fromisoformat(publication_date)
-                            localized_dt = dt if dt.tzinfo else dt.replace(tzinfo=pytz.UTC)
-                        except ValueError as e:
-                            print(f"Error parsing date {publication_date}: {e}")
-                            localized_dt = None
-                    else:
-                        localized_dt = None
-                    try:
-                        article_content_elements = soup.select('.wp-block-post-content p')
-                        article_content = ' '.join([p.text.strip() for p in article_content_elements])
-                        if not article_content:
-                            print("Article content is empty. Check selector or page structure.")
-                    except Exception as e:
-                        print(f"Error extracting content: {e}")
-                        article_content = "Content extraction failed"
-                    image_element = soup.select_one('figure.wp-block-post-featured-image > img')
-                    if image_element:
-                        article_image_url = image_element['src']
-                    else:
-                        article_image_url = "Image URL not found"
-
-                    retry_attempts = 1
-                    while retry_attempts > 0:
-                        try:
-                            driver.get(url)
-                            WebDriverWait(driver, 15).until(EC.presence_of_element_located(
-                                (By.CSS_SELECTOR, 'header.article__header > div.article__title-wrapper')))
-                            break  # Break out of the retry loop if successful
-                        except TimeoutException:
-                            print("The element did not load within 10 seconds.")
-                            retry_attempts -= 1
-                            if retry_attempts == 0:
-                                continue
-
-                    page_source = driver.page_source  # Get the HTML source of the page
-                    author_soup = BeautifulSoup(page_source, 'html.parser')  # Parse it with BeautifulSoup
-
-                    # Now, use BeautifulSoup to find elements as usual
-                    author_element = author_soup.select_one('div.wp-block-tc23-author-card-name > a')
-                    if author_element:
-                        author = author_element.text.strip()
-                    else:
-                        author = "Author not found"
-
-                    try:
-                        category_element = driver.find_element(By.CSS_SELECTOR, 'a.is-taxonomy-category')
-                        category = category_element.text
-                    except NoSuchElementException:
-                        try:
-                            category_element = driver.find_element(By.CSS_SELECTOR, 'a.is-taxonomy-category')
-                            category = category_element.text
-                        except NoSuchElementException:
-                            category = "Category not found"
-
-                    tags_elements = driver.find_elements(By.CSS_SELECTOR, 'div.taxonomy-post_tag.wp-block-post-terms a')
-                    tags = [element.text for element in tags_elements]
-
-                    # Save or retrieve the category
-                    category_obj, _ = Category.objects.get_or_create(name=category)
-
-                    # Save or retrieve the author
-                    author_obj, _ = Author.objects.get_or_create(name=author)
-
-                    # Save the article
-                    # Check if the article already exists to avoid duplicates
-                    article_obj, created = Article.objects.get_or_create(
-                        title=title,
-                        defaults={
-                            'author': author_obj,
-                            'category': category_obj,
-                            'publication_date': localized_dt,
-                            'content': article_content,
-                            'image_url': article_image_url,
-                            'keyword': keyword_obj
-                        }
-                    )
-
-                    # Create a KeywordSearchResultItem for the article
-                    KeywordSearchResultItem.objects.create(search_result=keyword_search_result, article=article_obj)
-
-                    # If the article is newly created, handle the tags
-                    if created:
-                        for tag_name in tags:
-                            tag_obj, _ = Tag.objects.get_or_create(name=tag_name)
-                            ArticleTag.objects.get_or_create(article=article_obj, tag=tag_obj)
-
-                    # Print a message indicating success
-                    self.stdout.write(self.style.SUCCESS(f'Successfully saved article: {title}'))
-                page_number += 1
+            keyword_obj = resolve_keyword(search_term)
+            keyword_search_result = KeywordSearchResult.objects.create(keyword=keyword_obj)
+            # Collect and deduplicate every result link before any article is downloaded
+            paginator = SearchPaginator(fetcher, search_term, page_size=options['page_size'])
+            with profile.span('search'):
+                article_links = paginator.links()
+            print(f"Found {len(article_links)} articles on {paginator.pages_fetched} result pages")
+            if not paginator.complete:
+                self.stdout.write(self.style.ERROR(
+                    f"Search results are incomplete: {len(paginator.failed_pages)} result pages failed"))
+                for _ in paginator.failed_pages:
+                    profile.error('search_page_failed')
+            if not options['refresh']:
+                # Articles we already have are linked to this search without being downloaded again
+                with profile.span('db'):
+                    known = known_urls(article_links)
+                writer.link_existing(known, keyword_search_result)
+                article_links = [link for link in article_links if link not in known]
+                print(f"Skipping {len(known)} already stored articles")
+            if options['ingest'] == 'api' and options['extraction'] == 'static':
+                failed, browser_fallbacks = ingest_urls(fetcher, article_links, writer, keyword=keyword_obj,
+                                                        search_result=keyword_search_result)
+            else:
+                failed, browser_fallbacks = scrape_articles(fetcher, article_links, writer, options['extraction'],
+                                                            keyword=keyword_obj, search_result=keyword_search_result)
+            if failed:
+                self.stdout.write(self.style.ERROR(f"Failed to fetch {len(failed)} articles"))
+                record_failed_urls(failed, keyword_obj.pk, keyword_search_result.pk)
         except WebDriverException as e:
+            profile.error(type(e).__name__)
             self.stdout.write(self.style.ERROR(f"WebDriverException encountered: {e}"))
         except Exception as e:
+            profile.error(type(e).__name__)
             self.stdout.write(self.style.ERROR(f"An error occurred: {e}"))
         finally:
-            if driver:
-                driver.quit()
+            fetcher.close()
+            writer.flush()
+            self.stdout.write(f"Saved {writer.saved_count} articles ({writer.created_count} new, "
+                              f"{writer.skipped_count} skipped), browser fallback used for {browser_fallbacks}")
+            self.stdout.write(name_cache_summary())
+            self.stdout.write(fetcher.summary())
+            if fetcher.cache is not None:
+                self.stdout.write(fetcher.cache.summary())
+            profile_path = stop_profiler(profiler, f"scrape-{timezone.now():%Y%m%d-%H%M%S}")
+            profile.save('keyword', search_result=keyword_search_result, saved=writer.saved_count,
+                         created=writer.created_count, failed=len(failed), browser_fallbacks=browser_fallbacks,
+                         profile_path=profile_path)
+            self.stdout.write(profile.report())
+            if profile_path:
+                self.stdout.write(f"Profile written to {profile_path}")
@@ -0,0 +1,123 @@
+import html
+import json
+
+# Author, category and tags used to come from a second Chrome render of every article. The same
+# information is already in the static HTML (JSON-LD, <meta> tags, the server-rendered taxonomy
+# links) or in the WP REST `_embed` payload, so the browser is only needed when all of them are missing.
+
+ARTICLE_TYPES = {'Article', 'NewsArticle', 'BlogPosting', 'ReportageNewsArticle'}
+FIELDS = ('author', 'category', 'tags')
+
+
+def empty_metadata():
+    return {'author': None, 'category': None, 'tags': None}
+
+
+def merge_metadata(*sources):
+    # Earlier sources win, later ones only fill the gaps
+    merged = empty_metadata()
+    for source in sources:
+        for field in FIELDS:
+            if merged[field] is None and source.get(field) is not None:
+                merged[field] = source[field]
+    return merged
+
+
+def is_complete(metadata):
+    return all(metadata[field] is not None for field in FIELDS)
+
+
+def extract_metadata(document):
+    # `document` is a parsed page from scraper.parsing.make_document
+    return merge_metadata(_from_json_ld(document), _from_meta_tags(document), _from_markup(document))
+
+
+def extract_embed_metadata(item):
+    # `item` is one post from a wp-json response requested with `_embed=true`
+    metadata = empty_metadata()
+    embedded = item.get('_embedded') or {}
+    authors = [author.get('name') for author in embedded.get('author', []) if author.get('name')]
+    if authors:
+        metadata['author'] = _clean(authors[0])
+    terms = [term for group in embedded.get('wp:term', []) for term in group]
+    categories = [_clean(term['name']) for term in terms if term.get('taxonomy') == 'category' and term.get('name')]
+    if categories:
+        metadata['category'] = categories[0]
+    if 'wp:term' in embedded:
+        metadata['tags'] = [_clean(term['name']) for term in terms
+                            if term.get('taxonomy') == 'post_tag' and term.get('name')]
+    return metadata
+
+
+def _clean(value):
+    return html.unescape(value).strip()
+
+
+def _from_json_ld(document):
+    metadata = empty_metadata()
+    nodes = []
+    for script in document.texts('script[type="application/ld+json"]'):
+        try:
+            data = json.loads(script)
+        except ValueError:
+            continue
+        for node in data if isinstance(data, list) else [data]:
+            if isinstance(node, dict):
+                nodes.extend(node.get('@graph', [node]))
+    by_id = {node['@id']: node for node in nodes if isinstance(node, dict) and '@id' in node}
+
+    for node in nodes:
+        if not isinstance(node, dict):
+            continue
+        types = node.get('@type')
+        types = set(types) if isinstance(types, list) else {types}
+        if not types & ARTICLE_TYPES:
+            continue
+        author = node.get('author')
+        if isinstance(author, list):
+            author = author[0] if author else None
+        if isinstance(author, dict):
+            author = by_id.get(author.get('@id'), author).get('name')
+        if author:
+            metadata['author'] = _clean(author)
+        section = node.get('articleSection')
+        if isinstance(section, list):
+            section = section[0] if section else None
+        if section:
+            metadata['category'] = _clean(section)
+        keywords = node.get('keywords')
+        if isinstance(keywords, str):
+            keywords = keywords.split(',')
+        if keywords is not None:
+            metadata['tags'] = [_clean(keyword) for keyword in keywords if keyword.strip()]
+        break
+    return metadata
+
+
+def _from_meta_tags(document):
+    metadata = empty_metadata()
+
+    def content(selector):
+        value = document.attr(selector, 'content')
+        return _clean(value) if value else None
+
+    author = content('meta[name="author"]') or content('meta[name="parsely-author"]')
+    if author and not author.startswith('http'):
+        metadata['author'] = author
+    metadata['category'] = content('meta[property="article:section"]') or content('meta[name="parsely-section"]')
+    tags = [_clean(tag) for tag in document.attrs('meta[property="article:tag"]', 'content') if tag]
+    if tags:
+        metadata['tags'] = tags
+    elif content('meta[name="parsely-tags"]'):
+        metadata['tags'] = [tag.strip() for tag in content('meta[name="parsely-tags"]').split(',') if tag.strip()]
+    return metadata
+
+
+def _from_markup(document):
+    # The same selectors the Chrome pass used, when the blocks are server-rendered
+    metadata = empty_metadata()
+    metadata['author'] = document.text('div.wp-block-tc23-author-card-name > a') or None
+    metadata['category'] = document.text('a.is-taxonomy-category') or None
+    if document.exists('div.taxonomy-post_tag.wp-block-post-terms'):
+        metadata['tags'] = document.texts('div.taxonomy-post_tag.wp-block-post-terms a')
+    return metadata
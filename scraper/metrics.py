@@ -0,0 +1,75 @@
+"""
+Prometheus metrics for the scraper, the Celery tasks and the exports.
+
+The web app serves them on /scraper/metrics/ and every Celery worker on SCRAPER_METRICS_PORT. Celery
+and gunicorn fork their worker processes, so both should run with PROMETHEUS_MULTIPROC_DIR pointing
+at an empty directory; the values of every process are then added up when the metrics are scraped.
+"""
+
+import os
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, multiprocess, start_http_server
+
+# Article pages usually take 100ms-2s; slow hosts and the WebDriver fallback push into the tens of seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TASK_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+FETCH_SECONDS = Histogram('scraper_fetch_duration_seconds', 'HTTP request latency', ['host', 'status'],
+                          buckets=LATENCY_BUCKETS)
+FETCH_RETRIES = Counter('scraper_fetch_retries_total', 'Requests sent again after a failure', ['host', 'reason'])
+FETCH_SHED = Counter('scraper_fetch_shed_total', 'Requests refused because the circuit was open', ['host'])
+PARSE_SECONDS = Histogram('scraper_parse_duration_seconds', 'Time to parse one article', ['backend'],
+                          buckets=LATENCY_BUCKETS)
+FLUSH_SECONDS = Histogram('scraper_db_flush_duration_seconds', 'Time to write one batch of articles',
+                          buckets=LATENCY_BUCKETS)
+ARTICLES_WRITTEN = Counter('scraper_articles_written_total', 'Articles written to the database', ['result'])
+PAGE_LOAD_SECONDS = Histogram('scraper_webdriver_page_load_seconds', 'Time to render an article in Chrome',
+                              ['outcome'], buckets=LATENCY_BUCKETS)
+TASK_QUEUE_SECONDS = Histogram('scraper_task_queue_wait_seconds', 'Time a Celery task waited in the queue',
+                               ['task'], buckets=TASK_BUCKETS)
+TASK_SECONDS = Histogram('scraper_task_duration_seconds', 'Celery task runtime', ['task', 'state'],
+                         buckets=TASK_BUCKETS)
+EXPORT_ROWS = Counter('scraper_export_rows_total', 'Articles written to export files', ['format'])
+EXPORT_BYTES = Counter('scraper_export_bytes_total', 'Size of the finished export files', ['format'])
+EXPORT_SECONDS = Histogram('scraper_export_duration_seconds', 'Time to build one export file', ['format', 'status'],
+                           buckets=TASK_BUCKETS)
+
+_task_started = {}
+
+
+def registry():
+    # The metrics of every process when running in multiprocess mode, otherwise just this one's
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    collector = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector)
+    return collector
+
+
+def start_worker_server(port):
+    start_http_server(port, registry=registry())
+
+
+def mark_process_dead(pid):
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def stamp_published(headers=None, **kwargs):
+    # before_task_publish handler; the timestamp travels with the message to measure queue wait
+    if headers is not None:
+        headers['published_at'] = time.time()
+
+
+def task_started(task_id=None, task=None, **kwargs):
+    published_at = task.request.get('published_at')
+    if published_at:
+        TASK_QUEUE_SECONDS.labels(task.name).observe(max(time.time() - published_at, 0))
+    _task_started[task_id] = time.perf_counter()
+
+
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_SECONDS.labels(task.name, state or 'UNKNOWN').observe(time.perf_counter() - started)
@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-18 16:02
+
+from django.db import migrations, models
+import hashlib
+
+
+def backfill_content_hash(apps, schema_editor):
+    # Same normalisation as scraper.parsing.content_fingerprint. Existing rows never stored their
+    # source URL, so `url` stays NULL until a scrape matches them again by title.
+    Article = apps.get_model('scraper', 'Article')
+    batch = []
+    for article in Article.objects.only('id', 'content').iterator(chunk_size=1000):
+        normalized = ' '.join(article.content.split())
+        article.content_hash = hashlib.sha256(normalized.encode('utf-8')).hexdigest() if normalized else ''
+        batch.append(article)
+        if len(batch) >= 1000:
+            Article.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    Article.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0005_alter_article_keyword'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='url',
+            field=models.URLField(blank=True, max_length=1024, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-18 16:04
+
+from django.db import migrations, models
+
+
+def seed_category_feeds(apps, schema_editor):
+    # The feeds that used to be hardcoded in scrape_categories_techcrunch
+    CategoryFeed = apps.get_model('scraper', 'CategoryFeed')
+    for wp_category_id, name in [(577047203, 'AI'), (577051039, 'Apps'), (577030454, 'Biotech & Health')]:
+        CategoryFeed.objects.get_or_create(wp_category_id=wp_category_id, defaults={'name': name})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0006_article_url_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryFeed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('wp_category_id', models.BigIntegerField(unique=True)),
+                ('enabled', models.BooleanField(default=True)),
+                ('last_post_id', models.BigIntegerField(blank=True, null=True)),
+                ('last_post_date', models.DateTimeField(blank=True, null=True)),
+                ('etag', models.CharField(blank=True, default='', max_length=255)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(seed_category_feeds, migrations.RunPython.noop),
+    ]
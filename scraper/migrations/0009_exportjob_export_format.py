@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 16:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0008_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='export_format',
+            field=models.CharField(choices=[('zip', 'CSV + NDJSON (zip)'), ('ndjson.gz', 'NDJSON (gzip)'), ('ndjson.zst', 'NDJSON (zstd)'), ('parquet', 'Parquet')], default='zip', max_length=20),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2 on 2026-10-18 17:02
+
+from django.conf import settings
+from django.db import migrations
+
+# The SQL is a frozen copy of scraper/fulltext.py at the time, so later changes to that module
+# don't change what this migration does
+SQLITE_TABLE = 'scraper_article_fts'
+POSTGRES_TABLE = 'scraper_article_search'
+
+DOCUMENT_JOINS = """
+    FROM scraper_article a
+    JOIN scraper_author au ON au.id = a.author_id
+    LEFT JOIN scraper_articletag at ON at.article_id = a.id
+    LEFT JOIN scraper_tag t ON t.id = at.tag_id
+"""
+
+
+def create_fulltext_index(apps, schema_editor):
+    # FTS5 table on SQLite, tsvector + GIN on Postgres, filled with the existing articles
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} "
+                              f"USING fts5(title, content, tags, author, tokenize='porter unicode61')")
+        schema_editor.execute(
+            f"INSERT INTO {SQLITE_TABLE} (rowid, title, content, tags, author) "
+            f"SELECT a.id, a.title, a.content, COALESCE(GROUP_CONCAT(t.name, ' '), ''), au.name "
+            f"{DOCUMENT_JOINS} GROUP BY a.id, a.title, a.content, au.name")
+    elif vendor == 'postgresql':
+        schema_editor.execute(f"CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ("
+                              f"article_id bigint PRIMARY KEY REFERENCES scraper_article(id) ON DELETE CASCADE "
+                              f"DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)")
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document ON {POSTGRES_TABLE} "
+                              f"USING gin (document)")
+        config = settings.SCRAPER_FULLTEXT_CONFIG
+        schema_editor.execute(
+            f"INSERT INTO {POSTGRES_TABLE} (article_id, document) "
+            f"SELECT a.id, setweight(to_tsvector(%s::regconfig, a.title), 'A') "
+            f"|| setweight(to_tsvector(%s::regconfig, COALESCE(string_agg(t.name, ' '), '')), 'B') "
+            f"|| setweight(to_tsvector(%s::regconfig, au.name), 'B') "
+            f"|| setweight(to_tsvector(%s::regconfig, a.content), 'D') "
+            f"{DOCUMENT_JOINS} GROUP BY a.id, au.name "
+            f"ON CONFLICT (article_id) DO NOTHING",
+            [config, config, config, config])
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SQLITE_TABLE if vendor == 'sqlite' else POSTGRES_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0009_exportjob_export_format'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
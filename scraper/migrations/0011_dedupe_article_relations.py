@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-18 16:22
+
+from django.db import migrations
+from django.db.models import Min
+
+
+def remove_duplicate_relations(apps, schema_editor):
+    # Keeps the oldest row of every (article, tag) and (search result, article) pair before they become unique
+    for model_name, fields in [('ArticleTag', ('article_id', 'tag_id')),
+                               ('KeywordSearchResultItem', ('search_result_id', 'article_id'))]:
+        model = apps.get_model('scraper', model_name)
+        keep = model.objects.values(*fields).annotate(keep_id=Min('id')).values('keep_id')
+        model.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0010_article_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_relations, migrations.RunPython.noop),
+    ]
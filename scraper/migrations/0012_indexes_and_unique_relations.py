@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0011_dedupe_article_relations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['title', 'url'], name='article_title_url_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['publication_date'], name='article_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['created_at'], name='article_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['category', 'publication_date'], name='article_cat_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='articletag',
+            constraint=models.UniqueConstraint(fields=('article', 'tag'), name='unique_article_tag'),
+        ),
+        migrations.AddConstraint(
+            model_name='keywordsearchresultitem',
+            constraint=models.UniqueConstraint(fields=('search_result', 'article'), name='unique_search_result_article'),
+        ),
+    ]
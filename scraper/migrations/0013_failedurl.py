@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 16:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0012_indexes_and_unique_relations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FailedURL',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=1024, unique=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('failures', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_failed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('keyword', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='scraper.keyword')),
+                ('search_result', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='scraper.keywordsearchresult')),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-18 16:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0013_failedurl'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('keyword', 'Keyword search'), ('categories', 'Category feeds')], max_length=20)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField()),
+                ('duration', models.FloatField()),
+                ('articles_saved', models.PositiveIntegerField(default=0)),
+                ('articles_created', models.PositiveIntegerField(default=0)),
+                ('articles_failed', models.PositiveIntegerField(default=0)),
+                ('browser_fallbacks', models.PositiveIntegerField(default=0)),
+                ('stages', models.JSONField(default=dict)),
+                ('errors', models.JSONField(default=dict)),
+                ('slowest_urls', models.JSONField(default=list)),
+                ('profile_path', models.CharField(blank=True, default='', max_length=1024)),
+                ('keyword', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='scrape_runs', to='scraper.keyword')),
+                ('search_result', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='scraper.keywordsearchresult')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 17:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0014_scraperun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleURL',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=1024, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='scraper.article')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0015_articleurl'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='selection',
+            field=models.BinaryField(editable=False, null=True),
+        ),
+    ]
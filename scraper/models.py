@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 
@@ -18,6 +19,18 @@ class Category(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
 
+class CategoryFeed(models.Model):
+    # A wp-json/tc/v1/magazine category feed and how far the crawler has got through it
+    name = models.CharField(max_length=255)
+    wp_category_id = models.BigIntegerField(unique=True)
+    enabled = models.BooleanField(default=True)
+    last_post_id = models.BigIntegerField(null=True, blank=True)
+    last_post_date = models.DateTimeField(null=True, blank=True)
+    etag = models.CharField(max_length=255, blank=True, default='')
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
 class Author(models.Model):
     name = models.CharField(max_length=255, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -30,6 +43,8 @@ class Tag(models.Model):
 
 class Article(models.Model):
     title = models.CharField(max_length=255)
+    url = models.URLField(max_length=1024, unique=True, null=True, blank=True)  # Canonical source URL
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)  # SHA-256 of content
     author = models.ForeignKey(Author, on_delete=models.CASCADE)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     keyword = models.ForeignKey(Keyword, on_delete=models.CASCADE, null=True, blank=True)
@@ -39,14 +54,105 @@ class Article(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     tags = models.ManyToManyField(Tag, through='ArticleTag')
 
+    class Meta:
+        indexes = [
+            # Title lookups; with url second it also serves adopting legacy rows (url IS NULL) by title
+            models.Index(fields=['title', 'url'], name='article_title_url_idx'),
+            models.Index(fields=['publication_date'], name='article_pub_date_idx'),  # Admin sort and date filter
+            models.Index(fields=['created_at'], name='article_created_idx'),
+            models.Index(fields=['category', 'publication_date'], name='article_cat_pub_date_idx'),
+        ]
+
+
+class ArticleURL(models.Model):
+    # Another URL the same story was published under, matched on its content fingerprint
+    url = models.URLField(max_length=1024, unique=True)
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='aliases')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class ExportJob(models.Model):
+    # One zip of the admin export actions, built by export_articles_task on the Celery worker
+    STATUS_CHOICES = [('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')]
+    GROUP_CHOICES = [('category', 'Category'), ('keyword', 'Keyword')]
+    FORMAT_CHOICES = [('zip', 'CSV + NDJSON (zip)'), ('ndjson.gz', 'NDJSON (gzip)'), ('ndjson.zst', 'NDJSON (zstd)'),
+                      ('parquet', 'Parquet')]
+
+    batch = models.UUIDField(db_index=True)  # Jobs started by the same admin action
+    group_by = models.CharField(max_length=20, choices=GROUP_CHOICES)
+    export_format = models.CharField(max_length=20, choices=FORMAT_CHOICES, default='zip')
+    name = models.CharField(max_length=255)
+    # Pickled Query of the admin selection; the worker reads this job's group from it in chunks
+    selection = models.BinaryField(null=True, editable=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    total_rows = models.PositiveIntegerField(default=0)
+    rows_done = models.PositiveIntegerField(default=0)
+    bytes_written = models.BigIntegerField(default=0)
+    filename = models.CharField(max_length=255, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def duration(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+
+class ScrapeRun(models.Model):
+    # Where the time of one keyword or category scrape went, stage by stage
+    SOURCE_CHOICES = [('keyword', 'Keyword search'), ('categories', 'Category feeds')]
+
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    keyword = models.ForeignKey(Keyword, on_delete=models.CASCADE, null=True, blank=True, related_name='scrape_runs')
+    search_result = models.ForeignKey(KeywordSearchResult, on_delete=models.SET_NULL, null=True, blank=True)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField()
+    duration = models.FloatField()  # Seconds
+    articles_saved = models.PositiveIntegerField(default=0)
+    articles_created = models.PositiveIntegerField(default=0)
+    articles_failed = models.PositiveIntegerField(default=0)
+    browser_fallbacks = models.PositiveIntegerField(default=0)
+    stages = models.JSONField(default=dict)  # {stage: {'seconds': ..., 'count': ...}}
+    errors = models.JSONField(default=dict)  # {error kind: count}
+    slowest_urls = models.JSONField(default=list)  # [[url, seconds], ...], slowest first
+    profile_path = models.CharField(max_length=1024, blank=True, default='')
+
+    def stage_summary(self):
+        stages = sorted(self.stages.items(), key=lambda item: -item[1]['seconds'])
+        return ', '.join(f"{stage} {totals['seconds']:.1f}s" for stage, totals in stages)
+
+
+class FailedURL(models.Model):
+    # Dead letter for article URLs that still failed after every retry; rerun with retry_failed_urls
+    url = models.URLField(max_length=1024, unique=True)
+    keyword = models.ForeignKey(Keyword, on_delete=models.SET_NULL, null=True, blank=True)
+    search_result = models.ForeignKey(KeywordSearchResult, on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    failures = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_failed_at = models.DateTimeField(default=timezone.now)
+
 
 class KeywordSearchResultItem(models.Model):
     search_result = models.ForeignKey(KeywordSearchResult, on_delete=models.CASCADE, related_name='items')
     article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='keyword_items')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['search_result', 'article'], name='unique_search_result_article'),
+        ]
+
 
 class ArticleTag(models.Model):
     article = models.ForeignKey(Article, on_delete=models.CASCADE)
     tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['article', 'tag'], name='unique_article_tag'),
+        ]
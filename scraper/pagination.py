@@ -0,0 +1,108 @@
+import math
+import re
+from urllib.parse import urlencode
+
+from django.conf import settings
+
+from .parsing import canonical_url, make_document
+
+RESULT_COUNT_PATTERN = re.compile(r'([\d,]+)\s+(?:search\s+)?results', re.IGNORECASE)
+
+
+def parse_result_count(document):
+    # search.techcrunch.com prints e.g. "11-20 of 1,234 results" above the pagination links
+    for text in document.texts('.compPagination span') + document.texts('.compTitle, .searchCenterTop'):
+        match = RESULT_COUNT_PATTERN.search(text)
+        if match:
+            return int(match.group(1).replace(',', ''))
+    return None
+
+
+class SearchPaginator:
+    """
+    Walks search.techcrunch.com result pages for a search term.
+
+    The first page gives an estimate of the number of pages; the rest are fetched concurrently in
+    windows of `window` pages, stopping at the first page that comes back without results. A page
+    that can't be fetched also stops the walk, but lands in `failed_pages` so the results are not
+    mistaken for complete.
+    """
+
+    def __init__(self, fetcher, search_term, page_size=None, window=None, max_pages=None):
+        self.fetcher = fetcher
+        self.search_term = search_term
+        self.page_size = page_size or settings.SCRAPER_SEARCH_PAGE_SIZE
+        self.window = window or settings.SCRAPER_SEARCH_WINDOW
+        self.max_pages = max_pages or settings.SCRAPER_SEARCH_MAX_PAGES
+        self.pages_fetched = 0
+        self.estimated_pages = None
+        self.failed_pages = {}  # {url: error}
+
+    @property
+    def complete(self):
+        return not self.failed_pages
+
+    def page_url(self, page_number):
+        params = urlencode({'p': self.search_term, 'pz': self.page_size, 'fr': 'techcrunch', 'bct': 0,
+                            'b': (page_number - 1) * self.page_size + 1})
+        return f"{settings.SCRAPER_SEARCH_URL}?{params}"
+
+    def links(self):
+        # Every article link across all result pages, deduplicated in result order
+        seen = {}
+        for page_number, links in self.pages():
+            print(f"Page {page_number}: {len(links)} results")
+            for link in links:
+                seen.setdefault(canonical_url(link), None)
+        return list(seen)
+
+    def pages(self):
+        first = self._fetch([1])[0]
+        if first is None or not first[1]:
+            self._stop(1, first)
+            return
+        document, links = first
+        yield 1, links
+        total = parse_result_count(document)
+        if total is not None:
+            self.estimated_pages = min(self.max_pages, max(1, math.ceil(total / self.page_size)))
+            print(f"About {total} results, {self.estimated_pages} pages")
+
+        short_page = len(links) < self.page_size
+        next_page = 2
+        while next_page <= self.max_pages:
+            within_estimate = self.estimated_pages is not None and next_page <= self.estimated_pages
+            if self.estimated_pages is not None and not within_estimate and short_page:
+                return  # The estimated last page wasn't full, so there is nothing left to probe
+            # Don't request past the estimate; if it turns out to be low, keep probing a window at a time
+            last = min(next_page + self.window - 1, self.max_pages)
+            if within_estimate:
+                last = min(last, self.estimated_pages)
+            numbers = list(range(next_page, last + 1))
+            for number, page in zip(numbers, self._fetch(numbers)):
+                if page is None or not page[1]:
+                    self._stop(number, page)
+                    return
+                yield number, page[1]
+                short_page = len(page[1]) < self.page_size
+            next_page = last + 1
+
+    def _stop(self, page_number, page):
+        if page is None:
+            print(f"Stopped at page {page_number}, which could not be fetched; the results are incomplete")
+        else:
+            print("No more data to fetch.")
+
+    def _fetch(self, page_numbers):
+        # Returns (document, links) per page, links empty past the last result, or None for a failed page
+        results = []
+        for response in self.fetcher.fetch_many([self.page_url(number) for number in page_numbers]):
+            self.pages_fetched += 1
+            if not response.ok:
+                print(f"Failed to fetch {response.url}: {response.error or response.status}")
+                self.failed_pages[response.url] = str(response.error or f"HTTP {response.status}")
+                results.append(None)
+                continue
+            document = make_document(response.content)
+            results.append((document, document.attrs('a.thmb', 'href')))
+        return results
@@ -0,0 +1,206 @@
+from datetime import datetime
+from html import unescape
+from urllib.parse import urlsplit, urlunsplit
+from typing import NamedTuple, Optional, Tuple
+
+import hashlib
+import pytz
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .metadata import extract_embed_metadata, extract_metadata, is_complete, merge_metadata
+
+
+class ArticleRecord(NamedTuple):
+    url: str
+    title: Optional[str]
+    publication_date: Optional[datetime]
+    content: str
+    image_url: Optional[str]
+    author: Optional[str]
+    category: Optional[str]
+    tags: Optional[Tuple[str, ...]]
+
+    @property
+    def metadata(self):
+        return {'author': self.author, 'category': self.category, 'tags': self.tags}
+
+    def with_metadata(self, *sources):
+        # Fills author, category and tags that are still missing from other sources (feed payload, browser)
+        merged = merge_metadata(self.metadata, *sources)
+        tags = tuple(merged['tags']) if merged['tags'] is not None else None
+        return self._replace(author=merged['author'], category=merged['category'], tags=tags)
+
+
+# Each backend wraps one parsed tree and answers the handful of queries the extractors need, so a
+# page is parsed exactly once no matter how many fields are read from it.
+
+class SoupDocument:
+    def __init__(self, html):
+        from bs4 import BeautifulSoup
+        self.tree = BeautifulSoup(html, 'html.parser')
+
+    def exists(self, selector):
+        return self.tree.select_one(selector) is not None
+
+    def text(self, selector):
+        element = self.tree.select_one(selector)
+        return element.get_text().strip() if element is not None else None
+
+    def texts(self, selector):
+        return [element.get_text().strip() for element in self.tree.select(selector)]
+
+    def attr(self, selector, name):
+        element = self.tree.select_one(selector)
+        return element.get(name) if element is not None else None
+
+    def attrs(self, selector, name):
+        return [element.get(name) for element in self.tree.select(selector) if element.get(name) is not None]
+
+
+class LxmlDocument:
+    _selectors = {}
+
+    def __init__(self, html):
+        import lxml.html
+        self.tree = lxml.html.document_fromstring(html) if html else None
+
+    @classmethod
+    def _compile(cls, selector):
+        # cssselect translates to XPath once per selector rather than once per call
+        compiled = cls._selectors.get(selector)
+        if compiled is None:
+            from lxml.cssselect import CSSSelector
+            compiled = cls._selectors[selector] = CSSSelector(selector)
+        return compiled
+
+    def _select(self, selector):
+        return self._compile(selector)(self.tree) if self.tree is not None else []
+
+    def exists(self, selector):
+        return bool(self._select(selector))
+
+    def text(self, selector):
+        elements = self._select(selector)
+        return elements[0].text_content().strip() if elements else None
+
+    def texts(self, selector):
+        return [element.text_content().strip() for element in self._select(selector)]
+
+    def attr(self, selector, name):
+        elements = self._select(selector)
+        return elements[0].get(name) if elements else None
+
+    def attrs(self, selector, name):
+        return [element.get(name) for element in self._select(selector) if element.get(name) is not None]
+
+
+class SelectolaxDocument:
+    def __init__(self, html):
+        from selectolax.lexbor import LexborHTMLParser
+        self.tree = LexborHTMLParser(html)
+
+    def exists(self, selector):
+        return self.tree.css_first(selector) is not None
+
+    def text(self, selector):
+        node = self.tree.css_first(selector)
+        return node.text().strip() if node is not None else None
+
+    def texts(self, selector):
+        return [node.text().strip() for node in self.tree.css(selector)]
+
+    def attr(self, selector, name):
+        node = self.tree.css_first(selector)
+        return node.attributes.get(name) if node is not None else None
+
+    def attrs(self, selector, name):
+        return [node.attributes[name] for node in self.tree.css(selector) if node.attributes.get(name) is not None]
+
+
+BACKENDS = {
+    'html.parser': SoupDocument,
+    'lxml': LxmlDocument,
+    'selectolax': SelectolaxDocument,
+}
+
+
+def make_document(html, backend=None):
+    backend = backend or settings.SCRAPER_PARSER_BACKEND
+    try:
+        document_class = BACKENDS[backend]
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown SCRAPER_PARSER_BACKEND '{backend}', "
+                                   f"expected one of {', '.join(BACKENDS)}")
+    try:
+        return document_class(html)
+    except ImportError as e:
+        raise ImproperlyConfigured(f"Parser backend '{backend}' is not installed: {e}")
+
+
+def canonical_url(url):
+    # Articles are identified by their path, so tracking parameters and fragments are dropped
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', '', ''))
+
+
+def content_fingerprint(content):
+    normalized = ' '.join(content.split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest() if normalized else ''
+
+
+def parse_date(value):
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError as e:
+        print(f"Error parsing date {value}: {e}")
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=pytz.UTC)
+
+
+def parse_article(html, url, backend=None, static_metadata=True):
+    document = make_document(html, backend)
+    content = ' '.join(document.texts('.wp-block-post-content p'))
+    if not content:
+        print("Article content is empty. Check selector or page structure.")
+    record = ArticleRecord(
+        url=canonical_url(url),
+        title=document.text('h1.wp-block-post-title'),
+        publication_date=parse_date(document.attr('div.wp-block-post-date > time', 'datetime')),
+        content=content,
+        image_url=document.attr('figure.wp-block-post-featured-image > img', 'src'),
+        author=None,
+        category=None,
+        tags=None,
+    )
+    return record.with_metadata(extract_metadata(document)) if static_metadata else record
+
+
+def parse_post(item, backend=None):
+    """
+    Builds an ArticleRecord from one wp-json post requested with `_embed=true`.
+
+    Whatever the payload lacks stays None (or empty content), so the caller can fall back to the
+    article page for just those posts.
+    """
+    rendered = (item.get('content') or {}).get('rendered') or ''
+    title = (item.get('title') or {}).get('rendered')
+    media = (item.get('_embedded') or {}).get('wp:featuredmedia') or [{}]
+    record = ArticleRecord(
+        url=canonical_url(item['link']),
+        title=unescape(title).strip() or None if title else None,
+        publication_date=parse_date(item.get('date_gmt')),
+        content=' '.join(make_document(rendered, backend).texts('p')) if rendered else '',
+        image_url=media[0].get('source_url') or item.get('jetpack_featured_media_url') or None,
+        author=None,
+        category=None,
+        tags=None,
+    )
+    return record.with_metadata(extract_embed_metadata(item))
+
+
+def is_complete_record(record):
+    # Everything an Article needs, without downloading the page
+    return bool(record.title and record.publication_date and record.content) and is_complete(record.metadata)
@@ -0,0 +1,306 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import (Category, Author, Article, ArticleURL, Tag, ArticleTag, FailedURL, Keyword,
+                     KeywordSearchResultItem)
+from .fulltext import index_articles
+from .metrics import ARTICLES_WRITTEN, FLUSH_SECONDS
+from .parsing import content_fingerprint
+from .profiling import RunProfile
+
+
+class NameCache:
+    """
+    Bounded LRU of name -> id for one lookup table (authors, categories, tags or keywords).
+
+    Names missing from the cache are inserted with ignore_conflicts and read back in one query, so
+    parallel Celery tasks inserting the same name never fail. The cache lives for the whole worker
+    process, so after warm-up almost every name resolves without touching the database.
+    """
+
+    def __init__(self, model, field='name', max_size=None):
+        self.model = model
+        self.field = field
+        self.max_size = max_size or settings.SCRAPER_NAME_CACHE_SIZE
+        self.hits = 0
+        self.misses = 0
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, names):
+        ids = {}
+        missing = set()
+        with self._lock:
+            for name in names:
+                if name in self._ids:
+                    self._ids.move_to_end(name)
+                    ids[name] = self._ids[name]
+                    self.hits += 1
+                else:
+                    missing.add(name)
+            self.misses += len(missing)
+        if missing:
+            self.model.objects.bulk_create([self.model(**{self.field: name}) for name in missing],
+                                           ignore_conflicts=True)
+            found = dict(self.model.objects.filter(**{f"{self.field}__in": missing}).values_list(self.field, 'id'))
+            ids.update(found)
+            # Rows inserted by a batch that rolls back must not stay cached
+            transaction.on_commit(lambda: self._remember(found))
+        return ids
+
+    def _remember(self, ids):
+        with self._lock:
+            self._ids.update(ids)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+NAME_CACHES = {
+    'author': NameCache(Author),
+    'category': NameCache(Category),
+    'tag': NameCache(Tag),
+    'keyword': NameCache(Keyword, field='keyword'),
+}
+
+
+def clear_name_caches():
+    for cache in NAME_CACHES.values():
+        cache.clear()
+
+
+def reset_name_cache_stats():
+    # The ids stay cached across runs in a worker; the hit rates are reported per run
+    for cache in NAME_CACHES.values():
+        cache.reset_stats()
+
+
+def name_cache_summary():
+    return "Lookup cache hit rates: " + ", ".join(
+        f"{kind} {cache.hit_rate:.0%} ({cache.hits}/{cache.hits + cache.misses})" for kind, cache in NAME_CACHES.items())
+
+
+def resolve_keyword(search_term):
+    return Keyword(pk=NAME_CACHES['keyword'].resolve([search_term])[search_term], keyword=search_term)
+
+
+def stored_article_ids(urls):
+    # {url: article id}, including URLs stored as aliases of a story published under another URL
+    urls = list(urls)
+    ids = dict(ArticleURL.objects.filter(url__in=urls).values_list('url', 'article_id'))
+    ids.update(Article.objects.filter(url__in=urls).values_list('url', 'id'))
+    return ids
+
+
+def known_urls(urls):
+    return set(stored_article_ids(urls))
+
+
+def record_failed_urls(failed, keyword_id=None, search_result_id=None):
+    """
+    Adds {url: error} to the FailedURL dead letter, or bumps the failure count of URLs already in it.
+    """
+    if not failed:
+        return
+    now = timezone.now()
+    existing = list(FailedURL.objects.filter(url__in=list(failed)))
+    for row in existing:
+        row.error = failed[row.url]
+        row.failures += 1
+        row.last_failed_at = now
+        row.keyword_id = keyword_id or row.keyword_id
+        row.search_result_id = search_result_id or row.search_result_id
+    FailedURL.objects.bulk_update(existing, ['error', 'failures', 'last_failed_at', 'keyword', 'search_result'])
+    seen = {row.url for row in existing}
+    FailedURL.objects.bulk_create([
+        FailedURL(url=url, error=error, keyword_id=keyword_id, search_result_id=search_result_id, last_failed_at=now)
+        for url, error in failed.items() if url not in seen
+    ], ignore_conflicts=True)
+
+
+def resolve_failed_urls(urls):
+    FailedURL.objects.filter(url__in=list(urls)).delete()
+
+
+class ArticleWriter:
+    """
+    Buffers parsed ArticleRecords and writes them in one transaction per batch.
+
+    Each flush costs a fixed number of bulk queries regardless of how many articles, authors,
+    categories and tags it contains, instead of six or more get_or_create round trips per article.
+    """
+
+    REFRESH_FIELDS = ['title', 'author', 'category', 'publication_date', 'content', 'image_url', 'content_hash']
+
+    def __init__(self, batch_size=None, flush_interval=None, refresh=False, profile=None):
+        self.refresh = refresh
+        self.profile = profile or RunProfile()
+        self.batch_size = batch_size or settings.SCRAPER_WRITE_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.SCRAPER_WRITE_FLUSH_INTERVAL
+        self.saved_count = 0
+        self.created_count = 0
+        self.skipped_count = 0
+        self._buffer = []
+        self._buffered_since = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        # Articles parsed before an error are still worth keeping
+        self.flush()
+
+    def add(self, record, keyword=None, search_result=None):
+        if record.publication_date is None:
+            print(f"Skipping {record.url}: no publication date")
+            self.skipped_count += 1
+            ARTICLES_WRITTEN.labels('skipped').inc()
+            return
+        if not self._buffer:
+            self._buffered_since = time.monotonic()
+        self._buffer.append((record, keyword, search_result))
+        if len(self._buffer) >= self.batch_size or time.monotonic() - self._buffered_since >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        entries, self._buffer = self._buffer, []
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                created = self._write(entries)
+        except IntegrityError:
+            # A cached id goes stale when its row is deleted, e.g. in the admin
+            clear_name_caches()
+            with transaction.atomic():
+                created = self._write(entries)
+        FLUSH_SECONDS.observe(time.perf_counter() - started)
+        self.profile.add('db', time.perf_counter() - started, len(entries))
+        ARTICLES_WRITTEN.labels('created').inc(created)
+        ARTICLES_WRITTEN.labels('updated').inc(len(entries) - created)
+        self.saved_count += len(entries)
+        self.created_count += created
+        print(f"Saved {len(entries)} articles ({created} new)")
+
+    def _write(self, entries):
+        records = [record for record, _, _ in entries]
+        category_ids = NAME_CACHES['category'].resolve({self._category(record) for record in records})
+        author_ids = NAME_CACHES['author'].resolve({self._author(record) for record in records})
+        tag_ids = NAME_CACHES['tag'].resolve({tag for record in records for tag in record.tags or ()})
+
+        urls = {record.url for record in records}
+        hashes = {content_fingerprint(record.content) for record in records} - {''}
+        titles = {self._title(record) for record in records}
+        article_ids = dict(Article.objects.filter(url__in=urls).values_list('url', 'id'))
+        alias_ids = dict(ArticleURL.objects.filter(url__in=urls).values_list('url', 'article_id'))
+        # The same story republished under another URL is matched on its content fingerprint
+        duplicate_ids = dict(Article.objects.filter(content_hash__in=hashes).values_list('content_hash', 'id'))
+        # Rows saved before URLs were stored are adopted by title instead of being duplicated
+        legacy_ids = dict(Article.objects.filter(url__isnull=True, title__in=titles).values_list('title', 'id'))
+
+        articles = {}
+        adopted = []
+        aliases = {}  # URL -> id of the article it republishes
+        batch_aliases = {}  # URL -> URL of an article with the same content inserted by this batch
+        batch_hashes = {}
+        for record, keyword, _ in entries:
+            if record.url in articles or record.url in aliases or record.url in batch_aliases:
+                continue
+            if record.url in alias_ids:
+                article_ids[record.url] = alias_ids[record.url]
+                continue
+            content_hash = content_fingerprint(record.content)
+            if record.url in article_ids and not self.refresh:
+                continue
+            if record.url not in article_ids and content_hash in duplicate_ids:
+                article_ids[record.url] = aliases[record.url] = duplicate_ids[content_hash]
+                continue
+            if record.url not in article_ids and content_hash in batch_hashes:
+                batch_aliases[record.url] = batch_hashes[content_hash]
+                continue
+            if record.url not in article_ids and self._title(record) in legacy_ids:
+                article_id = legacy_ids.pop(self._title(record))
+                article_ids[record.url] = article_id
+                adopted.append(Article(pk=article_id, url=record.url, content_hash=content_hash))
+                continue
+            articles[record.url] = (record, Article(
+                url=record.url,
+                content_hash=content_hash,
+                title=self._title(record),
+                author_id=author_ids[self._author(record)],
+                category_id=category_ids[self._category(record)],
+                keyword=keyword,
+                publication_date=record.publication_date,
+                content=record.content,
+                image_url=record.image_url or "Image URL not found",
+            ))
+            if content_hash:
+                batch_hashes.setdefault(content_hash, record.url)
+
+        created = sum(1 for url in articles if url not in article_ids)
+        if self.refresh:
+            Article.objects.bulk_create([article for _, article in articles.values()], update_conflicts=True,
+                                        unique_fields=['url'], update_fields=self.REFRESH_FIELDS)
+        else:
+            # ignore_conflicts covers another worker inserting the same URL since the lookup above
+            Article.objects.bulk_create([article for _, article in articles.values()], ignore_conflicts=True)
+        Article.objects.bulk_update(adopted, ['url', 'content_hash'])
+        if articles:
+            article_ids.update(Article.objects.filter(url__in=articles).values_list('url', 'id'))
+        for url, original in batch_aliases.items():
+            if original in article_ids:
+                article_ids[url] = aliases[url] = article_ids[original]
+        # Stored so known_urls() skips the alias next time instead of downloading it again
+        ArticleURL.objects.bulk_create([ArticleURL(url=url, article_id=article_id)
+                                        for url, article_id in aliases.items()], ignore_conflicts=True)
+
+        # Tags a refreshed article already has are skipped by the unique (article, tag) constraint
+        ArticleTag.objects.bulk_create([
+            ArticleTag(article_id=article_ids[url], tag_id=tag_ids[tag])
+            for url, (record, _) in articles.items() for tag in set(record.tags or ())
+        ], ignore_conflicts=True)
+        # Keep the full-text index in step with the rows and tags just written, and with adopted legacy rows
+        index_articles([article_ids[url] for url in articles] + [article.pk for article in adopted])
+        KeywordSearchResultItem.objects.bulk_create([
+            KeywordSearchResultItem(search_result=search_result, article_id=article_ids[record.url])
+            for record, _, search_result in entries if search_result is not None and record.url in article_ids
+        ], ignore_conflicts=True)
+        return created
+
+    def link_existing(self, urls, search_result):
+        # Articles skipped because they are already stored still belong to this search result
+        with self.profile.span('db'):
+            KeywordSearchResultItem.objects.bulk_create([
+                KeywordSearchResultItem(search_result=search_result, article_id=article_id)
+                for article_id in set(stored_article_ids(urls).values())
+            ], ignore_conflicts=True)
+
+    @staticmethod
+    def _title(record):
+        return record.title or "Title not found"
+
+    @staticmethod
+    def _author(record):
+        return record.author or "Author not found"
+
+    @staticmethod
+    def _category(record):
+        return record.category or "Category not found"
@@ -0,0 +1,199 @@
+import json
+import time
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from selenium.common.exceptions import TimeoutException
+
+from .browser import PoolExhaustedError, get_pool, scrape_metadata
+from .metadata import is_complete
+from .metrics import PARSE_SECONDS
+from .models import Keyword, KeywordSearchResult
+from .parsing import canonical_url, is_complete_record, parse_article, parse_post
+from .persistence import known_urls, record_failed_urls, resolve_failed_urls
+from .retry import CircuitOpenError, error_class, is_transient
+
+
+class FailedArticles(dict):
+    """
+    {url: error} for the articles a scrape could not save.
+
+    URLs in `transient` failed on timeouts, connection errors, 5xx, 429s, open circuits or Chrome
+    and are worth retrying; the rest (404s, 410s, ...) are not.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.transient = set()
+
+    def add(self, url, error, transient):
+        self[url] = error
+        if transient:
+            self.transient.add(url)
+
+    def update(self, other):
+        super().update(other)
+        self.transient.update(getattr(other, 'transient', ()))
+
+    def permanent(self):
+        return {url: error for url, error in self.items() if url not in self.transient}
+
+
+def scrape_articles(fetcher, urls, writer, extraction='static', keyword=None, search_result=None,
+                    embedded_metadata=None):
+    """
+    Downloads and parses `urls` and hands every article to `writer`.
+
+    Shared by the scrape commands and the Celery chunk tasks. Returns the FailedArticles that could
+    not be downloaded or rendered, so the caller can retry just the transient ones, and how many
+    articles needed Chrome. Stage timings go to the writer's RunProfile.
+    """
+    profile = writer.profile
+    failed = FailedArticles()
+    browser_fallbacks = 0
+    for response in profile.timed(fetcher.iter_fetch(urls), 'fetch'):
+        url = response.url
+        print(url)
+        if not response.ok:
+            print(f"Failed to fetch {url}: {response.error or response.status}")
+            failed.add(url, str(response.error or f"HTTP {response.status}"), is_transient(response))
+            profile.error('circuit_open' if isinstance(response.error, CircuitOpenError)
+                          else error_class(response) or f"http_{response.status}")
+            continue
+        started = time.perf_counter()
+        with profile.span('parse'):
+            record = parse_article(response.content, url, static_metadata=extraction == 'static')
+        PARSE_SECONDS.labels(settings.SCRAPER_PARSER_BACKEND).observe(time.perf_counter() - started)
+        if extraction == 'static' and embedded_metadata:
+            record = record.with_metadata(embedded_metadata.get(url, {}))
+        # Chrome is only used when the static sources are missing author, category or tags
+        if not is_complete(record.metadata):
+            browser_fallbacks += 1
+            try:
+                with profile.span('browser'), get_pool().lease() as driver:
+                    record = record.with_metadata(scrape_metadata(driver, url))
+            except PoolExhaustedError:
+                print(f"No Chrome session free to render {url}")
+                failed.add(url, 'No WebDriver became available in the pool', transient=True)
+                profile.error('browser_pool_exhausted')
+                continue
+            except TimeoutException:
+                print(f"Failed to render {url} in Chrome")
+                failed.add(url, 'Timed out rendering the article in Chrome', transient=True)
+                profile.error('browser_timeout')
+                continue
+        # Request, parsing and rendering; the write is batched with other articles
+        profile.article(url, response.elapsed + time.perf_counter() - started)
+        print(f'Parsed article: {record.title}')
+        writer.add(record, keyword=keyword, search_result=search_result)
+    return failed, browser_fallbacks
+
+
+def ingest_posts(fetcher, posts, writer, keyword=None, search_result=None):
+    """
+    Builds articles straight from wp-json posts requested with `_embed=true`, with no page downloads.
+
+    Posts whose payload lacks the title, date, content, author, category or tags go through
+    `scrape_articles` instead, keeping whatever metadata the payload did have. Returns what
+    `scrape_articles` returns plus how many articles came from the payload alone.
+    """
+    profile = writer.profile
+    fallback = {}
+    from_payload = 0
+    for post in posts:
+        started = time.perf_counter()
+        with profile.span('parse'):
+            record = parse_post(post)
+        PARSE_SECONDS.labels(settings.SCRAPER_PARSER_BACKEND).observe(time.perf_counter() - started)
+        if not is_complete_record(record):
+            fallback[record.url] = record.metadata
+            continue
+        profile.article(record.url, time.perf_counter() - started)
+        writer.add(record, keyword=keyword, search_result=search_result)
+        from_payload += 1
+    if fallback:
+        print(f"Downloading {len(fallback)} articles the payload is incomplete for")
+    failed, browser_fallbacks = scrape_articles(fetcher, list(fallback), writer, keyword=keyword,
+                                                search_result=search_result, embedded_metadata=fallback)
+    return failed, browser_fallbacks, from_payload
+
+
+def resolve_posts(fetcher, urls):
+    """
+    Looks the articles at `urls` up on the wp-json posts endpoint by slug, in batches of
+    SCRAPER_WP_POSTS_BATCH_SIZE.
+
+    Returns the `_embed` posts found, in the order of `urls`, and the URLs without a post (batches
+    that failed included), for the caller to download as HTML.
+    """
+    # TechCrunch permalinks end in the post slug; the post id isn't known until the post is found
+    slugs = list(dict.fromkeys(filter(None, (urlsplit(url).path.rstrip('/').rsplit('/', 1)[-1] for url in urls))))
+    batch_size = min(settings.SCRAPER_WP_POSTS_BATCH_SIZE, 100)
+    requests = []
+    for start in range(0, len(slugs), batch_size):
+        params = urlencode({'slug': ','.join(slugs[start:start + batch_size]), 'per_page': 100, '_embed': 'true'})
+        requests.append(f"{settings.SCRAPER_WP_POSTS_URL}?{params}")
+    found = {}
+    for response in fetcher.iter_fetch(requests):
+        if not response.ok:
+            print(f"Failed to resolve posts: {response.error or response.status}")
+            continue
+        try:
+            posts = json.loads(response.content)
+        except ValueError:
+            print(f"Failed to resolve posts: {response.url} did not return JSON")
+            continue
+        for post in posts if isinstance(posts, list) else []:
+            if isinstance(post, dict) and post.get('link'):
+                found[canonical_url(post['link'])] = post
+    return [found[url] for url in urls if url in found], [url for url in urls if url not in found]
+
+
+def ingest_urls(fetcher, urls, writer, keyword=None, search_result=None):
+    """
+    Saves the articles at `urls` from their wp-json posts, a few requests per hundred articles.
+
+    Only URLs without a post, or whose post is incomplete, are downloaded as HTML. Returns what
+    `scrape_articles` returns.
+    """
+    with writer.profile.span('resolve'):
+        posts, misses = resolve_posts(fetcher, urls)
+    print(f"Resolved {len(posts)} of {len(urls)} articles through wp-json")
+    failed, browser_fallbacks, _ = ingest_posts(fetcher, posts, writer, keyword=keyword, search_result=search_result)
+    missed, missed_fallbacks = scrape_articles(fetcher, misses, writer, keyword=keyword, search_result=search_result)
+    failed.update(missed)
+    return failed, browser_fallbacks + missed_fallbacks
+
+
+def retry_failed_urls(fetcher, failed_urls, writer, extraction='static'):
+    """
+    Scrapes FailedURL rows again, linked to the keyword search they originally came from.
+
+    URLs whose article is now stored, by this retry or another scrape in the meantime, leave the
+    dead letter; the rest, including pages that still have no publication date, stay in it with
+    their failure count bumped. Returns (recovered, still_failed).
+    """
+    failed_urls = list(failed_urls)
+    stored = known_urls([row.url for row in failed_urls])
+    groups = {}
+    for row in failed_urls:
+        if row.url not in stored:
+            groups.setdefault((row.keyword_id, row.search_result_id), []).append(row.url)
+    failures = {}
+    for (keyword_id, search_result_id), urls in groups.items():
+        keyword = Keyword(pk=keyword_id) if keyword_id else None
+        search_result = KeywordSearchResult(pk=search_result_id) if search_result_id else None
+        failures[keyword_id, search_result_id], _ = scrape_articles(fetcher, urls, writer, extraction, keyword=keyword,
+                                                                    search_result=search_result)
+    # Only articles that were actually written count as recovered
+    writer.flush()
+    saved = known_urls([url for urls in groups.values() for url in urls])
+    still_failed = 0
+    for (keyword_id, search_result_id), urls in groups.items():
+        failed = dict(failures[keyword_id, search_result_id])
+        failed.update({url: 'Not saved: no publication date' for url in urls if url not in failed and url not in saved})
+        record_failed_urls(failed, keyword_id, search_result_id)
+        still_failed += len(failed)
+    recovered = stored | saved
+    resolve_failed_urls(recovered)
+    return len(recovered), still_failed
@@ -0,0 +1,155 @@
+import cProfile
+import heapq
+import importlib
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ScrapeRun
+
+
+class RunProfile:
+    """
+    Wall time and counts per stage of one scrape run, plus error tallies and the slowest articles.
+
+    Stages are timed with `span()`; the numbers of several processes (e.g. the Celery chunk tasks
+    of one keyword scrape) are combined with `as_dict()` and `merge()`.
+    """
+
+    def __init__(self, slowest=None):
+        self.slowest = slowest or settings.SCRAPER_PROFILE_SLOWEST_URLS
+        self.started_at = timezone.now()
+        self.stages = {}
+        self.errors = Counter()
+        self._slowest_urls = []  # Min-heap of (seconds, url)
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def add(self, stage, seconds, count=1):
+        totals = self.stages.setdefault(stage, {'seconds': 0.0, 'count': 0})
+        totals['seconds'] += seconds
+        totals['count'] += count
+
+    def timed(self, iterable, stage):
+        # Yields from `iterable`, charging the time spent waiting for each item to `stage`
+        iterator = iter(iterable)
+        while True:
+            with self.span(stage):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def error(self, kind):
+        self.errors[kind] += 1
+
+    def article(self, url, seconds):
+        if len(self._slowest_urls) < self.slowest:
+            heapq.heappush(self._slowest_urls, (seconds, url))
+        elif seconds > self._slowest_urls[0][0]:
+            heapq.heapreplace(self._slowest_urls, (seconds, url))
+
+    def slowest_urls(self):
+        return [[url, seconds] for seconds, url in sorted(self._slowest_urls, reverse=True)]
+
+    def as_dict(self):
+        return {'started_at': self.started_at.isoformat(), 'stages': self.stages, 'errors': dict(self.errors),
+                'slowest_urls': self.slowest_urls()}
+
+    def merge(self, data):
+        if data.get('started_at'):
+            self.started_at = min(self.started_at, parse_datetime(data['started_at']))
+        for stage, totals in data.get('stages', {}).items():
+            self.add(stage, totals['seconds'], totals['count'])
+        self.errors.update(data.get('errors', {}))
+        for url, seconds in data.get('slowest_urls', []):
+            self.article(url, seconds)
+
+    def report(self):
+        elapsed = (timezone.now() - self.started_at).total_seconds()
+        lines = [f"Run took {elapsed:.1f}s"]
+        for stage, totals in sorted(self.stages.items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f"  {stage}: {totals['seconds']:.2f}s over {totals['count']}")
+        if self.errors:
+            lines.append(f"  errors: {', '.join(f'{kind} {count}' for kind, count in self.errors.most_common())}")
+        for url, seconds in self.slowest_urls()[:3]:
+            lines.append(f"  slow: {url} {seconds:.2f}s")
+        return '\n'.join(lines)
+
+    def save(self, source, search_result=None, saved=0, created=0, failed=0, browser_fallbacks=0, profile_path=''):
+        # Keyword runs are filed under the keyword of their search result
+        finished_at = timezone.now()
+        return ScrapeRun.objects.create(
+            source=source, keyword_id=search_result.keyword_id if search_result else None,
+            search_result=search_result, started_at=self.started_at,
+            finished_at=finished_at, duration=(finished_at - self.started_at).total_seconds(),
+            articles_saved=saved, articles_created=created, articles_failed=failed,
+            browser_fallbacks=browser_fallbacks, stages=self.stages, errors=dict(self.errors),
+            slowest_urls=self.slowest_urls(), profile_path=profile_path)
+
+
+class CProfiler:
+    extension = '.prof'
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self, path):
+        self.profiler.disable()
+        self.profiler.dump_stats(path)
+
+
+class PyInstrumentProfiler:
+    extension = '.html'
+
+    def __init__(self):
+        try:
+            pyinstrument = importlib.import_module('pyinstrument')
+        except ImportError:
+            raise ImproperlyConfigured("--profile pyinstrument needs the optional 'pyinstrument' package")
+        self.profiler = pyinstrument.Profiler()
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self, path):
+        self.profiler.stop()
+        with open(path, 'w') as f:
+            f.write(self.profiler.output_html())
+
+
+PROFILERS = {'cprofile': CProfiler, 'pyinstrument': PyInstrumentProfiler}
+
+
+def start_profiler(name):
+    # None when no profiler was asked for
+    if not name:
+        return None
+    profiler = PROFILERS[name]()
+    profiler.start()
+    return profiler
+
+
+def stop_profiler(profiler, name):
+    """Writes the profile to SCRAPER_PROFILE_DIR and returns its path ('' without a profiler)."""
+    if profiler is None:
+        return ''
+    os.makedirs(settings.SCRAPER_PROFILE_DIR, exist_ok=True)
+    path = os.path.join(settings.SCRAPER_PROFILE_DIR, f"{name}{profiler.extension}")
+    profiler.stop(path)
+    return path
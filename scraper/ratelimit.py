@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Token bucket per host, refilled at `rate` tokens a second up to `burst`. Returns 0 when a token
+# was taken, otherwise the milliseconds until one is available. Redis' own clock is used so every
+# worker agrees on the refill, and a pause key set from a 429's Retry-After blocks the host for
+# everyone until it expires.
+TOKEN_BUCKET = """
+local pause = redis.call('PTTL', KEYS[2])
+if pause > 0 then
+    return pause
+end
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate / 1000)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+
+def host_budget(host):
+    # (rate, burst) for `host`, or None when requests to it are not limited
+    budget = settings.SCRAPER_RATE_LIMITS.get(host, settings.SCRAPER_RATE_LIMIT_DEFAULT)
+    return (budget['rate'], budget['burst']) if budget else None
+
+
+def retry_after(value, default):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class LocalRateLimiter:
+    """Token buckets for this process only. Used when Redis is not configured or unreachable."""
+
+    blocking = False  # Cheap enough to call from the Fetcher's event loop
+
+    def __init__(self):
+        self._buckets = {}
+        self._paused_until = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host):
+        # Seconds to wait before a request to `host` may be sent; 0 means go ahead now
+        budget = host_budget(host)
+        if budget is None:
+            return 0.0
+        rate, burst = budget
+        with self._lock:
+            now = time.monotonic()
+            if self._paused_until.get(host, 0) > now:
+                return self._paused_until[host] - now
+            tokens, updated = self._buckets.get(host, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[host] = (tokens, now)
+            return wait
+
+    def pause(self, host, seconds):
+        with self._lock:
+            self._paused_until[host] = max(self._paused_until.get(host, 0), time.monotonic() + seconds)
+
+
+class RedisRateLimiter:
+    """
+    Token buckets shared by every worker process and node through Redis.
+
+    Falls back to a LocalRateLimiter when Redis can't be reached, so scraping slows down to a
+    per-process budget instead of failing. Redis is left alone for SCRAPER_RATE_LIMIT_REDIS_COOLDOWN
+    seconds after a failure, so an outage costs one timeout and one warning per period rather than
+    one per request.
+    """
+
+    blocking = True  # Network round trips; the Fetcher calls it from a thread
+
+    def __init__(self, url, cooldown=None):
+        self.client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self.script = self.client.register_script(TOKEN_BUCKET)
+        self.fallback = LocalRateLimiter()
+        self.cooldown = cooldown or settings.SCRAPER_RATE_LIMIT_REDIS_COOLDOWN
+        self._unavailable_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return time.monotonic() >= self._unavailable_until
+
+    def _failed(self, message):
+        # Only the first failure of a period is logged; calls already waiting on Redis just extend it
+        with self._lock:
+            first = self.available
+            self._unavailable_until = time.monotonic() + self.cooldown
+        if first:
+            logger.warning(f"{message}; using per-process budgets for the next {self.cooldown:g}s")
+
+    def acquire(self, host):
+        budget = host_budget(host)
+        if budget is None:
+            return 0.0
+        if not self.available:
+            return self.fallback.acquire(host)
+        try:
+            wait_ms = self.script(keys=[f"scraper:ratelimit:{host}", f"scraper:ratelimit:{host}:pause"], args=budget)
+        except redis.RedisError as e:
+            self._failed(f"Rate limiter could not reach Redis: {e}")
+            return self.fallback.acquire(host)
+        return wait_ms / 1000
+
+    def pause(self, host, seconds):
+        self.fallback.pause(host, seconds)
+        if not self.available:
+            return
+        try:
+            # Keeps the longest pause any worker has been asked for
+            key = f"scraper:ratelimit:{host}:pause"
+            if self.client.pttl(key) < seconds * 1000:
+                self.client.set(key, 1, px=max(int(seconds * 1000), 1))
+        except redis.RedisError as e:
+            self._failed(f"Could not share the pause for {host}: {e}")
+
+
+_limiter = None
+
+
+def get_rate_limiter():
+    # One limiter per process, shared by every Fetcher
+    global _limiter
+    if _limiter is None:
+        url = settings.SCRAPER_RATE_LIMIT_REDIS_URL
+        _limiter = RedisRateLimiter(url) if url else LocalRateLimiter()
+    return _limiter
@@ -0,0 +1,105 @@
+import asyncio
+import random
+import threading
+import time
+
+import aiohttp
+from django.conf import settings
+
+
+class CircuitOpenError(Exception):
+    """Raised (as a FetchResult error) for requests shed because their host's circuit is open."""
+
+
+def error_class(result):
+    # Which SCRAPER_RETRY_POLICIES entry a failed fetch falls under, or None if it shouldn't be retried
+    if isinstance(result.error, asyncio.TimeoutError):
+        return 'timeout'
+    if isinstance(result.error, aiohttp.ClientError):
+        return 'connection'
+    if result.status is not None and result.status >= 500:
+        return 'server_error'
+    return None
+
+
+def is_transient(result):
+    # Failed fetches that may well succeed later, unlike a 404 or 410
+    return isinstance(result.error, CircuitOpenError) or result.status == 429 or error_class(result) is not None
+
+
+def backoff(policy, attempt):
+    # Exponential backoff with full jitter, so workers that failed together don't retry together
+    return random.uniform(0, min(policy['cap'], policy['base'] * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a host after `threshold` failures in a row.
+
+    Once `reset_timeout` seconds have passed a single probe request is let through: success closes
+    the circuit again, another failure keeps it open for another `reset_timeout`.
+    """
+
+    def __init__(self, threshold=None, reset_timeout=None):
+        self.threshold = threshold or settings.SCRAPER_CIRCUIT_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or settings.SCRAPER_CIRCUIT_RESET_TIMEOUT
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+
+class CircuitBreakers:
+    # One breaker per host, created on first use
+    def __init__(self, threshold=None, reset_timeout=None):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def open_hosts(self):
+        with self._lock:
+            return [host for host, breaker in self._breakers.items() if breaker.is_open]
+
+
+_breakers = None
+
+
+def get_circuit_breakers():
+    # Shared by every Fetcher in the process, so a degraded host is shed across tasks
+    global _breakers
+    if _breakers is None:
+        _breakers = CircuitBreakers()
+    return _breakers
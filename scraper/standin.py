@@ -0,0 +1,200 @@
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Local stand-in for techcrunch.com used by the tests and benchmark commands, so scraper
+# throughput can be measured without touching the live site.
+
+ARTICLE_TEMPLATE = """<!DOCTYPE html>
+<html><head><title>{title}</title>
+<script type="application/ld+json">{{"@context": "https://schema.org", "@type": "NewsArticle",
+"headline": "{title}", "author": {{"@type": "Person", "name": "Jane Doe"}}, "articleSection": "AI",
+"keywords": ["OpenAI", "Funding"]}}</script>
+</head>
+<body>
+<h1 class="wp-block-post-title">{title}</h1>
+<div class="wp-block-post-date"><time datetime="2024-05-01T10:00:00+00:00">May 1, 2024</time></div>
+<figure class="wp-block-post-featured-image"><img src="https://example.com/{slug}.jpg"></figure>
+<div class="wp-block-post-content"><p>First paragraph of {title}.</p><p>Second paragraph.</p></div>
+</body></html>
+"""
+
+
+class SearchResults:
+    # search.techcrunch.com stand-in serving `total` hits, `pz` per page starting at offset `b`
+    def __init__(self, server, total, show_count=True):
+        self.server = server
+        self.total = total
+        self.show_count = show_count
+
+    def __call__(self, path, headers):
+        query = parse_qs(urlsplit(path).query)
+        start, page_size = int(query['b'][0]), int(query['pz'][0])
+        hits = range(start, min(start + page_size, self.total + 1))
+        # Every page repeats the first hit, which has to be deduplicated
+        links = [f'<a class="thmb" href="{self.server.url}/article/{n}/?guccounter=1"></a>' for n in [1, *hits]] \
+            if hits else []
+        count = f'<div class="compPagination"><span>{self.total} results</span></div>' if self.show_count else ''
+        return 200, 'text/html', f"<html><body>{''.join(links)}{count}</body></html>".encode('utf-8')
+
+
+def wp_post(server, n, content=True):
+    # The `_embed` JSON of article page `n`, as the wp-json endpoints return it
+    post = {
+        'id': n, 'slug': str(n), 'link': f"{server.url}/article/{n}/",
+        'date_gmt': (datetime(2024, 5, 1) + timedelta(minutes=n)).isoformat(),
+        'title': {'rendered': f"Article {n}"},
+        '_embedded': {'author': [{'name': 'Jane Doe'}],
+                      'wp:term': [[{'taxonomy': 'category', 'name': 'AI'}],
+                                  [{'taxonomy': 'post_tag', 'name': 'OpenAI'}]],
+                      'wp:featuredmedia': [{'source_url': f"https://example.com/{n}.jpg"}]},
+    }
+    if content:
+        post['content'] = {'rendered': f"<p>First paragraph of article {n}.</p><p>Second paragraph.</p>"}
+    return post
+
+
+class MagazineFeed:
+    # wp-json/tc/v1/magazine stand-in: newest posts first, `per_page` (default ten) per page, enveloped like
+    # the real feed. Without `content` the posts carry no body, as for paywalled or embed-only posts.
+    def __init__(self, server, count, content=True):
+        self.server = server
+        self.count = count
+        self.content = content
+        self.feed_requests = 0
+
+    def post(self, n):
+        return wp_post(self.server, n, self.content)
+
+    def __call__(self, path, headers):
+        self.feed_requests += 1
+        etag = f'"v{self.count}"'
+        if headers.get('If-None-Match') == etag:
+            return 304, 'application/json', b''
+        query = parse_qs(urlsplit(path).query)
+        page = int(query['page'][0])
+        per_page = int(query.get('per_page', [10])[0])
+        newest = self.count - (page - 1) * per_page
+        body = [self.post(n) for n in range(newest, max(newest - per_page, 0), -1)]
+        envelope = {'body': body, 'status': 200, 'headers': {'X-WP-TotalPages': -(-self.count // per_page)}}
+        return 200, 'application/json', json.dumps(envelope).encode('utf-8'), {'ETag': etag}
+
+
+class WordPressPosts:
+    # wp-json/wp/v2/posts stand-in answering comma separated `slug=` lookups of the article pages;
+    # the `missing` slugs have no post, like search hits that aren't regular posts
+    def __init__(self, server, missing=()):
+        self.server = server
+        self.missing = {str(slug) for slug in missing}
+        self.requests = 0
+
+    def __call__(self, path, headers):
+        self.requests += 1
+        query = parse_qs(urlsplit(path).query)
+        slugs = ','.join(query.get('slug', [])).split(',')
+        per_page = int(query.get('per_page', [10])[0])
+        posts = [wp_post(self.server, int(slug)) for slug in slugs if slug.isdigit() and slug not in self.missing]
+        return 200, 'application/json', json.dumps(posts[:per_page]).encode('utf-8')
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # The default backlog of 5 caps the concurrency we can measure
+
+
+class StandInServer:
+    """
+    Serves article pages (and any `routes` added) on a free local port.
+
+    Every response is delayed by `latency` plus up to `jitter` seconds, and `error_rate` of the
+    article requests fail with `error_status` so retries and failure handling can be measured.
+    """
+
+    def __init__(self, latency=0.0, routes=None, jitter=0.0, error_rate=0.0, error_status=503, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.routes = routes or {}
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.request_count = 0
+        self.injected_errors = 0
+        self.first_requested = {}  # Path -> time.time() of its first request
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_techcrunch(self, articles):
+        # Search results and a magazine category feed listing the same `articles` article pages, and their posts
+        self.routes['/search'] = SearchResults(self, articles)
+        self.routes['/wp-json/tc/v1/magazine'] = MagazineFeed(self, articles)
+        self.routes['/wp-json/wp/v2/posts'] = WordPressPosts(self)
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, path, headers):
+        # Returns (status, content_type, body) or (status, content_type, body, extra_headers). Routes are
+        # matched without the query string; callable routes receive the full path and request headers.
+        route = self.routes.get(path.split('?', 1)[0])
+        if callable(route):
+            return route(path, headers)
+        if route is not None:
+            return route
+        if path.startswith('/article/'):
+            with self._lock:
+                failed = self.error_rate and self._random.random() < self.error_rate
+                self.injected_errors += bool(failed)
+            if failed:
+                return self.error_status, 'text/plain', b'Injected error'
+            slug = path.rstrip('/').rsplit('/', 1)[-1]
+            body = ARTICLE_TEMPLATE.format(title=f"Article {slug}", slug=slug)
+            return 200, 'text/html; charset=utf-8', body.encode('utf-8')
+        return 404, 'text/plain', b'Not found'
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.request_count += 1
+                    server.first_requested.setdefault(self.path.split('?', 1)[0], time.time())
+                    delay = server.latency + server._random.uniform(0, server.jitter)
+                if delay:
+                    time.sleep(delay)
+                status, content_type, body, *extra = server.respond(self.path, self.headers)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (extra[0] if extra else {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
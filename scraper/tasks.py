@@ -1,6 +1,55 @@
 from __future__ import absolute_import, unicode_literals
-from celery import shared_task
+from celery import chord, shared_task
+from celery.signals import (before_task_publish, task_postrun, task_prerun, worker_init, worker_process_init,
+                            worker_process_shutdown)
+from django.conf import settings
 from django.core.management import call_command
+from django.db import DatabaseError
+from selenium.common.exceptions import WebDriverException
+from .browser import resolve_driver_path, get_pool
+from .exporting import run_export_job
+from .fetcher import Fetcher
+from . import metrics
+from .models import ExportJob, FailedURL, Keyword, KeywordSearchResult
+from .pagination import SearchPaginator
+from .persistence import ArticleWriter, known_urls, record_failed_urls, resolve_keyword
+from .pipeline import ingest_urls, retry_failed_urls, scrape_articles
+from .profiling import RunProfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@worker_init.connect
+def resolve_webdriver(**kwargs):
+    # Resolve chromedriver once in the parent so every forked worker process inherits the path
+    try:
+        resolve_driver_path()
+    except Exception as e:
+        logger.warning(f"Could not resolve chromedriver at worker startup: {e}")
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    if settings.SCRAPER_METRICS_PORT:
+        metrics.start_worker_server(settings.SCRAPER_METRICS_PORT)
+
+
+before_task_publish.connect(metrics.stamp_published)
+task_prerun.connect(metrics.task_started)
+task_postrun.connect(metrics.task_finished)
+
+
+@worker_process_init.connect
+def warm_webdriver_pool(**kwargs):
+    if settings.SCRAPER_WEBDRIVER_WARM_ON_START:
+        get_pool().warm()
+
+
+@worker_process_shutdown.connect
+def close_webdriver_pool(pid=None, **kwargs):
+    get_pool().close()
+    metrics.mark_process_dead(pid)
 
 
 """
@@ -10,5 +59,130 @@ def scrape_techcrunch_categories_task():
 """
 
 @shared_task
-def scrape_techcrunch_task(search_term):
-    call_command('scrape_techcrunch', search_term)
+def scrape_techcrunch_task(search_term, extraction='static', refresh=False, ingest='api'):
+    """
+    Discovery step of a keyword scrape: collects the result links and fans the downloads out.
+
+    Unknown article URLs are split into chunks of SCRAPER_PIPELINE_CHUNK_SIZE, each fetched, parsed
+    and saved by its own scrape_articles_task on whichever worker process picks it up, resolved
+    through wp-json unless `ingest` is 'html'. A chord runs summarize_scrape_task once every chunk
+    has finished.
+    """
+    profile = RunProfile()
+    keyword = resolve_keyword(search_term)
+    search_result = KeywordSearchResult.objects.create(keyword=keyword)
+    with Fetcher() as fetcher, profile.span('search'):
+        paginator = SearchPaginator(fetcher, search_term)
+        links = paginator.links()
+    logger.info(f"Found {len(links)} articles for '{search_term}' on {paginator.pages_fetched} result pages")
+    if not paginator.complete:
+        # Recorded on the ScrapeRun, so a cut-short search doesn't pass for a complete one
+        logger.warning(f"Search for '{search_term}' is incomplete: {len(paginator.failed_pages)} result pages failed")
+        for _ in paginator.failed_pages:
+            profile.error('search_page_failed')
+    known = set()
+    if not refresh:
+        # Articles we already have are linked to this search without being downloaded again
+        with profile.span('db'):
+            known = known_urls(links)
+        ArticleWriter(profile=profile).link_existing(known, search_result)
+        links = [link for link in links if link not in known]
+
+    chunk_size = settings.SCRAPER_PIPELINE_CHUNK_SIZE
+    chunks = [links[start:start + chunk_size] for start in range(0, len(links), chunk_size)]
+    summary = summarize_scrape_task.s(search_result.pk, already_stored=len(known), profile=profile.as_dict())
+    if not chunks:
+        return summary.apply_async(args=([],)).id
+    return chord([scrape_articles_task.s(chunk, keyword.pk, search_result.pk, extraction, refresh, ingest)
+                  for chunk in chunks])(summary).id
+
+
+@shared_task(bind=True, acks_late=True, max_retries=None)
+def scrape_articles_task(self, urls, keyword_id, search_result_id, extraction='static', refresh=False, ingest='api',
+                         totals=None):
+    # One chunk of a keyword scrape. Articles that fail to download are retried on their own with a
+    # growing delay; the rest of the chunk is saved before that, so a retry never redoes finished work.
+    totals = totals or {'saved': 0, 'created': 0, 'skipped': 0, 'failed': 0, 'browser_fallbacks': 0}
+    max_retries = settings.SCRAPER_PIPELINE_MAX_RETRIES
+    countdown = settings.SCRAPER_PIPELINE_RETRY_DELAY * 2 ** self.request.retries
+    # Stage timings travel with the totals, through retries to the summary's ScrapeRun
+    profile = RunProfile()
+    profile.merge(totals.get('profile', {}))
+    writer = ArticleWriter(refresh=refresh, profile=profile)
+    try:
+        with Fetcher() as fetcher, writer:
+            keyword, search_result = Keyword(pk=keyword_id), KeywordSearchResult(pk=search_result_id)
+            if ingest == 'api' and extraction == 'static':
+                failed, browser_fallbacks = ingest_urls(fetcher, urls, writer, keyword=keyword,
+                                                        search_result=search_result)
+            else:
+                failed, browser_fallbacks = scrape_articles(fetcher, urls, writer, extraction, keyword=keyword,
+                                                            search_result=search_result)
+    except (DatabaseError, WebDriverException) as e:
+        profile.error(type(e).__name__)
+        totals['profile'] = profile.as_dict()
+        if self.request.retries < max_retries:
+            raise self.retry(exc=e, countdown=countdown, kwargs={'totals': totals})
+        # Give up on this chunk but let the chord's summary still run
+        logger.error(f"Giving up on {len(urls)} articles after {self.request.retries} retries: {e}")
+        try:
+            record_failed_urls({url: str(e) for url in urls}, keyword_id, search_result_id)
+        except DatabaseError as db_error:
+            logger.error(f"Could not record the failed articles: {db_error}")
+        totals['failed'] += len(urls)
+        return totals
+
+    totals['saved'] += writer.saved_count
+    totals['created'] += writer.created_count
+    totals['skipped'] += writer.skipped_count
+    totals['browser_fallbacks'] += browser_fallbacks
+    totals['profile'] = profile.as_dict()
+    if failed.transient and self.request.retries < max_retries:
+        # 404s and the like won't fix themselves; they go to the dead letter straight away
+        permanent = failed.permanent()
+        record_failed_urls(permanent, keyword_id, search_result_id)
+        totals['failed'] += len(permanent)
+        logger.warning(f"Retrying {len(failed.transient)} of {len(urls)} articles in {countdown}s")
+        raise self.retry(args=(list(failed.transient), keyword_id, search_result_id, extraction, refresh, ingest),
+                         kwargs={'totals': totals}, countdown=countdown)
+    # Whatever still fails goes to the dead letter, to be rerun in bulk with retry_failed_urls
+    record_failed_urls(failed, keyword_id, search_result_id)
+    totals['failed'] += len(failed)
+    return totals
+
+
+@shared_task
+def summarize_scrape_task(results, search_result_id, already_stored=0, profile=None):
+    totals = {'saved': 0, 'created': 0, 'skipped': 0, 'failed': 0, 'browser_fallbacks': 0}
+    run_profile = RunProfile()
+    run_profile.merge(profile or {})
+    for result in results:
+        run_profile.merge(result.get('profile', {}))
+        for key, value in result.items():
+            if key != 'profile':
+                totals[key] += value
+    totals['already_stored'] = already_stored
+    search_result = KeywordSearchResult.objects.filter(pk=search_result_id).first()
+    run_profile.save('keyword', search_result=search_result, saved=totals['saved'], created=totals['created'],
+                     failed=totals['failed'], browser_fallbacks=totals['browser_fallbacks'])
+    logger.info(run_profile.report())
+    logger.info(f"Keyword search {search_result_id}: saved {totals['saved']} articles ({totals['created']} new, "
+                f"{totals['skipped']} skipped, {already_stored} already stored), {totals['failed']} failed, "
+                f"browser fallback used for {totals['browser_fallbacks']}")
+    return totals
+
+
+@shared_task
+def retry_failed_urls_task(failed_url_ids, extraction='static'):
+    failed_urls = FailedURL.objects.filter(pk__in=failed_url_ids)
+    with Fetcher() as fetcher:
+        recovered, still_failed = retry_failed_urls(fetcher, failed_urls, ArticleWriter(), extraction)
+    logger.info(f"Retried {recovered + still_failed} failed articles: {recovered} recovered, "
+                f"{still_failed} still failing")
+    return recovered, still_failed
+
+
+@shared_task
+def export_articles_task(job_id):
+    job = ExportJob.objects.get(pk=job_id)
+    run_export_job(job)
@@ -1,3 +1,1397 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connection, transaction
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from scraper import fulltext, metrics
+from scraper.fetcher import Fetcher
+from scraper.http_cache import HttpCache
+from scraper.management.commands.benchmark_scrape import Command as BenchmarkCommand
+from scraper.browser import PoolExhaustedError, WebDriverPool, scrape_metadata
+from scraper.exporting import (CSV_HEADER, check_export_format, create_export_jobs, write_export,
+                               write_grouped_exports)
+from scraper.metadata import extract_metadata, extract_embed_metadata, is_complete
+from scraper.models import (Article, ArticleTag, Author, Category, CategoryFeed, ExportJob, FailedURL, Keyword,
+                            KeywordSearchResult, KeywordSearchResultItem, ScrapeRun, Tag)
+from scraper.pagination import SearchPaginator
+from scraper.parsing import ArticleRecord, BACKENDS, make_document, parse_article
+from scraper.ratelimit import LocalRateLimiter, RedisRateLimiter, retry_after
+from scraper.retry import CircuitBreaker, CircuitBreakers, CircuitOpenError
+from scraper.persistence import (ArticleWriter, NameCache, NAME_CACHES, clear_name_caches, known_urls,
+                                 record_failed_urls, reset_name_cache_stats)
+from scraper.pipeline import retry_failed_urls, scrape_articles
+from scraper.profiling import RunProfile
+from requests.structures import CaseInsensitiveDict
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from scraper.standin import ARTICLE_TEMPLATE, MagazineFeed, SearchResults, StandInServer, WordPressPosts
+from scraper.tasks import export_articles_task, scrape_techcrunch_task, summarize_scrape_task
+from techcrunch_scraper.celery import app
+from celery import chord
+from prometheus_client import REGISTRY
+from io import StringIO
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlsplit
+import csv
+import gzip
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import time
+import uuid
+import zipfile
 
 # Create your tests here.
+
+
+@override_settings(SCRAPER_HTTP_CACHE_ENABLED=False)
+class FetcherTests(SimpleTestCase):
+    def test_fetch_many_keeps_input_order(self):
+        with StandInServer() as server, Fetcher(concurrency=5) as fetcher:
+            urls = [f"{server.url}/article/{n}/" for n in range(12)]
+            results = fetcher.fetch_many(urls)
+        self.assertEqual([result.url for result in results], urls)
+        self.assertTrue(all(result.ok for result in results))
+        self.assertIn(b'Article 7', results[7].content)
+
+    def test_requests_run_concurrently(self):
+        with StandInServer(latency=0.2) as server, Fetcher(concurrency=10, per_host=10) as fetcher:
+            urls = [f"{server.url}/article/{n}/" for n in range(10)]
+            started = time.perf_counter()
+            fetcher.fetch_many(urls)
+            elapsed = time.perf_counter() - started
+        # Serially this would take at least 2 seconds
+        self.assertLess(elapsed, 1.0)
+
+    def test_per_host_cap_limits_throughput(self):
+        with StandInServer(latency=0.2) as server, Fetcher(concurrency=10, per_host=2) as fetcher:
+            urls = [f"{server.url}/article/{n}/" for n in range(6)]
+            started = time.perf_counter()
+            fetcher.fetch_many(urls)
+            elapsed = time.perf_counter() - started
+        self.assertGreaterEqual(elapsed, 0.6)
+
+    def test_errors_are_returned_not_raised(self):
+        with StandInServer() as server, Fetcher() as fetcher:
+            missing = fetcher.fetch(f"{server.url}/missing/")
+        self.assertEqual(missing.status, 404)
+        self.assertFalse(missing.ok)
+        with Fetcher(timeout=2) as fetcher:
+            refused = fetcher.fetch('http://127.0.0.1:9/')
+        self.assertIsNone(refused.status)
+        self.assertIsNotNone(refused.error)
+
+
+class Throttling:
+    # Route that answers 429 with Retry-After until it has been asked `limit` times
+    def __init__(self, limit=1, retry_after='1'):
+        self.limit = limit
+        self.retry_after = retry_after
+        self.requests = []
+
+    def __call__(self, path, headers):
+        self.requests.append(time.monotonic())
+        if len(self.requests) <= self.limit:
+            return 429, 'text/plain', b'slow down', {'Retry-After': self.retry_after}
+        return 200, 'text/plain', b'ok'
+
+
+@override_settings(SCRAPER_HTTP_CACHE_ENABLED=False, SCRAPER_RATE_LIMITS={'127.0.0.1': {'rate': 10, 'burst': 2}})
+class RateLimitTests(SimpleTestCase):
+    def test_bucket_allows_a_burst_then_the_refill_rate(self):
+        limiter = LocalRateLimiter()
+        self.assertEqual([limiter.acquire('127.0.0.1') for _ in range(2)], [0, 0])
+        self.assertAlmostEqual(limiter.acquire('127.0.0.1'), 0.1, delta=0.02)
+        self.assertEqual(limiter.acquire('example.com'), 0)  # Hosts without a budget are not limited
+
+    def test_fetches_are_spread_over_the_budget(self):
+        with StandInServer() as server, Fetcher(concurrency=10, limiter=LocalRateLimiter()) as fetcher:
+            started = time.perf_counter()
+            results = fetcher.fetch_many([f"{server.url}/article/{n}/" for n in range(7)])
+            elapsed = time.perf_counter() - started
+        self.assertTrue(all(result.ok for result in results))
+        # Two go out straight away, the other five one every 100ms
+        self.assertGreaterEqual(elapsed, 0.45)
+
+    def test_retry_after_pauses_the_host(self):
+        limiter = LocalRateLimiter()
+        with StandInServer() as server, Fetcher(limiter=limiter) as fetcher:
+            route = server.routes['/busy'] = Throttling()
+            result = fetcher.fetch(f"{server.url}/busy")
+        self.assertEqual((result.status, result.content), (200, b'ok'))
+        self.assertEqual(fetcher.throttled_count, 1)
+        self.assertGreaterEqual(route.requests[1] - route.requests[0], 0.95)
+
+    def test_throttled_response_is_returned_once_retries_run_out(self):
+        with StandInServer() as server, override_settings(SCRAPER_RATE_LIMIT_MAX_RETRIES=1), \
+                Fetcher(limiter=LocalRateLimiter()) as fetcher:
+            route = server.routes['/busy'] = Throttling(limit=5, retry_after='0')
+            result = fetcher.fetch(f"{server.url}/busy")
+        self.assertEqual(result.status, 429)
+        self.assertEqual(len(route.requests), 2)
+
+    def test_retry_after_formats(self):
+        self.assertEqual(retry_after('3', 5), 3)
+        self.assertEqual(retry_after(None, 5), 5)
+        self.assertEqual(retry_after('soon', 5), 5)
+        self.assertEqual(retry_after('Wed, 21 Oct 2015 07:28:00 GMT', 5), 0)
+
+    def test_unreachable_redis_falls_back_to_local_buckets(self):
+        limiter = RedisRateLimiter('redis://127.0.0.1:9/0')
+        with self.assertLogs('scraper.ratelimit', 'WARNING') as logs, \
+                mock.patch.object(limiter, 'script', wraps=limiter.script) as script:
+            waits = [limiter.acquire('127.0.0.1') for _ in range(3)]
+            limiter.pause('127.0.0.1', 0.01)
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertGreater(waits[2], 0)
+        # Redis is tried once, then left alone for the cooldown, with a single warning
+        self.assertEqual(script.call_count, 1)
+        self.assertEqual(len(logs.records), 1)
+
+    def test_blocking_limiters_run_off_the_event_loop(self):
+        class SlowLimiter(LocalRateLimiter):
+            blocking = True
+
+            def acquire(self, host):
+                time.sleep(0.3)
+                return 0.0
+
+        with StandInServer() as server, Fetcher(concurrency=5, limiter=SlowLimiter()) as fetcher:
+            started = time.perf_counter()
+            results = fetcher.fetch_many([f"{server.url}/article/{n}/" for n in range(5)])
+            elapsed = time.perf_counter() - started
+        self.assertTrue(all(result.ok for result in results))
+        # On the loop the five calls would have taken 1.5s one after the other
+        self.assertLess(elapsed, 1.0)
+
+
+class Failing:
+    # Route that answers with a server error `failures` times, then serves the article
+    def __init__(self, failures, status=500):
+        self.failures = failures
+        self.status = status
+        self.requests = 0
+
+    def __call__(self, path, headers):
+        self.requests += 1
+        if self.requests <= self.failures:
+            return self.status, 'text/plain', b'broken'
+        return 200, 'text/html', ARTICLE_TEMPLATE.format(title='Recovered', slug='recovered').encode('utf-8')
+
+
+NO_DELAY = {name: {'attempts': 2, 'base': 0, 'cap': 0} for name in ('timeout', 'connection', 'server_error')}
+
+
+@override_settings(SCRAPER_HTTP_CACHE_ENABLED=False, SCRAPER_RETRY_POLICIES=NO_DELAY)
+class RetryTests(SimpleTestCase):
+    def fetcher(self, **kwargs):
+        return Fetcher(limiter=LocalRateLimiter(), breakers=CircuitBreakers(**kwargs))
+
+    def test_server_errors_are_retried(self):
+        with StandInServer() as server, self.fetcher() as fetcher:
+            route = server.routes['/flaky'] = Failing(2)
+            result = fetcher.fetch(f"{server.url}/flaky")
+        self.assertEqual(result.status, 200)
+        self.assertEqual((route.requests, fetcher.retry_count), (3, 2))
+
+    def test_retries_stop_at_the_policy_limit(self):
+        with StandInServer() as server, self.fetcher() as fetcher:
+            route = server.routes['/down'] = Failing(10, status=502)
+            result = fetcher.fetch(f"{server.url}/down")
+            missing = fetcher.fetch(f"{server.url}/missing/")
+        self.assertEqual((result.status, route.requests), (502, 3))
+        # Client errors are not worth retrying
+        self.assertEqual((missing.status, fetcher.retry_count), (404, 2))
+
+    def test_open_circuit_sheds_requests(self):
+        with StandInServer() as server, self.fetcher(threshold=3, reset_timeout=60) as fetcher:
+            route = server.routes['/down'] = Failing(10)
+            fetcher.fetch(f"{server.url}/down")
+            shed = fetcher.fetch_many([f"{server.url}/article/{n}/" for n in range(5)])
+        self.assertEqual(route.requests, 3)
+        self.assertTrue(all(isinstance(result.error, CircuitOpenError) for result in shed))
+        self.assertEqual(fetcher.shed_count, 5)
+        self.assertIn('circuit open for 127.0.0.1', fetcher.summary())
+
+    def test_circuit_lets_one_probe_through_after_the_timeout(self):
+        breaker = CircuitBreaker(threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # Only one probe at a time
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertTrue(breaker.allow() and breaker.allow())
+
+    @override_settings(SCRAPER_RATE_LIMIT_BACKOFF=0)
+    def test_a_throttled_probe_keeps_its_permit(self):
+        with StandInServer() as server, self.fetcher(threshold=1, reset_timeout=0.05) as fetcher:
+            server.routes['/down'] = Failing(10)
+            route = server.routes['/throttled'] = Throttling(limit=1, retry_after='0')
+            fetcher.fetch(f"{server.url}/down")
+            time.sleep(0.06)
+            shed = fetcher.shed_count
+            probe = fetcher.fetch(f"{server.url}/throttled")
+            after = fetcher.fetch(f"{server.url}/article/1/")
+        self.assertEqual((probe.status, len(route.requests)), (200, 2))
+        self.assertEqual(after.status, 200)
+        self.assertEqual(fetcher.shed_count, shed)
+
+    def test_browser_render_is_retried_then_raises(self):
+        driver = mock.Mock()
+        with mock.patch('scraper.browser.WebDriverWait') as wait:
+            wait.return_value.until.side_effect = TimeoutException()
+            with self.assertRaises(TimeoutException):
+                scrape_metadata(driver, 'https://techcrunch.com/a/', attempts=3)
+        self.assertEqual(driver.get.call_count, 3)
+
+
+@override_settings(SCRAPER_HTTP_CACHE_ENABLED=False, SCRAPER_RETRY_POLICIES={
+    name: {'attempts': 0, 'base': 0, 'cap': 0} for name in ('timeout', 'connection', 'server_error')})
+class StandInServerTests(SimpleTestCase):
+    def test_error_injection_is_seeded(self):
+        outcomes = []
+        for _ in range(2):
+            with StandInServer(error_rate=0.3, seed=7) as server, \
+                    Fetcher(concurrency=1, breakers=CircuitBreakers(threshold=100)) as fetcher:
+                results = fetcher.fetch_many([f"{server.url}/article/{n}/" for n in range(50)])
+            outcomes.append([result.status for result in results])
+        self.assertEqual(outcomes[0], outcomes[1])
+        self.assertEqual(outcomes[0].count(503), server.injected_errors)
+        self.assertTrue(0 < server.injected_errors < 50)
+
+    def test_search_and_feed_list_the_same_articles(self):
+        with StandInServer() as server, Fetcher() as fetcher, \
+                override_settings(SCRAPER_SEARCH_URL=f"{server.url}/search"):
+            server.serve_techcrunch(15)
+            links = SearchPaginator(fetcher, 'anything').links()
+            feed = json.loads(fetcher.fetch(f"{server.url}/wp-json/tc/v1/magazine?page=2").content)
+        self.assertEqual(links, [f"{server.url}/article/{n}/" for n in range(1, 16)])
+        self.assertEqual([post['id'] for post in feed['body']], [5, 4, 3, 2, 1])
+        self.assertEqual(feed['headers']['X-WP-TotalPages'], 2)
+
+
+class MetadataTests(SimpleTestCase):
+    def test_json_ld_graph(self):
+        document = make_document("""
+            <script type="application/ld+json">{"@graph": [
+                {"@type": "NewsArticle", "author": {"@id": "#p1"}, "articleSection": ["AI"],
+                 "keywords": ["OpenAI", "Funding"]},
+                {"@type": "Person", "@id": "#p1", "name": "Jane Doe"}
+            ]}</script>""")
+        metadata = extract_metadata(document)
+        self.assertEqual(metadata, {'author': 'Jane Doe', 'category': 'AI', 'tags': ['OpenAI', 'Funding']})
+
+    def test_meta_tags_and_markup_fill_gaps(self):
+        document = make_document("""
+            <meta name="author" content="John Roe">
+            <meta property="article:section" content="Apps">
+            <div class="taxonomy-post_tag wp-block-post-terms"><a>iOS</a><a>Android</a></div>""")
+        metadata = extract_metadata(document)
+        self.assertEqual(metadata, {'author': 'John Roe', 'category': 'Apps', 'tags': ['iOS', 'Android']})
+
+    def test_missing_fields_need_browser(self):
+        metadata = extract_metadata(make_document('<p>No metadata</p>'))
+        self.assertFalse(is_complete(metadata))
+
+    def test_embed_payload(self):
+        item = {'_embedded': {
+            'author': [{'name': 'Jane Doe'}],
+            'wp:term': [[{'taxonomy': 'category', 'name': 'Biotech &amp; Health'}],
+                        [{'taxonomy': 'post_tag', 'name': 'CRISPR'}]],
+        }}
+        self.assertEqual(extract_embed_metadata(item),
+                         {'author': 'Jane Doe', 'category': 'Biotech & Health', 'tags': ['CRISPR']})
+
+
+ARTICLE_HTML = """<html><head>
+<meta name="author" content="Jane Doe"><meta property="article:section" content="AI">
+</head><body>
+<h1 class="wp-block-post-title"> OpenAI raises again </h1>
+<div class="wp-block-post-date"><time datetime="2024-05-01T10:00:00">May 1</time></div>
+<figure class="wp-block-post-featured-image"><img src="https://example.com/a.jpg"></figure>
+<div class="wp-block-post-content"><p>First <b>bold</b> paragraph.</p><p> Second. </p></div>
+<div class="taxonomy-post_tag wp-block-post-terms"><a>OpenAI</a><a>Funding</a></div>
+</body></html>"""
+
+
+class ParsingTests(SimpleTestCase):
+    def test_backends_agree(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                try:
+                    record = parse_article(ARTICLE_HTML, 'https://techcrunch.com/a/', backend=backend)
+                except ImproperlyConfigured:
+                    self.skipTest(f"{backend} is not installed")
+                self.assertEqual(record.title, 'OpenAI raises again')
+                self.assertEqual(record.publication_date.isoformat(), '2024-05-01T10:00:00+00:00')
+                self.assertEqual(record.content, 'First bold paragraph. Second.')
+                self.assertEqual(record.image_url, 'https://example.com/a.jpg')
+                self.assertEqual(record.metadata, {'author': 'Jane Doe', 'category': 'AI',
+                                                   'tags': ('OpenAI', 'Funding')})
+
+    def test_missing_fields(self):
+        record = parse_article('<html><body></body></html>', 'https://techcrunch.com/b/')
+        self.assertIsNone(record.title)
+        self.assertIsNone(record.publication_date)
+        self.assertEqual(record.content, '')
+
+
+class FakeDriver:
+    def __init__(self):
+        self.healthy = True
+        self.quit_called = False
+
+    def execute_script(self, script):
+        if not self.healthy:
+            raise WebDriverException('session deleted')
+        return 1
+
+    def quit(self):
+        self.quit_called = True
+
+
+class WebDriverPoolTests(SimpleTestCase):
+    def make_pool(self, **kwargs):
+        self.created = []
+
+        def factory():
+            self.created.append(FakeDriver())
+            return self.created[-1]
+        return WebDriverPool(factory=factory, **kwargs)
+
+    def test_sessions_are_reused(self):
+        pool = self.make_pool(size=1, max_pages=10, max_rss_mb=1024)
+        for _ in range(3):
+            with pool.lease() as driver:
+                pass
+        self.assertEqual(len(self.created), 1)
+
+    def test_recycled_after_max_pages(self):
+        pool = self.make_pool(size=1, max_pages=2, max_rss_mb=1024)
+        for _ in range(4):
+            with pool.lease():
+                pass
+        self.assertEqual(len(self.created), 2)
+        self.assertTrue(self.created[0].quit_called)
+
+    def test_unhealthy_session_replaced(self):
+        pool = self.make_pool(size=1, max_pages=10, max_rss_mb=1024)
+        with pool.lease() as driver:
+            pass
+        driver.healthy = False
+        with pool.lease() as replacement:
+            self.assertIsNot(replacement, driver)
+        self.assertTrue(driver.quit_called)
+
+    def test_failed_lease_discards_session(self):
+        pool = self.make_pool(size=1, max_pages=10, max_rss_mb=1024)
+        with self.assertRaises(WebDriverException):
+            with pool.lease() as driver:
+                raise WebDriverException('crashed')
+        self.assertTrue(driver.quit_called)
+        with pool.lease() as replacement:
+            self.assertIsNot(replacement, driver)
+
+    def test_lease_times_out_when_pool_exhausted(self):
+        pool = self.make_pool(size=1, max_pages=10, max_rss_mb=1024)
+        with pool.lease():
+            with self.assertRaises(PoolExhaustedError):
+                with pool.lease(timeout=0.1):
+                    pass
+
+
+def make_record(n, category='AI', author='Jane Doe', tags=('OpenAI', 'Funding')):
+    return ArticleRecord(url=f"https://techcrunch.com/article-{n}/", title=f"Article {n}",
+                         publication_date=timezone.now(), content=f"Content {n}", image_url=None,
+                         author=author, category=category, tags=tags)
+
+
+class ArticleWriterTests(TestCase):
+    def write(self, records, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            with ArticleWriter(batch_size=len(records) or 1, **kwargs) as writer:
+                for record in records:
+                    writer.add(record)
+        return writer, len(queries)
+
+    def test_writes_articles_and_relations(self):
+        keyword = Keyword.objects.create(keyword='ai')
+        search_result = KeywordSearchResult.objects.create(keyword=keyword)
+        with ArticleWriter(batch_size=10) as writer:
+            writer.add(make_record(1), keyword=keyword, search_result=search_result)
+            writer.add(make_record(2, category=None, author=None, tags=None), keyword=keyword,
+                       search_result=search_result)
+        article = Article.objects.get(title='Article 1')
+        self.assertEqual((article.author.name, article.category.name, article.keyword), ('Jane Doe', 'AI', keyword))
+        self.assertEqual(set(article.tags.values_list('name', flat=True)), {'OpenAI', 'Funding'})
+        fallback = Article.objects.get(title='Article 2')
+        self.assertEqual((fallback.author.name, fallback.category.name), ('Author not found', 'Category not found'))
+        self.assertEqual(search_result.items.count(), 2)
+
+    def test_existing_urls_are_not_duplicated(self):
+        self.write([make_record(1)])
+        writer, _ = self.write([make_record(1), make_record(1), make_record(2)])
+        self.assertEqual(writer.created_count, 1)
+        self.assertEqual(Article.objects.count(), 2)
+        self.assertEqual(ArticleTag.objects.count(), 4)
+
+    def test_shared_titles_no_longer_collide(self):
+        self.write([make_record(1), make_record(2)._replace(title='Article 1')])
+        self.assertEqual(Article.objects.filter(title='Article 1').count(), 2)
+
+    def test_republished_content_is_matched_by_fingerprint(self):
+        self.write([make_record(1)])
+        self.write([make_record(1)._replace(url='https://techcrunch.com/syndicated/')])
+        self.assertEqual(Article.objects.count(), 1)
+        # The alias is remembered, so the next run doesn't download it again
+        self.assertEqual(known_urls(['https://techcrunch.com/syndicated/']), {'https://techcrunch.com/syndicated/'})
+        self.assertEqual(Article.objects.get().aliases.get().url, 'https://techcrunch.com/syndicated/')
+
+    def test_republished_content_is_matched_within_a_batch(self):
+        search_result = KeywordSearchResult.objects.create(keyword=Keyword.objects.create(keyword='ai'))
+        with ArticleWriter(batch_size=10) as writer:
+            for url in ('https://techcrunch.com/article-1/', 'https://techcrunch.com/syndicated/'):
+                writer.add(make_record(1)._replace(url=url), search_result=search_result)
+        self.assertEqual(writer.created_count, 1)
+        article = Article.objects.get()
+        self.assertEqual(list(article.aliases.values_list('url', flat=True)), ['https://techcrunch.com/syndicated/'])
+        self.assertEqual(search_result.items.get().article, article)
+
+    def test_legacy_rows_adopt_their_url(self):
+        Article.objects.create(title='Article 1', author=Author.objects.create(name='a'),
+                               category=Category.objects.create(name='c'), publication_date=timezone.now(),
+                               content='Old content', image_url='https://example.com/a.jpg')
+        self.write([make_record(1)])
+        article = Article.objects.get()
+        self.assertEqual(article.url, 'https://techcrunch.com/article-1/')
+        self.assertEqual(article.content, 'Old content')
+
+    def test_refresh_updates_existing_articles(self):
+        self.write([make_record(1)])
+        writer, _ = self.write([make_record(1)._replace(content='Updated', tags=('OpenAI', 'New'))], refresh=True)
+        article = Article.objects.get()
+        self.assertEqual(writer.created_count, 0)
+        self.assertEqual(article.content, 'Updated')
+        self.assertEqual(sorted(article.tags.values_list('name', flat=True)), ['Funding', 'New', 'OpenAI'])
+
+    def test_link_existing(self):
+        self.write([make_record(1), make_record(2)])
+        search_result = KeywordSearchResult.objects.create(keyword=Keyword.objects.create(keyword='ai'))
+        ArticleWriter().link_existing(known_urls(['https://techcrunch.com/article-1/', 'https://x.com/']),
+                                      search_result)
+        self.assertEqual(list(search_result.items.values_list('article__title', flat=True)), ['Article 1'])
+
+    def test_records_without_date_are_skipped(self):
+        writer, _ = self.write([make_record(1)._replace(publication_date=None)])
+        self.assertEqual(writer.skipped_count, 1)
+        self.assertFalse(Article.objects.exists())
+
+    def test_query_count_does_not_grow_with_batch(self):
+        _, small = self.write([make_record(n, category=f"c{n}", author=f"a{n}", tags=(f"t{n}",)) for n in range(5)])
+        _, large = self.write([make_record(n, category=f"c{n}", author=f"a{n}", tags=(f"t{n}",))
+                               for n in range(100, 150)])
+        self.assertEqual(small, large)
+
+    def test_thousand_articles(self):
+        records = [make_record(n, category=f"c{n % 20}", author=f"a{n % 50}", tags=(f"t{n % 100}", 'shared'))
+                   for n in range(1000)]
+        with CaptureQueriesContext(connection) as queries:
+            with ArticleWriter(batch_size=500) as writer:
+                for record in records:
+                    writer.add(record)
+        self.assertEqual(writer.created_count, 1000)
+        self.assertEqual(Category.objects.count(), 20)
+        self.assertEqual(Author.objects.count(), 50)
+        self.assertEqual(Tag.objects.count(), 101)
+        self.assertEqual(ArticleTag.objects.count(), 2000)
+        # get_or_create per article, author, category and tag would have needed over 6,000 queries
+        self.assertLess(len(queries), 60)
+
+
+class BrokenFeedPage:
+    # Magazine feed route whose page `page` answers `status` with an HTML body instead of JSON
+    def __init__(self, feed, page, status):
+        self.feed = feed
+        self.page = page
+        self.status = status
+
+    def __call__(self, path, headers):
+        if int(parse_qs(urlsplit(path).query)['page'][0]) == self.page:
+            return self.status, 'text/html', b'<html><body>Something went wrong</body></html>'
+        return self.feed(path, headers)
+
+
+@override_settings(SCRAPER_HTTP_CACHE_ENABLED=False)
+class IncrementalCategoryCrawlTests(TestCase):
+    def crawl(self, server, ingest='html'):
+        with override_settings(SCRAPER_MAGAZINE_FEED_URL=f"{server.url}/wp-json/tc/v1/magazine",
+                               SCRAPER_MAGAZINE_PER_PAGE=10):
+            call_command('scrape_categories_techcrunch', category=[577047203], ingest=ingest, stdout=StringIO())
+
+    def test_second_run_only_fetches_new_posts(self):
+        with StandInServer() as server:
+            feed = server.routes['/wp-json/tc/v1/magazine'] = MagazineFeed(server, 25)
+            self.crawl(server)
+            self.assertEqual(Article.objects.count(), 25)
+            self.assertEqual(feed.feed_requests, 3)
+            state = CategoryFeed.objects.get(wp_category_id=577047203)
+            self.assertEqual((state.last_post_id, state.etag), (25, '"v25"'))
+
+            feed.count = 27
+            before = server.request_count
+            self.crawl(server)
+            # One feed page plus the two new articles
+            self.assertEqual(server.request_count - before, 3)
+            self.assertEqual(Article.objects.count(), 27)
+
+            before = server.request_count
+            self.crawl(server)
+            # Unchanged feed answers 304 to the stored ETag
+            self.assertEqual(server.request_count - before, 1)
+
+    def test_a_broken_page_keeps_the_old_marks(self):
+        for status in (500, 200):
+            with self.subTest(status=status), StandInServer() as server:
+                Article.objects.all().delete()
+                feed = MagazineFeed(server, 25)
+                server.routes['/wp-json/tc/v1/magazine'] = BrokenFeedPage(feed, 2, status)
+                self.crawl(server)
+                state = CategoryFeed.objects.get(wp_category_id=577047203)
+                self.assertEqual((state.last_post_id, state.etag), (None, ''))
+                # Page 1 is still saved, and the run is reported
+                self.assertEqual(Article.objects.count(), 10)
+                self.assertEqual(ScrapeRun.objects.filter(source='categories').count(), 1)
+                ScrapeRun.objects.all().delete()
+
+                # The next run walks past the saved posts down to the ones it missed
+                server.routes['/wp-json/tc/v1/magazine'] = feed
+                self.crawl(server)
+                self.assertEqual(Article.objects.count(), 25)
+                state.refresh_from_db()
+                self.assertEqual(state.last_post_id, 25)
+                CategoryFeed.objects.filter(pk=state.pk).update(last_post_id=None, last_post_date=None, etag='')
+                ScrapeRun.objects.all().delete()
+
+    def test_api_ingest_builds_articles_from_the_payload(self):
+        with StandInServer() as server:
+            feed = server.routes['/wp-json/tc/v1/magazine'] = MagazineFeed(server, 25)
+            self.crawl(server, ingest='api')
+            # Three feed pages and not a single article page
+            self.assertEqual(server.request_count, 3)
+            self.assertEqual(feed.feed_requests, 3)
+            article = Article.objects.get(url=f"{server.url}/article/7/")
+            self.assertEqual(article.title, 'Article 7')
+            self.assertEqual(article.content, 'First paragraph of article 7. Second paragraph.')
+            self.assertEqual(article.image_url, 'https://example.com/7.jpg')
+            self.assertEqual((article.author.name, article.category.name), ('Jane Doe', 'AI'))
+            self.assertEqual(list(article.tags.values_list('name', flat=True)), ['OpenAI'])
+
+    def test_api_ingest_downloads_posts_the_payload_lacks(self):
+        with StandInServer() as server:
+            server.routes['/wp-json/tc/v1/magazine'] = MagazineFeed(server, 5, content=False)
+            self.crawl(server, ingest='api')
+            # One feed page, then every article page for its content
+            self.assertEqual(server.request_count, 6)
+            self.assertEqual(Article.objects.count(), 5)
+            self.assertTrue(Article.objects.exclude(content='').exists())
+            self.assertEqual(Article.objects.filter(category__name='AI').count(), 5)
+
+
+@override_settings(SCRAPER_HTTP_CACHE_ENABLED=False)
+class SearchPaginatorTests(SimpleTestCase):
+    def paginate(self, total, show_count=True, **kwargs):
+        with StandInServer() as server, Fetcher() as fetcher:
+            server.routes['/search'] = SearchResults(server, total, show_count)
+            with override_settings(SCRAPER_SEARCH_URL=f"{server.url}/search"):
+                paginator = SearchPaginator(fetcher, 'open ai', window=5, **kwargs)
+                links = paginator.links()
+        return paginator, [int(link.rstrip('/').rsplit('/', 1)[-1]) for link in links]
+
+    def test_stops_at_first_empty_page(self):
+        paginator, ids = self.paginate(35, show_count=False, page_size=10)
+        self.assertEqual(ids, list(range(1, 36)))
+        # Page 1, then one window of five pages of which page 5 is empty
+        self.assertEqual(paginator.pages_fetched, 6)
+
+    def test_estimate_bounds_the_window(self):
+        paginator, ids = self.paginate(35, page_size=10)
+        self.assertEqual(ids, list(range(1, 36)))
+        self.assertEqual(paginator.estimated_pages, 4)
+        self.assertEqual(paginator.pages_fetched, 4)
+
+    def test_a_failed_page_is_not_the_end_of_the_results(self):
+        with StandInServer() as server, Fetcher() as fetcher:
+            results = SearchResults(server, 35)
+            # The third page (offset 21) is gone; the pages around it are fine
+            server.routes['/search'] = lambda path, headers: ((404, 'text/plain', b'gone') if '&b=21' in path
+                                                              else results(path, headers))
+            with override_settings(SCRAPER_SEARCH_URL=f"{server.url}/search"):
+                paginator = SearchPaginator(fetcher, 'open ai', window=5, page_size=10)
+                links = paginator.links()
+        self.assertEqual(len(links), 20)
+        self.assertFalse(paginator.complete)
+        self.assertEqual(list(paginator.failed_pages.values()), ['HTTP 404'])
+        self.assertTrue(self.paginate(35, page_size=10)[0].complete)
+
+    def test_larger_pages(self):
+        paginator, ids = self.paginate(35, page_size=50)
+        self.assertEqual(len(ids), 35)
+        self.assertEqual(paginator.pages_fetched, 1)
+
+
+@override_settings(SCRAPER_HTTP_CACHE_ENABLED=False)
+class KeywordScrapeTests(TestCase):
+    def scrape(self, server, *args):
+        with override_settings(SCRAPER_SEARCH_URL=f"{server.url}/search",
+                               SCRAPER_WP_POSTS_URL=f"{server.url}/wp-json/wp/v2/posts"):
+            call_command('scrape_techcrunch', 'open ai', *args, stdout=StringIO())
+
+    def test_known_articles_are_not_downloaded_again(self):
+        with StandInServer() as server:
+            server.routes['/search'] = SearchResults(server, 12)
+            self.scrape(server)
+            self.assertEqual(Article.objects.count(), 12)
+            self.assertEqual(Keyword.objects.get().search_results.get().items.count(), 12)
+
+            before = server.request_count
+            self.scrape(server)
+            # Two search pages and no article requests
+            self.assertEqual(server.request_count - before, 2)
+            self.assertEqual(KeywordSearchResult.objects.last().items.count(), 12)
+
+    @override_settings(SCRAPER_WP_POSTS_BATCH_SIZE=5)
+    def test_hits_are_resolved_through_wp_json(self):
+        with StandInServer() as server:
+            server.routes['/search'] = SearchResults(server, 12)
+            posts = server.routes['/wp-json/wp/v2/posts'] = WordPressPosts(server, missing=[5])
+            self.scrape(server)
+            # Two search pages, three batches of slugs and the article page of the hit without a post
+            self.assertEqual(server.request_count, 6)
+            self.assertEqual(posts.requests, 3)
+            self.assertEqual(Article.objects.count(), 12)
+            self.assertEqual(KeywordSearchResult.objects.get().items.count(), 12)
+            self.assertEqual(Article.objects.get(url=f"{server.url}/article/7/").content,
+                             'First paragraph of article 7. Second paragraph.')
+
+            Article.objects.all().delete()
+            before = server.request_count
+            self.scrape(server, '--ingest', 'html')
+            self.assertEqual(server.request_count - before, 14)
+            self.assertEqual(posts.requests, 3)
+
+
+class ScrapeRunTests(TestCase):
+    def test_profile_totals_merge_and_slowest_urls(self):
+        profile = RunProfile(slowest=2)
+        with profile.span('parse'):
+            pass
+        self.assertEqual(list(profile.timed(['a', 'b'], 'fetch')), ['a', 'b'])
+        for n, seconds in enumerate([0.3, 0.1, 0.5]):
+            profile.article(f"https://techcrunch.com/{n}/", seconds)
+        profile.error('timeout')
+
+        combined = RunProfile()
+        combined.merge(profile.as_dict())
+        combined.merge(profile.as_dict())
+        self.assertEqual(combined.stages['fetch']['count'], 6)  # Two items and the exhausted iterator, twice
+        self.assertEqual(combined.stages['parse']['count'], 2)
+        self.assertEqual(combined.errors, {'timeout': 2})
+        self.assertEqual([url for url, _ in combined.slowest_urls()][:2],
+                         ['https://techcrunch.com/2/', 'https://techcrunch.com/2/'])
+        self.assertLessEqual(combined.started_at, profile.started_at)
+
+    @override_settings(SCRAPER_HTTP_CACHE_ENABLED=False, SCRAPER_PROFILE_SLOWEST_URLS=3)
+    def test_keyword_scrape_records_a_run(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with StandInServer() as server, override_settings(SCRAPER_SEARCH_URL=f"{server.url}/search",
+                                                          SCRAPER_PROFILE_DIR=directory.name):
+            server.routes['/search'] = SearchResults(server, 6)
+            server.routes['/article/4/'] = Failing(10, status=404)
+            call_command('scrape_techcrunch', 'open ai', '--profile', 'cprofile', '--ingest', 'html',
+                         stdout=StringIO())
+        run = ScrapeRun.objects.get()
+        self.assertEqual(run.keyword.keyword, 'open ai')
+        self.assertEqual((run.articles_saved, run.articles_failed), (5, 1))
+        self.assertEqual(run.errors, {'http_404': 1})
+        self.assertEqual(run.stages['parse']['count'], 5)
+        self.assertTrue({'search', 'fetch', 'parse', 'db'} <= set(run.stages))
+        self.assertEqual(len(run.slowest_urls), 3)
+        self.assertTrue(os.path.isfile(run.profile_path))
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get(reverse('admin:scraper_keyword_change', args=[run.keyword.pk]))
+        self.assertContains(response, run.stage_summary())
+
+    @override_settings(SCRAPER_HTTP_CACHE_ENABLED=False)
+    def test_failed_search_pages_are_recorded_on_the_run(self):
+        self.addCleanup(app.conf.update, task_always_eager=app.conf.task_always_eager)
+        app.conf.update(task_always_eager=True)
+        with StandInServer() as server, override_settings(SCRAPER_SEARCH_URL=f"{server.url}/search",
+                                                          SCRAPER_SEARCH_PAGE_SIZE=2):
+            results = SearchResults(server, 6)
+            server.routes['/search'] = lambda path, headers: ((404, 'text/plain', b'gone') if '&b=3' in path
+                                                              else results(path, headers))
+            scrape_techcrunch_task.delay('open ai', ingest='html')
+        run = ScrapeRun.objects.get()
+        self.assertEqual((run.articles_saved, run.errors), (2, {'search_page_failed': 1}))
+
+
+class FailsOnce:
+    # Article route that errors on the first request
+    def __init__(self):
+        self.requests = 0
+
+    def __call__(self, path, headers):
+        self.requests += 1
+        if self.requests == 1:
+            return 503, 'text/plain', b'try again'
+        return 200, 'text/html', ARTICLE_TEMPLATE.format(title='Flaky', slug='flaky').encode('utf-8')
+
+
+@override_settings(SCRAPER_HTTP_CACHE_ENABLED=False, SCRAPER_PIPELINE_CHUNK_SIZE=5)
+class ScrapePipelineTests(TestCase):
+    def setUp(self):
+        # Retries run inline in eager mode; errors end up in the eager results instead of being raised
+        self.addCleanup(app.conf.update, task_always_eager=app.conf.task_always_eager)
+        app.conf.update(task_always_eager=True)
+
+    def test_chunks_are_scraped_and_failures_retried(self):
+        with StandInServer() as server, override_settings(SCRAPER_SEARCH_URL=f"{server.url}/search"):
+            server.routes['/search'] = SearchResults(server, 12)
+            flaky = server.routes['/article/3/'] = FailsOnce()
+            with mock.patch('scraper.tasks.chord', wraps=chord) as fan_out, \
+                    mock.patch('scraper.tasks.logger') as logger:
+                scrape_techcrunch_task.delay('open ai', ingest='html')
+        self.assertEqual([len(signature.args[0]) for signature in fan_out.call_args.args[0]], [5, 5, 2])
+        self.assertEqual(flaky.requests, 2)
+        self.assertIn('saved 12 articles (12 new, 0 skipped, 0 already stored), 0 failed',
+                      logger.info.call_args.args[0])
+        self.assertEqual(Article.objects.count(), 12)
+        self.assertEqual(KeywordSearchResult.objects.get().items.count(), 12)
+        # The chunks' stage timings end up on one run
+        run = ScrapeRun.objects.get()
+        self.assertEqual((run.articles_saved, run.stages['parse']['count']), (12, 12))
+        self.assertEqual(run.stages['search']['count'], 1)
+
+    def test_chunks_resolve_their_posts_through_wp_json(self):
+        with StandInServer() as server, override_settings(SCRAPER_SEARCH_URL=f"{server.url}/search",
+                                                          SCRAPER_WP_POSTS_URL=f"{server.url}/wp-json/wp/v2/posts"):
+            server.serve_techcrunch(12)
+            scrape_techcrunch_task.delay('open ai')
+            # One batch of slugs per chunk of five, no article pages
+            self.assertEqual(server.routes['/wp-json/wp/v2/posts'].requests, 3)
+            self.assertFalse([path for path in server.first_requested if path.startswith('/article/')])
+        self.assertEqual(KeywordSearchResult.objects.get().items.count(), 12)
+        self.assertEqual(ScrapeRun.objects.get().stages['resolve']['count'], 3)
+
+
+@override_settings(SCRAPER_HTTP_CACHE_ENABLED=False, SCRAPER_RETRY_POLICIES=NO_DELAY)
+class DeadLetterTests(TestCase):
+    def test_failures_are_recorded_and_counted(self):
+        keyword = Keyword.objects.create(keyword='open ai')
+        record_failed_urls({'https://techcrunch.com/a/': 'HTTP 500'}, keyword.pk)
+        record_failed_urls({'https://techcrunch.com/a/': 'HTTP 502', 'https://techcrunch.com/b/': 'HTTP 500'})
+        failed = FailedURL.objects.get(url='https://techcrunch.com/a/')
+        self.assertEqual((failed.failures, failed.error, failed.keyword), (2, 'HTTP 502', keyword))
+        self.assertEqual(FailedURL.objects.count(), 2)
+
+    def test_failed_urls_are_rerun_in_bulk(self):
+        keyword = Keyword.objects.create(keyword='open ai')
+        search_result = KeywordSearchResult.objects.create(keyword=keyword)
+        with StandInServer() as server:
+            down = server.routes['/article/down/'] = Failing(10)
+            urls = [f"{server.url}/article/{slug}/" for slug in ('up', 'down')]
+            record_failed_urls({url: 'HTTP 500' for url in urls}, keyword.pk, search_result.pk)
+            with Fetcher(limiter=LocalRateLimiter(), breakers=CircuitBreakers()) as fetcher, \
+                    ArticleWriter() as writer:
+                recovered, still_failed = retry_failed_urls(fetcher, FailedURL.objects.all(), writer)
+        self.assertEqual((recovered, still_failed), (1, 1))
+        self.assertEqual(down.requests, 3)
+        self.assertEqual(search_result.items.get().article.url, urls[0])
+        failed = FailedURL.objects.get()
+        self.assertEqual((failed.url, failed.failures), (urls[1], 2))
+
+    def test_articles_skipped_on_retry_stay_in_the_dead_letter(self):
+        with StandInServer() as server:
+            # Still no publication date, so the writer skips it
+            server.routes['/article/undated/'] = (200, 'text/html', ARTICLE_TEMPLATE.format(
+                title='Undated', slug='undated').replace('datetime=', 'data-when=').encode('utf-8'))
+            url = f"{server.url}/article/undated/"
+            record_failed_urls({url: 'HTTP 500'})
+            with Fetcher(limiter=LocalRateLimiter(), breakers=CircuitBreakers()) as fetcher, \
+                    ArticleWriter() as writer:
+                recovered, still_failed = retry_failed_urls(fetcher, FailedURL.objects.all(), writer)
+        self.assertEqual((recovered, still_failed, writer.skipped_count), (0, 1, 1))
+        failed = FailedURL.objects.get()
+        self.assertEqual((failed.url, failed.failures, failed.error), (url, 2, 'Not saved: no publication date'))
+
+    @override_settings(SCRAPER_WEBDRIVER_LEASE_TIMEOUT=0.1)
+    def test_exhausted_browser_pool_fails_just_the_article(self):
+        self.addCleanup(app.conf.update, task_always_eager=app.conf.task_always_eager)
+        app.conf.update(task_always_eager=True)
+        pool = WebDriverPool(size=1, factory=FakeDriver)
+        with StandInServer() as server, override_settings(SCRAPER_SEARCH_URL=f"{server.url}/search",
+                                                          SCRAPER_PIPELINE_MAX_RETRIES=0), \
+                mock.patch('scraper.pipeline.get_pool', return_value=pool), pool.lease():
+            server.routes['/search'] = SearchResults(server, 3)
+            # No JSON-LD, so the article needs Chrome for its author, category and tags
+            server.routes['/article/2/'] = (200, 'text/html', ARTICLE_TEMPLATE.format(title='Bare', slug='2').replace(
+                'application/ld+json', 'text/plain').encode('utf-8'))
+            scrape_techcrunch_task.delay('open ai', ingest='html')
+        self.assertEqual(Article.objects.count(), 2)
+        failed = FailedURL.objects.get()
+        self.assertEqual((failed.url, failed.error), (f"{server.url}/article/2/",
+                                                       'No WebDriver became available in the pool'))
+        self.assertEqual(ScrapeRun.objects.get().errors, {'browser_pool_exhausted': 1})
+
+    def test_chunk_task_dead_letters_what_it_gives_up_on(self):
+        self.addCleanup(app.conf.update, task_always_eager=app.conf.task_always_eager)
+        app.conf.update(task_always_eager=True)
+        with StandInServer() as server, override_settings(SCRAPER_SEARCH_URL=f"{server.url}/search",
+                                                          SCRAPER_PIPELINE_MAX_RETRIES=0):
+            server.routes['/search'] = SearchResults(server, 3)
+            server.routes['/article/1/'] = Failing(10)
+            scrape_techcrunch_task.delay('open ai', ingest='html')
+        self.assertEqual(Article.objects.count(), 2)
+        self.assertEqual(FailedURL.objects.get().keyword.keyword, 'open ai')
+
+    def test_chunk_task_retries_only_transient_failures(self):
+        self.addCleanup(app.conf.update, task_always_eager=app.conf.task_always_eager)
+        app.conf.update(task_always_eager=True)
+        with StandInServer() as server, override_settings(SCRAPER_SEARCH_URL=f"{server.url}/search",
+                                                          SCRAPER_PIPELINE_RETRY_DELAY=0):
+            server.routes['/search'] = SearchResults(server, 3)
+            # Fails the chunk's first attempt (1 + 2 fetcher retries), then recovers on the task retry
+            flaky = server.routes['/article/1/'] = Failing(3)
+            gone = server.routes['/article/2/'] = Failing(10, status=404)
+            scrape_techcrunch_task.delay('open ai', ingest='html')
+        self.assertEqual((flaky.requests, gone.requests), (4, 1))
+        self.assertEqual(Article.objects.count(), 2)
+        failed = FailedURL.objects.get()
+        self.assertEqual((failed.url, failed.error), (f"{server.url}/article/2/", 'HTTP 404'))
+        self.assertEqual(ScrapeRun.objects.get().articles_failed, 1)
+
+
+class Revalidating:
+    # Article route that honours If-None-Match
+    def __init__(self):
+        self.version = 1
+        self.conditional_requests = 0
+
+    def __call__(self, path, headers):
+        etag = f'"v{self.version}"'
+        if headers.get('If-None-Match'):
+            self.conditional_requests += 1
+            if headers['If-None-Match'] == etag:
+                return 304, 'text/html', b'', {'ETag': etag}
+        return 200, 'text/html', f"version {self.version}".encode('utf-8'), {'ETag': etag}
+
+
+class HttpCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def fetch(self, server, cache, path='/page'):
+        with Fetcher(cache=cache) as fetcher:
+            return fetcher.fetch(f"{server.url}{path}")
+
+    def test_fresh_entries_skip_the_network(self):
+        with StandInServer() as server:
+            server.routes['/page'] = Revalidating()
+            cache = HttpCache(self.directory, ttl=60)
+            self.fetch(server, cache)
+            result = self.fetch(server, HttpCache(self.directory, ttl=60))
+        self.assertEqual(server.request_count, 1)
+        self.assertTrue(result.from_cache)
+        self.assertEqual(result.content, b'version 1')
+
+    def test_stale_entries_are_revalidated(self):
+        with StandInServer() as server:
+            route = server.routes['/page'] = Revalidating()
+            cache = HttpCache(self.directory, ttl=0)
+            with Fetcher(cache=cache) as fetcher:
+                fetcher.fetch(f"{server.url}/page")
+                unchanged = fetcher.fetch(f"{server.url}/page")
+                route.version = 2
+                changed = fetcher.fetch(f"{server.url}/page")
+        self.assertEqual(route.conditional_requests, 2)
+        self.assertEqual((unchanged.status, unchanged.content, unchanged.from_cache), (200, b'version 1', True))
+        self.assertEqual((changed.content, changed.from_cache), (b'version 2', False))
+        self.assertEqual((cache.stats['misses'], cache.stats['revalidated']), (2, 1))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = HttpCache(self.directory, ttl=60, max_bytes=250)
+        headers = CaseInsensitiveDict()
+        for n in range(3):
+            cache.store(f"https://techcrunch.com/{n}/", 200, headers, b'x' * 100)
+            cache.lookup('https://techcrunch.com/0/')  # Keeps the first entry recently used
+        self.assertIsNotNone(cache.lookup('https://techcrunch.com/0/'))
+        self.assertIsNone(cache.lookup('https://techcrunch.com/1/'))
+        self.assertIsNotNone(cache.lookup('https://techcrunch.com/2/'))
+        self.assertEqual(cache.stats['evicted'], 1)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        with ArticleWriter(batch_size=10) as writer:
+            for n in range(5):
+                writer.add(make_record(n))
+
+    def test_streams_csv_and_ndjson_into_the_zip(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            zip_filename = write_export(Article.objects.order_by('id'), 'AI')
+        # Only the finished zip is left behind
+        self.assertEqual(os.listdir(self.media_root), [zip_filename])
+        with zipfile.ZipFile(os.path.join(self.media_root, zip_filename)) as zipf:
+            names = sorted(zipf.namelist())
+            self.assertEqual([os.path.splitext(name)[1] for name in names], ['.csv', '.ndjson'])
+            rows = list(csv.reader(io.TextIOWrapper(zipf.open(names[0]), encoding='utf-8', newline='')))
+            lines = zipf.read(names[1]).decode('utf-8').splitlines()
+        self.assertEqual(rows[0], CSV_HEADER)
+        self.assertEqual([row[0] for row in rows[1:]], [f"Article {n}" for n in range(5)])
+        self.assertEqual(sorted(rows[1][7].split('; ')), ['Funding', 'OpenAI'])
+        first = json.loads(lines[0])
+        self.assertEqual(len(lines), 5)
+        self.assertEqual((first['title'], first['author_name'], first['category_name']), ('Article 0', 'Jane Doe', 'AI'))
+        self.assertEqual(sorted(first['tags']), ['Funding', 'OpenAI'])
+
+    def export(self, group_by):
+        with self.settings(MEDIA_ROOT=self.media_root), CaptureQueriesContext(connection) as queries:
+            zip_filenames = write_grouped_exports(Article.objects.all(), group_by, chunk_size=100)
+        return zip_filenames, len(queries)
+
+    def test_grouped_export_queries_depend_on_groups_not_articles(self):
+        keyword = Keyword.objects.create(keyword='ai')
+        Article.objects.update(keyword=keyword)
+        _, small_queries = self.export('category')
+        with ArticleWriter(batch_size=50) as writer:
+            for n in range(5, 50):
+                writer.add(make_record(n, category=f"Category {n % 4}", tags=(f"Tag {n}", 'Funding')),
+                           keyword=keyword)
+        zip_filenames, large_queries = self.export('category')
+        # The group names, then an article query and a tag prefetch per group for each of the zip's two
+        # entries, however many articles there are
+        self.assertEqual(small_queries, 1 + 4)
+        self.assertEqual(large_queries, 1 + 5 * 4)
+        self.assertEqual(len(zip_filenames), 5)
+        zip_filenames, keyword_queries = self.export('keyword')
+        self.assertEqual((len(zip_filenames), keyword_queries), (1, 1 + 4))
+        with zipfile.ZipFile(os.path.join(self.media_root, zip_filenames[0])) as zipf:
+            ndjson_name = next(name for name in zipf.namelist() if name.endswith('.ndjson'))
+            self.assertEqual(len(zipf.read(ndjson_name).splitlines()), 50)
+
+    def read_ndjson(self, export_format, open_stream):
+        with self.settings(MEDIA_ROOT=self.media_root, SCRAPER_EXPORT_CHUNK_SIZE=2):
+            filename = write_export(Article.objects.order_by('id'), 'AI', export_format)
+        self.assertEqual(os.listdir(self.media_root), [filename])
+        with open_stream(os.path.join(self.media_root, filename)) as f:
+            return [json.loads(line) for line in io.TextIOWrapper(f, encoding='utf-8')]
+
+    def test_gzip_ndjson(self):
+        rows = self.read_ndjson('ndjson.gz', lambda path: gzip.open(path, 'rb'))
+        self.assertEqual([row['title'] for row in rows], [f"Article {n}" for n in range(5)])
+
+    @skipUnless(importlib.util.find_spec('zstandard'), 'zstandard is not installed')
+    def test_zstd_ndjson(self):
+        import zstandard
+        rows = self.read_ndjson('ndjson.zst', lambda path: zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')))
+        self.assertEqual([row['title'] for row in rows], [f"Article {n}" for n in range(5)])
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_parquet_has_typed_columns(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        with self.settings(MEDIA_ROOT=self.media_root, SCRAPER_EXPORT_CHUNK_SIZE=2):
+            filename = write_export(Article.objects.order_by('id'), 'AI', 'parquet')
+        parquet = pq.ParquetFile(os.path.join(self.media_root, filename))
+        self.assertEqual(parquet.metadata.num_row_groups, 3)
+        table = parquet.read()
+        self.assertEqual(table.schema.field('publication_date').type, pa.timestamp('us', tz='UTC'))
+        self.assertEqual(table.schema.field('tags').type, pa.list_(pa.string()))
+        self.assertEqual(sorted(table.column('tags')[0].as_py()), ['Funding', 'OpenAI'])
+        self.assertEqual(table.column('publication_date')[0].as_py(), Article.objects.order_by('id')[0].publication_date)
+
+    def test_unknown_formats_are_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            check_export_format('xlsx')
+
+
+class ExportJobTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        with ArticleWriter(batch_size=10) as writer:
+            for n in range(6):
+                writer.add(make_record(n, category='AI' if n % 2 else 'Apps'))
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    def test_export_action_dispatches_one_job_per_category(self):
+        ids = list(Article.objects.values_list('id', flat=True))
+        with mock.patch('scraper.admin.export_articles_task.delay') as delay:
+            response = self.client.post(reverse('admin:scraper_article_changelist'),
+                                        {'action': 'export_articles_by_category', '_selected_action': ids,
+                                         'export_format': 'ndjson.gz'})
+        jobs = ExportJob.objects.order_by('name')
+        self.assertEqual(response.url, f"{reverse('your_download_page')}?batch={jobs[0].batch}")
+        self.assertEqual([(job.name, job.status, job.export_format, job.total_rows) for job in jobs],
+                         [('AI', 'pending', 'ndjson.gz', 3), ('Apps', 'pending', 'ndjson.gz', 3)])
+        self.assertEqual(sorted(call.args for call in delay.call_args_list), [(job.pk,) for job in jobs])
+
+        with self.settings(MEDIA_ROOT=self.media_root):
+            for call in delay.call_args_list:
+                export_articles_task(*call.args)
+        status = self.client.get(reverse('export_job_status'), {'batch': jobs[0].batch}).json()
+        for job in status['jobs']:
+            self.assertEqual((job['status'], job['rows_done']), ('done', 3))
+            self.assertTrue(job['filename'].endswith('.ndjson.gz'))
+            self.assertEqual(job['download_url'], f"http://testserver{reverse('download_zip', args=[job['filename']])}")
+            self.assertEqual(job['bytes_written'], os.path.getsize(os.path.join(self.media_root, job['filename'])))
+            self.assertIsNotNone(job['duration'])
+        page = self.client.get(reverse('your_download_page'), {'batch': jobs[0].batch})
+        self.assertContains(page, status['jobs'][0]['filename'])
+
+    def test_jobs_export_just_the_selected_articles(self):
+        selected = list(Article.objects.order_by('id').values_list('id', flat=True)[:4])
+        batch, jobs = create_export_jobs(Article.objects.filter(pk__in=selected), 'category', 'ndjson.gz')
+        self.assertEqual(sorted((job.name, job.total_rows) for job in jobs), [('AI', 2), ('Apps', 2)])
+        with self.settings(MEDIA_ROOT=self.media_root):
+            for job in jobs:
+                export_articles_task(job.pk)
+                job.refresh_from_db()
+                with gzip.open(os.path.join(self.media_root, job.filename), 'rt') as f:
+                    titles = [json.loads(line)['title'] for line in f]
+                self.assertEqual(titles, [f"Article {n}" for n in range(4) if (n % 2 == 1) == (job.name == 'AI')])
+
+    def test_failed_jobs_record_the_error(self):
+        job = ExportJob.objects.create(batch=uuid.uuid4(), group_by='category', name='AI', total_rows=1)
+        with self.settings(MEDIA_ROOT=self.media_root), \
+                mock.patch('scraper.exporting.write_export', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                export_articles_task(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', 'disk full'))
+        self.assertIsNotNone(job.finished_at)
+
+
+class DownloadTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        with open(os.path.join(directory.name, 'AI_export.zip'), 'wb') as f:
+            f.write(bytes(range(256)) * 4)
+        self.settings_override = self.settings(MEDIA_ROOT=directory.name, SCRAPER_DOWNLOAD_ACCEL_PREFIX=None)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.url = reverse('download_zip', args=['AI_export.zip'])
+
+    def test_serves_the_whole_file_with_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(256)) * 4)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], '1024')
+        cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_range_requests_resume_downloads(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1000-', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 1000-1023/1024')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(232, 256)))
+        suffix = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(suffix.streaming_content), bytes(range(252, 256)))
+        # A changed file means the whole body is sent again
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=1000-', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=2000-').status_code, 416)
+        # An invalid range is ignored rather than refused
+        invalid = self.client.get(self.url, HTTP_RANGE='bytes=500-100')
+        self.assertEqual((invalid.status_code, len(b''.join(invalid.streaming_content))), (200, 1024))
+
+    def test_missing_files_are_not_found(self):
+        self.assertEqual(self.client.get(reverse('download_zip', args=['missing.zip'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('download_zip', args=['..'])).status_code, 404)
+
+    def test_hands_the_transfer_to_nginx(self):
+        with self.settings(SCRAPER_DOWNLOAD_ACCEL_PREFIX='/protected-media/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/AI_export.zip')
+        self.assertEqual(response.content, b'')
+        self.assertIn('ETag', response)
+
+    def test_content_type_follows_the_export_format(self):
+        for filename, content_type in [('AI.zip', 'application/zip'), ('AI.ndjson.gz', 'application/gzip'),
+                                       ('AI.ndjson.zst', 'application/zstd'),
+                                       ('AI.parquet', 'application/vnd.apache.parquet'),
+                                       ('AI.unknownformat', 'application/octet-stream')]:
+            with open(os.path.join(self.media_root, filename), 'wb') as f:
+                f.write(b'data')
+            url = reverse('download_zip', args=[filename])
+            with self.subTest(filename=filename):
+                self.assertEqual(self.client.get(url)['Content-Type'], content_type)
+                self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=1-')['Content-Type'], content_type)
+                with self.settings(SCRAPER_DOWNLOAD_ACCEL_PREFIX='/protected-media/'):
+                    self.assertEqual(self.client.get(url)['Content-Type'], content_type)
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        with ArticleWriter(batch_size=10) as writer:
+            writer.add(make_record(1)._replace(title='Nvidia ships new GPUs', content='Chips for datacenters.'))
+            writer.add(make_record(2)._replace(content='Analysts say Nvidia is expanding.'))
+            writer.add(make_record(3, author='Kyle Wiggers', tags=('Robotics',)))
+
+    def titles(self, query):
+        return [article.title for article in fulltext.search_articles(query)]
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self.titles('nvidia'), ['Nvidia ships new GPUs', 'Article 2'])
+        self.assertEqual(self.titles('chip'), ['Nvidia ships new GPUs'])  # Stemmed
+
+    def test_searches_tags_and_author(self):
+        self.assertEqual(self.titles('robotics'), ['Article 3'])
+        self.assertEqual(self.titles('wiggers'), ['Article 3'])
+
+    def test_operators_in_user_input_are_literal(self):
+        self.assertEqual(self.titles('nvidia AND ("'), [])
+        self.assertEqual(self.titles('"nvidia" -'), ['Nvidia ships new GPUs', 'Article 2'])
+        self.assertEqual(self.titles('*'), [])
+
+    def test_refreshed_articles_are_reindexed(self):
+        with ArticleWriter(refresh=True) as writer:
+            writer.add(make_record(2)._replace(content='Nothing about chips any more.'))
+        self.assertEqual(self.titles('nvidia'), ['Nvidia ships new GPUs'])
+
+    def test_edits_outside_the_writer_are_reindexed(self):
+        article = Article.objects.get(title='Article 3')
+        article.title = 'Humanoid robots'
+        article.save()
+        self.assertEqual(self.titles('humanoid'), ['Humanoid robots'])
+
+        article.tags.add(Tag.objects.create(name='Drones'))
+        ArticleTag.objects.create(article=article, tag=Tag.objects.create(name='Warehouses'))
+        self.assertEqual(self.titles('drones warehouses'), ['Humanoid robots'])
+        article.tags.clear()
+        self.assertEqual(self.titles('drones'), [])
+
+        Author.objects.filter(name='Kyle Wiggers').update(name='Unused')  # Bypasses signals
+        author = Author.objects.get(name='Unused')
+        author.name = 'Devin Coldewey'
+        author.save()
+        self.assertEqual(self.titles('coldewey'), ['Humanoid robots'])
+        tag = Tag.objects.get(name='OpenAI')
+        tag.name = 'Anthropic'
+        tag.save()
+        self.assertEqual(len(self.titles('anthropic')), 2)
+
+        article_id = article.pk
+        article.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {fulltext.SQLITE_TABLE} WHERE rowid = %s", [article_id])
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertEqual(self.titles('humanoid'), [])
+
+    def test_adopted_legacy_rows_are_indexed(self):
+        legacy = Article.objects.bulk_create([Article(
+            title='Article 9', author=Author.objects.create(name='Legacy author'),
+            category=Category.objects.create(name='Legacy'), publication_date=timezone.now(),
+            content='Zeppelin history', image_url='https://example.com/a.jpg')])[0]
+        self.assertEqual(self.titles('zeppelin'), [])  # bulk_create skips the signals
+        with ArticleWriter() as writer:
+            writer.add(make_record(9))
+        self.assertEqual([article.pk for article in fulltext.search_articles('zeppelin')], [legacy.pk])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {fulltext.SQLITE_TABLE}")
+        self.assertEqual(self.titles('nvidia'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 3 articles', out.getvalue())
+        self.assertEqual(self.titles('nvidia'), ['Nvidia ships new GPUs', 'Article 2'])
+
+    def test_admin_and_api_search(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        changelist = self.client.get(reverse('admin:scraper_article_changelist'), {'q': 'nvidia'})
+        self.assertEqual(changelist.context['cl'].result_count, 2)
+        response = self.client.get(reverse('search_articles'), {'q': 'nvidia', 'limit': 1}).json()
+        self.assertEqual([result['title'] for result in response['results']], ['Nvidia ships new GPUs'])
+        self.assertGreater(response['results'][0]['rank'], 0)
+        for limit in ('-1', '0'):
+            response = self.client.get(reverse('search_articles'), {'q': 'nvidia', 'limit': limit}).json()
+            self.assertEqual(len(response['results']), 1)
+        self.assertEqual(self.client.get(reverse('search_articles'), {'q': 'nvidia', 'limit': 'ten'}).status_code, 400)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+class QueryPlanTests(TestCase):
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf"USING (COVERING )?INDEX {index}\b", f"{queryset.query}\n{plan}")
+
+    def test_scraper_lookups(self):
+        self.assertUsesIndex(Article.objects.filter(url__in=['https://techcrunch.com/a/']), 'sqlite_autoindex_scraper_article_1')
+        self.assertUsesIndex(Article.objects.filter(content_hash__in=['abc']), r'scraper_article_content_hash_\w+')
+        self.assertUsesIndex(Article.objects.filter(url__isnull=True, title__in=['Article 1']), 'article_title_url_idx')
+        self.assertUsesIndex(ArticleTag.objects.filter(article_id=1, tag_id=2), 'sqlite_autoindex_scraper_articletag_1')
+        self.assertUsesIndex(KeywordSearchResultItem.objects.filter(search_result_id=1, article_id=2),
+                             'sqlite_autoindex_scraper_keywordsearchresultitem_1')
+
+    def test_admin_changelist(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        changelist = reverse('admin:scraper_article_changelist')
+        self.assertUsesIndex(self.client.get(changelist).context['cl'].queryset, 'article_pub_date_idx')
+        category, _ = Category.objects.bulk_create([Category(name='AI'), Category(name='Apps')])
+        filtered = self.client.get(changelist, {'category__id__exact': category.id}).context['cl'].queryset
+        self.assertUsesIndex(filtered, 'article_cat_pub_date_idx')
+        self.assertUsesIndex(Article.objects.order_by('-created_at'), 'article_created_idx')
+
+    def test_relations_are_unique(self):
+        with ArticleWriter() as writer:
+            writer.add(make_record(1))
+        article_tag = ArticleTag.objects.first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ArticleTag.objects.create(article_id=article_tag.article_id, tag_id=article_tag.tag_id)
+        search_result = KeywordSearchResult.objects.create(keyword=Keyword.objects.create(keyword='ai'))
+        # Linking the same article twice is a no-op rather than an error
+        for _ in range(2):
+            ArticleWriter().link_existing(['https://techcrunch.com/article-1/'], search_result)
+        self.assertEqual(search_result.items.count(), 1)
+
+
+class NameCacheTests(TestCase):
+    def setUp(self):
+        reset_name_cache_stats()
+        self.addCleanup(clear_name_caches)
+
+    def write(self, records):
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            with ArticleWriter(batch_size=len(records)) as writer:
+                for record in records:
+                    writer.add(record)
+        return len(queries)
+
+    def test_warm_cache_skips_lookup_queries(self):
+        cold = self.write([make_record(n, tags=(f"t{n % 3}",)) for n in range(10)])
+        warm = self.write([make_record(n, tags=(f"t{n % 3}",)) for n in range(10, 20)])
+        # An insert and a select for each of authors, categories and tags
+        self.assertEqual(cold - warm, 6)
+        self.assertEqual((NAME_CACHES['tag'].hits, NAME_CACHES['tag'].misses), (3, 3))
+        self.assertEqual(Article.objects.filter(tags__name='t1').count(), 7)
+
+    def test_rolled_back_inserts_are_not_cached(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            NAME_CACHES['tag'].resolve({'Ephemeral'})
+            raise RuntimeError
+        self.write([make_record(1, tags=('Ephemeral',))])
+        self.assertEqual(list(Article.objects.get().tags.values_list('name', flat=True)), ['Ephemeral'])
+
+    def test_least_recently_used_names_are_evicted(self):
+        cache = NameCache(Tag, max_size=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            cache.resolve({'a', 'b'})
+        with self.captureOnCommitCallbacks(execute=True):
+            cache.resolve({'a'})
+            cache.resolve({'c'})
+        self.assertEqual(list(cache._ids), ['a', 'c'])
+
+
+class StaleNameCacheTests(TransactionTestCase):
+    def setUp(self):
+        self.addCleanup(clear_name_caches)
+
+    def test_deleted_rows_are_looked_up_again(self):
+        with ArticleWriter() as writer:
+            writer.add(make_record(1))
+        Tag.objects.filter(name='OpenAI').delete()
+        with ArticleWriter() as writer:
+            writer.add(make_record(2))
+        self.assertEqual(sorted(Article.objects.get(title='Article 2').tags.values_list('name', flat=True)),
+                         ['Funding', 'OpenAI'])
+
+
+@override_settings(SCRAPER_HTTP_CACHE_ENABLED=False)
+class MetricsTests(TestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_scrape_is_instrumented(self):
+        with StandInServer() as server, Fetcher() as fetcher, ArticleWriter() as writer:
+            before = {
+                'fetches': self.sample('scraper_fetch_duration_seconds_count', host='127.0.0.1', status='200'),
+                'parses': self.sample('scraper_parse_duration_seconds_count', backend='lxml'),
+                'flushes': self.sample('scraper_db_flush_duration_seconds_count'),
+                'created': self.sample('scraper_articles_written_total', result='created'),
+            }
+            scrape_articles(fetcher, [f"{server.url}/article/{n}/" for n in range(3)], writer)
+        self.assertEqual(self.sample('scraper_fetch_duration_seconds_count', host='127.0.0.1', status='200'),
+                         before['fetches'] + 3)
+        self.assertEqual(self.sample('scraper_parse_duration_seconds_count', backend='lxml'), before['parses'] + 3)
+        self.assertEqual(self.sample('scraper_db_flush_duration_seconds_count'), before['flushes'] + 1)
+        self.assertEqual(self.sample('scraper_articles_written_total', result='created'), before['created'] + 3)
+
+    def test_task_runtime_and_queue_wait(self):
+        labels = {'task': summarize_scrape_task.name, 'state': 'SUCCESS'}
+        before = self.sample('scraper_task_duration_seconds_count', **labels)
+        summarize_scrape_task.apply(args=([], 1))
+        self.assertEqual(self.sample('scraper_task_duration_seconds_count', **labels), before + 1)
+
+        headers = {}
+        metrics.stamp_published(headers=headers)
+        task = mock.Mock(request={'published_at': headers['published_at'] - 2})
+        task.name = 'queued'
+        metrics.task_started(task_id='t1', task=task)
+        self.assertGreaterEqual(self.sample('scraper_task_queue_wait_seconds_sum', task='queued'), 2)
+
+    def test_metrics_endpoint(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'scraper_fetch_duration_seconds', response.content)
+
+    @override_settings(SCRAPER_METRICS_TOKEN='s3cret', SCRAPER_METRICS_ALLOWED_IPS=['10.0.0.0/8'])
+    def test_metrics_endpoint_needs_the_token_outside_the_allowlist(self):
+        outside = {'REMOTE_ADDR': '192.0.2.7'}
+        self.assertEqual(self.client.get(reverse('metrics'), **outside).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong', **outside).status_code,
+                         403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret', **outside).status_code,
+                         200)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.1.2.3').status_code, 200)
+
+
+class BenchmarkReportTests(SimpleTestCase):
+    def test_a_scenario_that_saved_nothing_reports_na(self):
+        empty = {'articles': 0, 'failed': 3, 'seconds': 1.5, 'articles_per_sec': 0.0, 'latency_p50': None,
+                 'latency_p99': None, 'queries_per_article': None, 'peak_rss_mb': 80.0}
+        baseline = {'scenarios': {'keyword': dict(empty, articles=10, articles_per_sec=6.7, latency_p50=0.2,
+                                                  latency_p99=0.9, queries_per_article=4.0)}}
+        command = BenchmarkCommand(stdout=StringIO())
+        summary = command.summary('keyword', empty)
+        self.assertIn('latency p50 n/a p99 n/a, n/a queries per article', summary)
+        command.compare(baseline, {'scenarios': {'keyword': empty}})
+        output = command.stdout.getvalue()
+        self.assertIn('latency_p50 n/a', output)
+        self.assertIn('articles_per_sec -100.0%', output)
+        # The baseline can be the empty run too
+        command.compare({'scenarios': {'keyword': empty}}, baseline)
+        self.assertIn('queries_per_article n/a', command.stdout.getvalue())
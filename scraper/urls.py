@@ -1,7 +1,10 @@
 from django.urls import path
-from .views import download_zip_file, display_download_links
+from .views import download_zip_file, display_download_links, export_job_status, metrics_view, search
 
 urlpatterns = [
     path('download/<str:filename>/', download_zip_file, name='download_zip'),
     path('download-page/', display_download_links, name='your_download_page'),
+    path('export-jobs/', export_job_status, name='export_job_status'),
+    path('search/', search, name='search_articles'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
@@ -1,25 +1,200 @@
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
-from django.http import FileResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.conf import settings
+from django.urls import reverse
+from django.utils.http import content_disposition_header
+from django.views.decorators.http import condition
+from .fulltext import search_articles
+from . import metrics
+from .models import ExportJob
+from datetime import datetime, timezone
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from urllib.parse import quote
+import hmac
+import ipaddress
+import mimetypes
 import os
+import re
 
 # Create your views here.
 
 
-def download_zip_file(request, filename):
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# MIME types of the export formats, by file extension; mimetypes only knows some of them
+EXPORT_CONTENT_TYPES = {
+    '.zip': 'application/zip',
+    '.ndjson.gz': 'application/gzip',
+    '.ndjson.zst': 'application/zstd',
+    '.parquet': 'application/vnd.apache.parquet',
+}
+
+
+def export_path(filename):
+    # Only plain filenames inside MEDIA_ROOT can be downloaded
     file_path = os.path.join(settings.MEDIA_ROOT, filename)
-    if os.path.exists(file_path):
-        response = FileResponse(open(file_path, 'rb'), as_attachment=True)
+    if os.path.basename(filename) != filename or not os.path.isfile(file_path):
+        raise Http404(f"No export named {filename}")
+    return file_path
+
+
+def export_content_type(filename):
+    for extension, content_type in EXPORT_CONTENT_TYPES.items():
+        if filename.endswith(extension):
+            return content_type
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def export_etag(request, filename):
+    stat = os.stat(export_path(filename))
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def export_last_modified(request, filename):
+    return datetime.fromtimestamp(os.stat(export_path(filename)).st_mtime, tz=timezone.utc)
+
+
+def parse_range(header, size):
+    # A single `bytes=start-end` range as (start, end) inclusive; None serves the whole file, which
+    # is also what RFC 9110 asks for when the header is invalid (e.g. start after end)
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start and end and int(start) > int(end):
+        return None
+    if not start:
+        return max(size - int(end), 0), size - 1
+    return int(start), min(int(end), size - 1) if end else size - 1
+
+
+def read_range(file, start, length, chunk_size=64 * 1024):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@staff_member_required
+@condition(etag_func=export_etag, last_modified_func=export_last_modified)
+def download_zip_file(request, filename):
+    file_path = export_path(filename)
+    if settings.SCRAPER_DOWNLOAD_ACCEL_PREFIX:
+        # nginx sends the file itself (sendfile, Range, Content-Length) from its internal location
+        response = HttpResponse(content_type=export_content_type(filename))
+        response['X-Accel-Redirect'] = f"{settings.SCRAPER_DOWNLOAD_ACCEL_PREFIX}{quote(filename)}"
+        response['Content-Disposition'] = content_disposition_header(True, filename)
         return response
 
+    size = os.path.getsize(file_path)
+    byte_range = None
+    # If-Range only resumes a download when the file hasn't changed in between
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if 'HTTP_RANGE' in request.META and if_range in (None, export_etag(request, filename)):
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+    if byte_range is None:
+        # wsgi.file_wrapper lets gunicorn use sendfile for the whole file
+        response = FileResponse(open(file_path, 'rb'), as_attachment=True, filename=filename,
+                                content_type=export_content_type(filename))
+    else:
+        start, end = byte_range
+        # Valid but past the end of the file
+        if start >= size:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+        response = StreamingHttpResponse(read_range(open(file_path, 'rb'), start, end - start + 1),
+                                         status=206, content_type=export_content_type(filename))
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def export_jobs(request):
+    # The jobs of one admin export action, or the most recent ones
+    jobs = ExportJob.objects.order_by('-created_at', '-id')
+    batch = request.GET.get('batch')
+    if batch:
+        return jobs.filter(batch=batch).order_by('group_by', 'name')
+    return jobs[:20]
 
-def display_download_links(request):
-    # Retrieve download URLs from the session for both actions
-    download_urls_by_category = request.session.pop('download_urls_by_category', [])
-    download_urls_by_keyword = request.session.pop('download_urls_by_keyword', [])
 
-    # Render the template with the download URLs for both actions
+def job_state(request, job):
+    return {
+        'id': job.id,
+        'group_by': job.group_by,
+        'export_format': job.export_format,
+        'name': job.name,
+        'status': job.status,
+        'total_rows': job.total_rows,
+        'rows_done': job.rows_done,
+        'bytes_written': job.bytes_written,
+        'duration': job.duration,
+        'error': job.error,
+        'filename': job.filename,
+        'download_url': (request.build_absolute_uri(reverse('download_zip', args=[job.filename]))
+                         if job.status == 'done' else None),
+    }
+
+
+@staff_member_required
+def display_download_links(request):
+    jobs = [job_state(request, job) for job in export_jobs(request)]
     return render(request, 'scraper/download_links.html', {
-        'download_urls_by_category': download_urls_by_category,
-        'download_urls_by_keyword': download_urls_by_keyword,
+        'jobs_by_category': [job for job in jobs if job['group_by'] == 'category'],
+        'jobs_by_keyword': [job for job in jobs if job['group_by'] == 'keyword'],
+        'batch': request.GET.get('batch', ''),
     })
+
+
+@staff_member_required
+def export_job_status(request):
+    # Polled by the download page until every job has finished
+    return JsonResponse({'jobs': [job_state(request, job) for job in export_jobs(request)]})
+
+
+@staff_member_required
+def search(request):
+    # Ranked full-text search over title, content, tags and author
+    query = request.GET.get('q', '').strip()
+    try:
+        # Zero or negative would mean the default on one path and no limit at all in SQLite
+        limit = max(1, min(int(request.GET.get('limit', settings.SCRAPER_FULLTEXT_LIMIT)), 500))
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+    articles = search_articles(query, limit=limit) if query else []
+    return JsonResponse({'query': query, 'results': [{
+        'id': article.id,
+        'title': article.title,
+        'url': article.url,
+        'author': article.author.name,
+        'category': article.category.name,
+        'publication_date': article.publication_date,
+        'rank': article.search_rank,
+    } for article in articles]})
+
+
+def metrics_allowed(request):
+    # A bearer SCRAPER_METRICS_TOKEN, or a client inside SCRAPER_METRICS_ALLOWED_IPS
+    token = settings.SCRAPER_METRICS_TOKEN
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return True
+    try:
+        client = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(client in ipaddress.ip_network(network) for network in settings.SCRAPER_METRICS_ALLOWED_IPS)
+
+
+def metrics_view(request):
+    # nginx keeps it off the public site, but web:8000 can still be reached without it
+    if not metrics_allowed(request):
+        return HttpResponse(status=403)
+    return HttpResponse(generate_latest(metrics.registry()), content_type=CONTENT_TYPE_LATEST)
@@ -128,6 +128,7 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # Scrape chunks are long; let idle processes pick them up instead of one hoarding them
 
 """
 CELERY_BEAT_SCHEDULE = {
@@ -154,3 +155,64 @@ LOGGING = {
         },
     },
 }
+
+# Scraper
+SCRAPER_USER_AGENT = 'Mozilla/5.0 (compatible; techcrunch-scraper)'
+SCRAPER_FETCH_CONCURRENCY = 20  # Max requests in flight per fetcher
+SCRAPER_FETCH_PER_HOST = 8  # Max open connections to a single host
+SCRAPER_FETCH_TIMEOUT = 30  # Seconds per request
+SCRAPER_RATE_LIMIT_REDIS_URL = CELERY_BROKER_URL  # Shared token buckets; None keeps the budgets per process
+SCRAPER_RATE_LIMITS = {  # Requests per second and burst size per host, shared by every worker
+    'techcrunch.com': {'rate': 4, 'burst': 8},
+    'search.techcrunch.com': {'rate': 2, 'burst': 4},
+}
+SCRAPER_RATE_LIMIT_DEFAULT = None  # Budget for hosts not listed above; None leaves them unlimited
+SCRAPER_RATE_LIMIT_MAX_RETRIES = 3  # Times a 429 (or a 503 with Retry-After) is waited out and retried
+SCRAPER_RATE_LIMIT_BACKOFF = 5  # Seconds to hold off a host that sent no Retry-After, doubled per retry
+SCRAPER_RATE_LIMIT_REDIS_COOLDOWN = 30  # Seconds on per-process budgets after Redis fails, before trying it again
+SCRAPER_RETRY_POLICIES = {  # Retries per error class on the fetch path; delays are jittered up to base * 2 ** n
+    'timeout': {'attempts': 2, 'base': 1, 'cap': 10},
+    'connection': {'attempts': 3, 'base': 0.5, 'cap': 10},  # Refused or reset connections, broken responses
+    'server_error': {'attempts': 3, 'base': 1, 'cap': 30},  # 5xx
+}
+SCRAPER_CIRCUIT_FAILURE_THRESHOLD = 5  # Failures in a row before a host's requests are shed
+SCRAPER_CIRCUIT_RESET_TIMEOUT = 30  # Seconds a circuit stays open before a probe request is let through
+SCRAPER_CHROMEDRIVER_PATH = None  # Resolved with webdriver_manager at worker startup when unset
+SCRAPER_WEBDRIVER_POOL_SIZE = 1  # Warm Chrome sessions per worker process
+SCRAPER_WEBDRIVER_MAX_PAGES = 200  # Recycle a session after this many page loads
+SCRAPER_WEBDRIVER_MAX_RSS_MB = 1024  # Recycle a session once Chrome grows past this
+SCRAPER_WEBDRIVER_LEASE_TIMEOUT = 120  # Seconds to wait for a free session
+SCRAPER_WEBDRIVER_WARM_ON_START = False  # Start the pool's browsers when a worker process boots
+SCRAPER_WEBDRIVER_PAGE_ATTEMPTS = 2  # Page loads tried in Chrome before an article is counted as failed
+SCRAPER_PARSER_BACKEND = 'lxml'  # 'lxml', 'selectolax' or 'html.parser'
+SCRAPER_WRITE_BATCH_SIZE = 100  # Articles buffered before a bulk write
+SCRAPER_WRITE_FLUSH_INTERVAL = 30  # Seconds before a partial batch is written anyway
+SCRAPER_NAME_CACHE_SIZE = 10000  # Author, category, tag and keyword ids cached per worker process and table
+SCRAPER_MAGAZINE_FEED_URL = 'https://techcrunch.com/wp-json/tc/v1/magazine'
+SCRAPER_CATEGORY_MAX_PAGES = 20  # Upper bound on feed pages per category and run
+SCRAPER_MAGAZINE_PER_PAGE = 100  # Posts per feed page; WordPress caps `per_page` at 100
+SCRAPER_SEARCH_URL = ('https://search.techcrunch.com/search;_ylt=AwrEqgcix.VlUJI22lenBWVH;_ylu'
+                      '=Y29sbwNiZjEEcG9zAzEEdnRpZAMEc2VjA3BhZ2luYXRpb24-')
+SCRAPER_SEARCH_PAGE_SIZE = 10  # `pz` results per search page
+SCRAPER_SEARCH_WINDOW = 5  # Search result pages fetched concurrently
+SCRAPER_SEARCH_MAX_PAGES = 100  # Upper bound on search result pages per keyword
+SCRAPER_WP_POSTS_URL = 'https://techcrunch.com/wp-json/wp/v2/posts'  # Resolves search hits by slug
+SCRAPER_WP_POSTS_BATCH_SIZE = 50  # Slugs per request; at most 100 (per_page), fewer keeps the URL short
+SCRAPER_PIPELINE_CHUNK_SIZE = 25  # Articles fetched, parsed and saved per Celery task
+SCRAPER_PIPELINE_MAX_RETRIES = 3  # Retries for a chunk's failed downloads before they are given up
+SCRAPER_PIPELINE_RETRY_DELAY = 30  # Seconds before the first retry, doubled for each further one
+SCRAPER_HTTP_CACHE_ENABLED = True
+SCRAPER_HTTP_CACHE_DIR = os.path.join(BASE_DIR, 'http_cache')
+SCRAPER_HTTP_CACHE_TTL = 3600  # Seconds a response is served without revalidation
+SCRAPER_HTTP_CACHE_MAX_BYTES = 512 * 1024 * 1024  # Least recently used bodies are evicted past this
+SCRAPER_EXPORT_CHUNK_SIZE = 2000  # Rows fetched per database round trip while exporting
+# nginx `internal` location that serves MEDIA_ROOT; downloads fall back to Django (sendfile, Range) when unset
+SCRAPER_DOWNLOAD_ACCEL_PREFIX = None if DEBUG else '/protected-media/'
+SCRAPER_FULLTEXT_BATCH_SIZE = 500  # Articles (re)indexed per statement
+SCRAPER_FULLTEXT_LIMIT = 50  # Default number of ranked search results
+SCRAPER_FULLTEXT_CONFIG = 'english'  # Postgres text search configuration
+SCRAPER_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')  # Where --profile writes cProfile/pyinstrument output
+SCRAPER_PROFILE_SLOWEST_URLS = 10  # Slowest articles kept on each ScrapeRun
+SCRAPER_METRICS_PORT = 9540  # Prometheus metrics port opened by each Celery worker; None disables it
+SCRAPER_METRICS_TOKEN = os.environ.get('SCRAPER_METRICS_TOKEN')  # Bearer token that unlocks /scraper/metrics/
+SCRAPER_METRICS_ALLOWED_IPS = ['127.0.0.1/32', '::1/128']  # Networks let into /scraper/metrics/ without the token